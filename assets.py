@@ -0,0 +1,158 @@
+"""Schedules the loading of the browser game's assets by priority, so
+the work needed for the first deal is not held up by anything else.
+
+Each asset is given a loader: a function that is called with a done()
+callback, starts loading, and calls done() when it is finished.  Loaders
+are run in this order:
+
+  CARDS  the card images for the first deal: all started right away.
+  UI     the rest of the page: started on the next tick, once the card
+         image requests are on the wire.
+  IDLE   sounds, the alternate card set, etc.: started when the browser is
+         idle after all the CARDS assets have loaded, or on the user's first
+         click or key press, whichever comes first.
+
+An asset that is disabled (e.g., sounds when the player turned them off) is
+skipped until request() is called for it.
+"""
+
+from browser import document, timer, window
+
+CARDS = 0
+UI = 1
+IDLE = 2
+
+PRIORITY_NAMES = {CARDS: "cards", UI: "ui", IDLE: "idle"}
+
+# Wait at most this long (ms) for the browser to become idle.
+IDLE_TIMEOUT = 2000
+
+
+def now():
+    return window.performance.now()
+
+
+class Asset:
+    """One asset to load, and when it was queued, started and finished."""
+
+    def __init__(self, name, priority, loader, enabled):
+        self.name = name
+        self.priority = priority
+        self.loader = loader
+        self.enabled = enabled
+        self.queued = now()
+        self.started = None
+        self.finished = None
+
+    def timing(self):
+        return {
+            "priority": PRIORITY_NAMES[self.priority],
+            "queued": self.queued,
+            "started": self.started,
+            "finished": self.finished,
+            "duration": None
+            if self.finished is None
+            else self.finished - self.started,
+            "skipped": not self.enabled and self.started is None,
+        }
+
+
+class AssetScheduler:
+    """Runs asset loaders in priority order.  See the module docstring."""
+
+    def __init__(self):
+        self._assets = {}
+        self._started = False
+        self._idleStarted = False
+        self._cardsPending = 0
+        self._firstInteraction = None
+        self._cardsLoadedCallbacks = []
+
+    def add(self, name, priority, loader, enabled=True):
+        """Register an asset.  If the scheduler is already running, an
+        asset whose priority has been reached is started right away."""
+        asset = Asset(name, priority, loader, enabled)
+        self._assets[name] = asset
+        if priority == CARDS and enabled:
+            self._cardsPending += 1
+        if self._started and (priority != IDLE or self._idleStarted):
+            self._run(asset)
+
+    def start(self):
+        self._started = True
+        for asset in self._byPriority(CARDS):
+            self._run(asset)
+        timer.set_timeout(self._startUi, 0)
+        if self._cardsPending == 0:
+            self._cardsDone()
+        # Whatever comes first: idle after the cards, or the first input.
+        document.bind("pointerdown", self._onFirstInteraction)
+        document.bind("keydown", self._onFirstInteraction)
+
+    def request(self, name):
+        """Load the named asset now, even if it was disabled or its turn
+        has not come yet.  Does nothing if it was already started."""
+        asset = self._assets[name]
+        asset.enabled = True
+        self._run(asset)
+
+    def setEnabled(self, name, enabled):
+        self._assets[name].enabled = enabled
+
+    def onCardsLoaded(self, callback):
+        """Call callback() once all the CARDS assets have loaded."""
+        self._cardsLoadedCallbacks.append(callback)
+
+    def timings(self):
+        """Return a dict mapping each asset name to its timing info (all in
+        ms since the page started loading), to see what delays first paint."""
+        res = {}
+        for name, asset in self._assets.items():
+            res[name] = asset.timing()
+        res["_firstInteraction"] = self._firstInteraction
+        return res
+
+    def _byPriority(self, priority):
+        return [a for a in self._assets.values() if a.priority == priority]
+
+    def _run(self, asset):
+        if asset.started is not None or not asset.enabled:
+            return
+        asset.started = now()
+
+        def done(*args):
+            if asset.finished is not None:
+                return
+            asset.finished = now()
+            if asset.priority == CARDS:
+                self._cardsPending -= 1
+                if self._cardsPending == 0:
+                    self._cardsDone()
+
+        asset.loader(done)
+
+    def _startUi(self):
+        for asset in self._byPriority(UI):
+            self._run(asset)
+
+    def _cardsDone(self):
+        for callback in self._cardsLoadedCallbacks:
+            callback()
+        if hasattr(window, "requestIdleCallback"):
+            window.requestIdleCallback(self._startIdle, {"timeout": IDLE_TIMEOUT})
+        else:
+            timer.set_timeout(self._startIdle, 0)
+
+    def _onFirstInteraction(self, ev):
+        if self._firstInteraction is None:
+            self._firstInteraction = now()
+        document.unbind("pointerdown", self._onFirstInteraction)
+        document.unbind("keydown", self._onFirstInteraction)
+        self._startIdle()
+
+    def _startIdle(self, *args):
+        if self._idleStarted:
+            return
+        self._idleStarted = True
+        for asset in self._byPriority(IDLE):
+            self._run(asset)
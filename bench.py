@@ -0,0 +1,251 @@
+'''Benchmarks of the Board operations and of whole games, so a change to
+the engine can be measured against a baseline.
+
+    python bench.py run [--out baseline.json] [--quick]
+
+times each Board operation on the same positions every time (taken from
+seeded games: new deals, boards in the middle of a round and boards at
+the end of a round) and plays whole games with random moves to measure
+games per second.  The results are printed and, with --out, saved as a
+JSON baseline.
+
+    python bench.py compare baseline.json [new.json] [--threshold 10]
+
+compares a baseline with another one (or with a run made now) and exits
+with status 1 if anything is more than threshold percent slower.
+'''
+
+import argparse
+import gc
+import json
+import platform
+import random
+import sys
+import time
+
+from game import *
+from policy import getPolicy, playGame
+
+VERSION = 1
+DEFAULT_THRESHOLD = 10.0
+# Seeds of the games the positions are taken from.
+POSITION_SEEDS = range(20)
+# Positions are taken from the first rounds of each of them.
+ROUNDS_PER_GAME = 3
+# Seeds of the whole games timed.
+GAME_SEEDS = range(30)
+# Each benchmark is timed this many times; the fastest counts.
+REPEAT = 5
+QUICK_REPEAT = 2
+# Each timing makes at least this many calls.
+MIN_CALLS = 2000
+QUICK_MIN_CALLS = 1000
+
+
+def dealtDeck(seed):
+    '''Return the shuffled deck of the first round of the given seed.'''
+    deck = Deck()
+    deck.addAllCards(roundRng(seed, 1))
+    return deck
+
+
+def laidOutBoard(seed):
+    '''Return the board of the given seed with the cards laid out and the
+    aces still on it.'''
+    board = Board()
+    board.layoutCards(dealtDeck(seed))
+    return board
+
+
+def positions(seeds):
+    '''Return (boards in the middle of a round, boards at the end of a
+    round) from games with the given seeds, played with random moves.'''
+    middle = []
+    end = []
+    for seed in seeds:
+        game = Game(seed)
+        rng = random.Random(seed)
+        while not game.isDone() and game.getRoundNum() <= ROUNDS_PER_GAME:
+            if game.isRoundOver():
+                end.append(game.getBoard().copy())
+                game.nextRound()
+                continue
+            moves = game.playableCards()
+            if game.getNumMovesThisRound() % 5 == 2:
+                middle.append(game.getBoard().copy())
+            card, row, col = rng.choice(moves)
+            game.moveCard(card)
+    return middle, end
+
+
+def timeCalls(makeArgs, op, minCalls, repeat):
+    '''Return the fastest time (s) per call of op(*args), over repeat
+    timings of at least minCalls calls each.  makeArgs() returns a list of
+    argument tuples; it is called before each timing, outside of it, so
+    ops that change their arguments get fresh ones.  As with timeit, the
+    garbage collector is off while timing.'''
+    best = None
+    for _ in range(repeat):
+        calls = []
+        while len(calls) < minCalls:
+            calls.extend(makeArgs())
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            for args in calls:
+                op(*args)
+            elapsed = (time.perf_counter() - start) / len(calls)
+        finally:
+            gc.enable()
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def boardBenchmarks(seeds):
+    '''Return a list of (name, makeArgs, op) for the Board operations.'''
+    middle, end = positions(seeds)
+    fullBoards = [laidOutBoard(seed) for seed in seeds]
+    moves = [(board, card) for board in middle
+             for card, row, col in board.findPlayableCards()]
+
+    def layoutArgs():
+        return [(Board(), dealtDeck(seed)) for seed in seeds]
+
+    def removeAcesArgs():
+        return [(board.copy(),) for board in fullBoards]
+
+    def resetArgs():
+        return [(board.copy(), random.Random(0)) for board in end]
+
+    return [
+        ("layoutCards", layoutArgs, Board.layoutCards),
+        ("removeAces", removeAcesArgs, Board.removeAces),
+        ("findPlayableCards", lambda: [(board,) for board in middle],
+         Board.findPlayableCards),
+        ("getMoveableCardDest", lambda: moves, Board.getMoveableCardDest),
+        ("countCardsInPlace", lambda: [(board,) for board in middle + end],
+         Board.countCardsInPlace),
+        ("removeIncorrectCards", lambda: [(board.copy(),) for board in end],
+         Board.removeIncorrectCards),
+        ("resetBoard", resetArgs, Board.resetBoard),
+    ]
+
+
+def timeGames(seeds, repeat):
+    '''Return (the fastest time (s) per game of playing the games with
+    the given seeds with random moves, the number of moves per game).'''
+    policy = getPolicy("random")
+    best = None
+    for _ in range(repeat):
+        numMoves = 0
+        start = time.perf_counter()
+        for seed in seeds:
+            game = Game(seed)
+            playGame(game, policy, random.Random(seed))
+            numMoves += game.getNumMoves()
+        elapsed = (time.perf_counter() - start) / len(seeds)
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, numMoves / len(seeds)
+
+
+def run(quick=False, log=None):
+    '''Run the benchmarks and return the results as a dict, printing each
+    one to log as it finishes.'''
+    repeat = QUICK_REPEAT if quick else REPEAT
+    minCalls = QUICK_MIN_CALLS if quick else MIN_CALLS
+    results = {}
+    for name, makeArgs, op in boardBenchmarks(POSITION_SEEDS):
+        perCall = timeCalls(makeArgs, op, minCalls, repeat)
+        results[name] = {'usPerCall': round(perCall * 1e6, 3)}
+        if log is not None:
+            print("%-22s %10.2f us" % (name, perCall * 1e6), file=log)
+    perGame, movesPerGame = timeGames(GAME_SEEDS, repeat)
+    results['game'] = {'usPerCall': round(perGame * 1e6, 3),
+                       'gamesPerSec': round(1 / perGame, 1),
+                       'movesPerGame': round(movesPerGame, 1)}
+    if log is not None:
+        print("%-22s %10.2f us  (%.1f games/s)" %
+              ('game', perGame * 1e6, 1 / perGame), file=log)
+    return {
+        'version': VERSION,
+        'created': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'quick': quick,
+        'results': results,
+    }
+
+
+def loadBaseline(path):
+    with open(path) as f:
+        baseline = json.load(f)
+    if not isinstance(baseline, dict) or baseline.get('version') != VERSION:
+        raise ValueError("%s is not a benchmark baseline" % path)
+    return baseline
+
+
+def compare(old, new, threshold=DEFAULT_THRESHOLD, out=sys.stdout):
+    '''Print how each benchmark changed from the old results to the new.
+    Return the names of those more than threshold percent slower.'''
+    regressions = []
+    print("%-22s %12s %12s %8s" % ("benchmark", "old us", "new us", "change"),
+          file=out)
+    for name, res in new['results'].items():
+        if name not in old['results']:
+            print("%-22s %12s %12.2f" % (name, "-", res['usPerCall']), file=out)
+            continue
+        before = old['results'][name]['usPerCall']
+        after = res['usPerCall']
+        change = (after - before) / before * 100
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  SLOWER"
+        print("%-22s %12.2f %12.2f %+7.1f%%%s" %
+              (name, before, after, change, flag), file=out)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the game engine.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    runCmd = commands.add_parser("run", help="run the benchmarks")
+    runCmd.add_argument("--out", help="save the results to this JSON file")
+    runCmd.add_argument("--quick", action="store_true",
+                        help="fewer, shorter timings (noisier)")
+    compareCmd = commands.add_parser("compare", help="compare with a baseline")
+    compareCmd.add_argument("baseline")
+    compareCmd.add_argument("new", nargs="?",
+                            help="results to compare (default: run now)")
+    compareCmd.add_argument("--threshold", type=float,
+                            default=DEFAULT_THRESHOLD,
+                            help="percent slower that is a regression "
+                            "(default: %(default)s)")
+    compareCmd.add_argument("--quick", action="store_true")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        results = run(args.quick, sys.stdout)
+        if args.out:
+            with open(args.out, "w") as f:
+                json.dump(results, f, indent=1)
+                f.write("\n")
+        return
+
+    try:
+        old = loadBaseline(args.baseline)
+        if args.new:
+            new = loadBaseline(args.new)
+        else:
+            new = run(args.quick, sys.stderr)
+    except (OSError, ValueError) as e:
+        sys.exit(e)
+    regressions = compare(old, new, args.threshold)
+    if regressions:
+        sys.exit("slower than the baseline: %s" % ", ".join(regressions))
+
+
+if __name__ == "__main__":
+    main()
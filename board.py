@@ -2,6 +2,8 @@
 Date: Nov. 25, 2016
 '''
 
+import random
+
 from card import *
 
 DEBUG = False
@@ -27,14 +29,16 @@ class Board:
         self._board = grid
 
     def __str__(self):
-        res = ''
-        for row in range(self.NUM_ROWS):
-            for col in range(self.NUM_COLS):
-                if self._board[row][col] is None:
-                    res += "    "
-                else:
-                    res += str(self._board[row][col]) + " "
-            res += "\n"
+        lines = []
+        for row in self._board:
+            lines.append(''.join("    " if card is None else str(card) + " "
+                                 for card in row))
+        return "\n".join(lines) + "\n"
+
+    def copy(self):
+        '''Return a new Board with the same cards in the same places.'''
+        res = Board()
+        res._board = [list(row) for row in self._board]
         return res
 
     def reinit(self):
@@ -45,6 +49,9 @@ class Board:
     def getCardAt(self, row, col):
         return self._board[row][col]
 
+    def setCardAt(self, row, col, card):
+        self._board[row][col] = card
+
     def getAllCards(self):
         '''Return a list of all cards on the board.'''
         res = []
@@ -239,11 +246,11 @@ class Board:
                   ', '.join([str(card) for card, row, col in res2]))
         return res2
 
-    def resetBoard(self):
+    def resetBoard(self, rng=random):
         '''After there are no more moves (all blanks are to the right
         of Kings), then clear all cards that arent in the correct
-        place.  Put them back in the deck, add the aces back, shuffle,
-        lay them out, and remove the aces.
+        place.  Put them back in the deck, add the aces back, shuffle
+        (with rng, see Deck.shuffle()), lay them out, and remove the aces.
         Used only for the text-based version of the game.'''
 
         discarded = self.removeIncorrectCards()
@@ -253,7 +260,7 @@ class Board:
         deck.addCard(Card(14, 'H'))
         deck.addCard(Card(14, 'S'))
         deck.addCard(Card(14, 'C'))
-        deck.shuffle()
+        deck.shuffle(rng)
         self.layoutCards(deck)
         self.removeAces()
 
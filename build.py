@@ -0,0 +1,450 @@
+'''Build steps for the browser version of the game.
+
+Usage:
+    python build.py sprite      pack the sound effects into one audio sprite
+    python build.py bundle      build the deployable site in dist/, with the
+                                Python modules in one cached bundle, every
+                                asset named by its content hash, and a
+                                service worker that precaches them all
+'''
+
+import argparse
+import ast
+import hashlib
+import json
+import os
+import re
+import shutil
+import struct
+import subprocess
+import sys
+from array import array
+
+# The sound effects used by the browser game, in the order they are packed
+# into the sprite.  The name is what sound.SoundBoard.play() is called with.
+SOUNDS = [
+    ("move", "snap3.wav"),
+    ("inplace", "inplace.wav"),
+    ("endofround", "lose.wav"),
+    ("fanfare", "fanfare.wav"),
+]
+
+SPRITE_DIR = "sounds"
+SPRITE_RATE = 22050
+# Silence between sounds, so a sound never bleeds into the next one.
+SPRITE_GAP = 0.1
+
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_IEEE_FLOAT = 3
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+def readWav(filename):
+    '''Read a WAV file and return (samples, rate), where samples is a list
+    of floats in -1.0 .. 1.0, with all channels mixed down to mono.
+    Handles 16 and 24 bit PCM and 32 bit float files, which the wave module
+    in the standard library cannot all read.'''
+    with open(filename, "rb") as f:
+        data = f.read()
+    if data[0:4] != b"RIFF" or data[8:12] != b"WAVE":
+        raise ValueError(filename + " is not a WAV file")
+
+    fmt = None
+    frames = None
+    pos = 12
+    while pos + 8 <= len(data):
+        chunkId = data[pos:pos + 4]
+        size = struct.unpack("<I", data[pos + 4:pos + 8])[0]
+        body = data[pos + 8:pos + 8 + size]
+        if chunkId == b"fmt ":
+            fmt = struct.unpack("<HHIIHH", body[0:16])
+            if fmt[0] == WAVE_FORMAT_EXTENSIBLE:
+                # The real format is the first 2 bytes of the subformat GUID.
+                subFormat = struct.unpack("<H", body[24:26])[0]
+                fmt = (subFormat,) + fmt[1:]
+        elif chunkId == b"data":
+            frames = body
+        # chunks are padded to an even length.
+        pos += 8 + size + (size & 1)
+    if fmt is None or frames is None:
+        raise ValueError(filename + " has no fmt or data chunk")
+
+    audioFormat, channels, rate, _, _, bits = fmt
+    if audioFormat == WAVE_FORMAT_IEEE_FLOAT and bits == 32:
+        values = array("f", frames[:len(frames) - len(frames) % 4])
+        scale = 1.0
+    elif audioFormat == WAVE_FORMAT_PCM and bits == 16:
+        values = array("h", frames[:len(frames) - len(frames) % 2])
+        scale = 32768.0
+    elif audioFormat == WAVE_FORMAT_PCM and bits == 24:
+        # No array type for 3 byte ints: widen each one to 4 bytes.
+        values = array("i")
+        for i in range(0, len(frames) - 2, 3):
+            values.append(int.from_bytes(frames[i:i + 3], "little", signed=True))
+        scale = 8388608.0
+    else:
+        raise ValueError("%s: unsupported WAV format %d with %d bits" %
+                         (filename, audioFormat, bits))
+    if sys.byteorder == "big" and values.itemsize > 1 and bits != 24:
+        values.byteswap()
+
+    samples = []
+    for i in range(0, len(values) - channels + 1, channels):
+        total = 0.0
+        for c in range(channels):
+            total += values[i + c]
+        samples.append(total / channels / scale)
+    return samples, rate
+
+
+def resample(samples, fromRate, toRate):
+    '''Resample samples from fromRate to toRate by linear interpolation.'''
+    if fromRate == toRate or not samples:
+        return list(samples)
+    step = fromRate / toRate
+    last = len(samples) - 1
+    res = []
+    pos = 0.0
+    while pos <= last:
+        i = int(pos)
+        frac = pos - i
+        nxt = samples[i + 1] if i < last else samples[i]
+        res.append(samples[i] + (nxt - samples[i]) * frac)
+        pos += step
+    return res
+
+
+def writeWav(filename, samples, rate):
+    '''Write mono float samples out as a 16 bit PCM WAV file.'''
+    pcm = array("h", (int(max(-1.0, min(1.0, s)) * 32767) for s in samples))
+    if sys.byteorder == "big":
+        pcm.byteswap()
+    frames = pcm.tobytes()
+    with open(filename, "wb") as f:
+        f.write(b"RIFF" + struct.pack("<I", 36 + len(frames)) + b"WAVE")
+        f.write(b"fmt " + struct.pack("<IHHIIHH", 16, WAVE_FORMAT_PCM, 1,
+                                      rate, rate * 2, 2, 16))
+        f.write(b"data" + struct.pack("<I", len(frames)))
+        f.write(frames)
+
+
+def buildSprite(args):
+    '''Pack all the sound effects into sounds/sprite.wav, one after another,
+    and write sounds/sprite.json giving where each one starts and how long
+    it lasts, in seconds.  With --encode, also compress the sprite with
+    ffmpeg (e.g., to .m4a or .ogg) and list that file in the map before
+    the WAV, which browsers that cannot decode it fall back to.'''
+    os.makedirs(args.outdir, exist_ok=True)
+    gap = [0.0] * int(SPRITE_GAP * args.rate)
+    sprite = []
+    sprites = {}
+    for name, filename in SOUNDS:
+        samples, rate = readWav(filename)
+        samples = resample(samples, rate, args.rate)
+        sprites[name] = [round(len(sprite) / args.rate, 4),
+                         round(len(samples) / args.rate, 4)]
+        sprite.extend(samples)
+        sprite.extend(gap)
+
+    wavName = "sprite.wav"
+    writeWav(os.path.join(args.outdir, wavName), sprite, args.rate)
+    srcs = [wavName]
+    if args.encode:
+        if shutil.which("ffmpeg") is None:
+            sys.exit("--encode needs ffmpeg on the PATH")
+        encName = "sprite." + args.encode
+        cmd = "ffmpeg -y -loglevel error -i %s %s" % (
+            os.path.join(args.outdir, wavName), os.path.join(args.outdir, encName))
+        subprocess.run(cmd.split(), check=True)
+        srcs.insert(0, encName)
+
+    with open(os.path.join(args.outdir, "sprite.json"), "w") as f:
+        json.dump({"src": srcs, "sprites": sprites}, f)
+        f.write("\n")
+    for src in srcs:
+        print("wrote %s (%d bytes, %.1f seconds of sound)" %
+              (os.path.join(args.outdir, src),
+               os.path.getsize(os.path.join(args.outdir, src)),
+               len(sprite) / args.rate))
+
+
+# ---------------------------------------------------------------- bundle
+
+# Must match the brython.min.js that index.html loads from the CDN.
+BRYTHON_VERSION = "3.9.1"
+SITE_DIR = "dist"
+# The module index.html imports.
+ENTRY_MODULE = "main"
+# Files the pages and modules load.  Each one is renamed with its content
+# hash.
+HASHED_FILES = ["style.css", "favicon.ico", "hintweights.json"]
+# Directories the modules load files from (with the card images ones found
+# from main.CARD_SOURCES).  Each one is renamed with the hash of everything
+# in it, since the modules build the file names inside it.
+HASHED_DIRS = [SPRITE_DIR + "/"]
+# Pages: these keep their names.
+PAGES = ["index.html", "instructions.html"]
+SERVICE_WORKER = "sw.js"
+MANIFEST = "precache-manifest.json"
+
+STDLIB_SCRIPT = re.compile(r'<script[^>]*src="[^"]*/brython_stdlib\.js"[^>]*>\s*</script>')
+EXTERNAL_SCRIPT = re.compile(r'<script[^>]*src="(https?://[^"]+)"')
+REGISTER_SERVICE_WORKER = """  <script>
+    if ("serviceWorker" in navigator) {
+      navigator.serviceWorker.register("%s");
+    }
+  </script>
+</body>""" % SERVICE_WORKER
+
+
+def _imports(tree, package=""):
+    '''Return the names of the modules imported at the top level of the
+    module with the given ast (imports inside functions and classes are
+    only done if needed, so they are left out).  For "from a import b",
+    both a and a.b are returned, since b may be a submodule.'''
+    res = []
+    todo = list(tree.body)
+    while todo:
+        node = todo.pop()
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            continue
+        if isinstance(node, ast.Import):
+            res.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            module = node.module or ""
+            if node.level:
+                parts = package.split(".")[:len(package.split(".")) - node.level + 1]
+                module = ".".join([p for p in parts if p] + ([module] if module else []))
+            res.append(module)
+            res.extend(module + "." + alias.name for alias in node.names)
+        else:
+            # if/try/with at the top level still run on import.
+            for field in ("body", "orelse", "finalbody", "handlers"):
+                todo.extend(getattr(node, field, None) or [])
+    return res
+
+
+def browserModules(entry=ENTRY_MODULE):
+    '''Return the names of the modules in this directory that the browser
+    imports, starting from the entry module and following its imports.'''
+    found = []
+    todo = [entry]
+    while todo:
+        name = todo.pop()
+        if name in found or not os.path.exists(name + ".py"):
+            continue
+        found.append(name)
+        with open(name + ".py") as f:
+            todo.extend(_imports(ast.parse(f.read())))
+    return sorted(found)
+
+
+def moduleConstant(module, name):
+    '''Return the literal value assigned to name at the top level of the
+    given module, without importing it (main.py only runs in a browser).'''
+    with open(module + ".py") as f:
+        tree = ast.parse(f.read())
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and \
+                any(isinstance(t, ast.Name) and t.id == name for t in node.targets):
+            return ast.literal_eval(node.value)
+    raise KeyError("%s.%s not found" % (module, name))
+
+
+def contentHash(data):
+    '''A short hash of data (bytes), for cache-busting file names.'''
+    return hashlib.sha256(data).hexdigest()[:12]
+
+
+def hashedName(path, data):
+    '''foo/bar.js -> foo/bar.<hash of data>.js'''
+    base, ext = os.path.splitext(path)
+    return "%s.%s%s" % (base, contentHash(data), ext)
+
+
+def treeFiles(path):
+    '''Return the paths of all the files under the directory path, sorted.'''
+    res = []
+    for dirname, dirnames, filenames in os.walk(path):
+        for filename in filenames:
+            res.append(os.path.join(dirname, filename))
+    return sorted(res)
+
+
+def treeHash(path):
+    '''Hash the names and contents of all the files under path.'''
+    h = hashlib.sha256()
+    for filename in treeFiles(path):
+        h.update(os.path.relpath(filename, path).encode() + b"\0")
+        with open(filename, "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()[:12]
+
+
+def rewriteReferences(text, renames, used):
+    '''Replace each quoted path in text that is a key of renames with its
+    new name, and add the paths that were found to the set used.'''
+    for old, new in renames.items():
+        for quote in "\"'":
+            if quote + old + quote in text:
+                text = text.replace(quote + old + quote, quote + new + quote)
+                used.add(old)
+    return text
+
+
+def loadBrythonStdlib(path=None):
+    '''Return Brython's standard library as a dict mapping module name to
+    [ext, source, imports] (plus a 4th item for packages), as stored in
+    brython_stdlib.js.  By default it is taken from the brython package.'''
+    if path is None:
+        try:
+            import brython
+        except ImportError:
+            sys.exit("bundle needs brython: pip install brython==" + BRYTHON_VERSION)
+        path = os.path.join(os.path.dirname(brython.__file__), "data", "brython_stdlib.js")
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    stdlib = json.loads(text[text.index("{"):text.index("__BRYTHON__.update_VFS(")])
+    stdlib.pop("$timestamp", None)
+    return stdlib
+
+
+def makeModulesBundle(modules, stdlib):
+    '''Return the contents of a Brython VFS file (the format of
+    brython_modules.js) holding the given app modules (a dict mapping each
+    module name to its source) plus only the parts of Brython's standard
+    library they import, directly or not.'''
+    vfs = {}
+    todo = []
+    for name, src in modules.items():
+        imports = _imports(ast.parse(src))
+        vfs[name] = [".py", src,
+                     sorted(set(m for m in imports if m in stdlib or m in modules))]
+        todo.extend(imports)
+
+    while todo:
+        name = todo.pop()
+        if name in vfs or name not in stdlib:
+            # Not in the stdlib: built into brython.js, or just a name
+            # imported from a module.
+            continue
+        entry = stdlib[name]
+        vfs[name] = entry
+        parent = name.rpartition(".")[0]
+        if parent:
+            todo.append(parent)
+        if entry[0] == ".py":
+            package = name if len(entry) == 4 else parent
+            imports = _imports(ast.parse(entry[1]), package)
+            entry[2] = sorted(set(m for m in imports if m in stdlib))
+            todo.extend(imports)
+
+    scripts = json.dumps(vfs, sort_keys=True)
+    # Brython refreshes its indexedDB cache of compiled modules when this
+    # changes, so tie it to the content instead of the build time.
+    timestamp = int(contentHash(scripts.encode()), 16)
+    return ("__BRYTHON__.VFS_timestamp = %d\n__BRYTHON__.use_VFS = true\n"
+            "var scripts = %s\n__BRYTHON__.update_VFS(scripts)\n" %
+            (timestamp, scripts)).encode("utf-8")
+
+
+def buildBundle(args):
+    '''Build the deployable site in dist/.
+
+    index.html loads one bundle in place of the whole brython_stdlib.js;
+    Brython then finds all the app modules in the bundle instead of fetching
+    each .py file.  Brython keeps the compiled form of the bundled modules in
+    indexedDB, so they are only transpiled on a browser's first visit.
+
+    Every asset other than the pages is renamed with its content hash, and
+    the references to it in the pages and modules are rewritten, so that
+    they can all be cached forever.  dist/sw.js is a service worker that
+    precaches all of it (the list is also in precache-manifest.json).'''
+    if os.path.exists(args.outdir):
+        shutil.rmtree(args.outdir)
+    os.makedirs(args.outdir)
+
+    # path as referenced -> hashed path
+    renames = {}
+    for path in HASHED_FILES:
+        with open(path, "rb") as f:
+            data = f.read()
+        renames[path] = hashedName(path, data)
+        with open(os.path.join(args.outdir, renames[path]), "wb") as f:
+            f.write(data)
+    for path in HASHED_DIRS + moduleConstant(ENTRY_MODULE, "CARD_SOURCES"):
+        src = path.rstrip("/")
+        dest = "%s.%s" % (src, treeHash(src))
+        shutil.copytree(src, os.path.join(args.outdir, dest))
+        renames[path] = dest + "/"
+
+    used = set()
+    modules = {}
+    for name in browserModules():
+        with open(name + ".py") as f:
+            modules[name] = rewriteReferences(f.read(), renames, used)
+    bundle = makeModulesBundle(modules, loadBrythonStdlib(args.stdlib))
+    bundleName = hashedName("brython_modules.js", bundle)
+    with open(os.path.join(args.outdir, bundleName), "wb") as f:
+        f.write(bundle)
+
+    pages = {}
+    for path in PAGES:
+        with open(path) as f:
+            pages[path] = rewriteReferences(f.read(), renames, used)
+    tag = '<script type="text/javascript" src="%s"></script>' % bundleName
+    index, count = STDLIB_SCRIPT.subn(tag, pages["index.html"])
+    if count != 1:
+        sys.exit("could not find the brython_stdlib.js script tag in index.html")
+    pages["index.html"] = index.replace("</body>", REGISTER_SERVICE_WORKER)
+    for path, text in pages.items():
+        with open(os.path.join(args.outdir, path), "w") as f:
+            f.write(text)
+    for path in sorted(set(renames) - used):
+        print("warning: nothing refers to", path)
+
+    # Everything the site loads: the pages, all that was written to outdir,
+    # and the scripts index.html loads from CDNs.
+    urls = ["./"]
+    for filename in treeFiles(args.outdir):
+        urls.append(os.path.relpath(filename, args.outdir).replace(os.sep, "/"))
+    urls.extend(EXTERNAL_SCRIPT.findall(index))
+    manifest = {"urls": urls}
+    manifest["version"] = contentHash(json.dumps(manifest).encode() + index.encode())
+    with open(os.path.join(args.outdir, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=1)
+    with open(SERVICE_WORKER) as f:
+        worker = f.read().replace("__PRECACHE_MANIFEST__", json.dumps(manifest))
+    with open(os.path.join(args.outdir, SERVICE_WORKER), "w") as f:
+        f.write(worker)
+
+    print("wrote %s: %s (%d KB) with modules %s; %d files to precache" %
+          (args.outdir, bundleName, len(bundle) // 1024, ", ".join(modules),
+           len(urls)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build steps for the browser game.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    sprite = subparsers.add_parser("sprite", help="pack the sounds into one audio sprite")
+    sprite.add_argument("--outdir", default=SPRITE_DIR)
+    sprite.add_argument("--rate", type=int, default=SPRITE_RATE,
+                        help="sample rate of the sprite (default %(default)s)")
+    sprite.add_argument("--encode", metavar="EXT",
+                        help="also compress the sprite with ffmpeg, e.g. m4a")
+    sprite.set_defaults(func=buildSprite)
+
+    bundle = subparsers.add_parser("bundle", help="build the site with one module bundle")
+    bundle.add_argument("--outdir", default=SITE_DIR)
+    bundle.add_argument("--stdlib", metavar="PATH",
+                        help="brython_stdlib.js to take the standard library from "
+                        "(default: the one in the brython package)")
+    bundle.set_defaults(func=buildBundle)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -47,6 +47,11 @@ class Card:
     def getSuit(self):
         return self._suit
 
+    def getOrdinal(self):
+        '''Return a number from 0 to 51 that identifies the card, in
+        the order 2C 2H 2D 2S 3C ... AS.'''
+        return (self._num - 2) * len(Deck.SUITS) + Deck.SUITS.index(self._suit)
+
     def getPoints(self):
         return self._points
 
@@ -69,6 +74,12 @@ class Card:
         return "%3s" % (res + self._suit)
 
 
+def cardFromOrdinal(ordinal):
+    '''Create the card with the given ordinal (see Card.getOrdinal()).'''
+    numIdx, suitIdx = divmod(ordinal, len(Deck.SUITS))
+    return Card(Deck.NUMS[numIdx], Deck.SUITS[suitIdx])
+
+
 class Deck:
     '''Deck class: contains a list of card objects.'''
 
@@ -92,17 +103,19 @@ class Deck:
     def addCards(self, cards):
         self._deck.extend(cards)
 
-    def shuffle(self):
-        random.shuffle(self._deck)
+    def shuffle(self, rng=random):
+        '''Shuffle the deck, using the given random.Random (or the random
+        module) so that a seeded game always deals the same way.'''
+        rng.shuffle(self._deck)
 
-    def addAllCards(self):
+    def addAllCards(self, rng=random):
         '''Create all card for a deck and shuffle the deck.
         '''
         for numIdx in range(len(self.NUMS)):
             for suitIdx in range(len(self.SUITS)):
                 card = Card(self.NUMS[numIdx], self.SUITS[suitIdx])
                 self.addCard(card)
-        self.shuffle()
+        self.shuffle(rng)
 
     def takeTopCard(self):
         return self._deck.pop(0)
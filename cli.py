@@ -1,52 +1,175 @@
 '''Play a text-only solitaire game.
 Author: Victor Norman.
+
+With no arguments, play a game interactively.  With --batch, play games
+from a file of move lists without printing any boards, e.g., for
+regression and throughput tests.  Each line of the file is a seed followed
+by the cards to move, in order:
+
+    12345 2H 3H 10S 2C
+
+A new round is started whenever there are no more moves and there are
+cards left to move.  The result of each game is written as one line of
+JSON.  Add --watch to see the games being played instead, and --record
+to save them in a game log (see gamelog.py).
 '''
 
-from card import *
-from board import *
+import argparse
+import json
+import sys
+import time
+
+from game import *
+from gamelog import *
+from termrender import *
+
+
+def playInteractive(seed=None):
+    game = Game(seed)
+    print("Game %d\n" % game.getSeed())
+
+    while not game.isDone():
+        # This is a while because after reset
+        # we may have put all aces after kings again.
+        while game.isRoundOver():
+            print(game.getBoard())
+            print("No more moves!")
+            game.nextRound()
+            print("Starting round %d with %d cards in place" %
+                  (game.getRoundNum(), game.countCardsInPlace()))
+
+        print(game.getBoard())
+        print("You have %d cards in place, for a score of %d" %
+              (game.countCardsInPlace(), game.currentScore()))
+        try:
+            src = input("Enter card to move: ")
+        except EOFError:
+            print()
+            return
+        # src could be 3H or 10S, etc.
+        card = game.findCard(src)
+        if card is None:
+            print("Cannot find that card in the board")
+            continue
+        if game.moveCard(card) is None:
+            print("Cannot move that card")
+
+    print(game.getBoard())
+    print("You won in %d rounds, with a score of %d!" %
+          (game.getRoundNum(), game.currentScore()))
 
-d = Deck()
-d.addAllCards()
 
-bd = Board()
+def playMoves(seed, moves, renderer=None, recorder=None):
+    '''Play the game with the given seed, moving the cards with the given
+    names in order, and drawing the board after each move if a
+    TermRenderer is given.  Return the game's result(), with the number
+    of moves that could not be made.'''
+    game = Game(seed, recorder)
+    illegal = 0
+    for name in moves:
+        if game.isDone():
+            illegal += 1
+            continue
+        while game.isRoundOver():
+            game.nextRound()
+        card = game.findCard(name)
+        if card is None or game.moveCard(card) is None:
+            illegal += 1
+        elif renderer is not None:
+            renderer.draw(game.getBoard(), status="Game %d  round %d  move %d"
+                          % (seed, game.getRoundNum(), game.getNumMoves()))
+    # Deal the round after the last move too: it may finish the game.
+    while game.isRoundOver():
+        game.nextRound()
+    res = game.result()
+    if renderer is not None:
+        renderer.draw(game.getBoard(), status="Game %d  round %d  score %d"
+                      % (seed, game.getRoundNum(), game.currentScore()))
+        renderer.flush()
+    res['illegalMoves'] = illegal
+    return res
 
-bd.layoutCards(d)
-print(bd)
 
-print("\nRemoving Aces...\n")
-bd.removeAces()
+def readMoveLists(f):
+    '''Yield (seed, moves) for each line of the given file.  Blank lines
+    and lines starting with # are skipped.'''
+    for lineNum, line in enumerate(f, 1):
+        words = line.split()
+        if not words or words[0].startswith('#'):
+            continue
+        try:
+            seed = int(words[0])
+        except ValueError:
+            raise ValueError("line %d: bad seed %r" % (lineNum, words[0]))
+        yield seed, words[1:]
 
-round = 1
 
-while True:
-    print(bd)
-    print("You have %d cards in place" % bd.countCardsInPlace())
-    src = input("Enter card to move: ").strip().upper()
-    # src could be 3H or 10S, etc.  In any case,
-    # the last letter is the suit and the first letter or
-    # letters are the number.
-    # findCard() returns a 3-ple: (card, row, col)
-    #    or None if it isn't found.
-    res = bd.findCard(src[0:-1], src[-1])
-    if res is None:
-        print("Cannot find that card in the board")
-        continue
+def playBatch(inFile, outFile, renderer=None, logWriter=None):
+    '''Play every game in inFile, writing the results to outFile, and
+    the games to the GameLogWriter if one is given.  Return the number of
+    games played.'''
+    recorder = GameRecorder() if logWriter is not None else None
+    numGames = 0
+    for seed, moves in readMoveLists(inFile):
+        res = playMoves(seed, moves, renderer, recorder)
+        outFile.write(json.dumps(res) + "\n")
+        if logWriter is not None:
+            logWriter.write(recorder.getRecord())
+        numGames += 1
+    return numGames
 
-    if bd.gameCompletelyDone():
-        break
 
-    # This is a while because after reset
-    # we may have put all aces after kings again.
-    while not bd.moreMoves():
-        print("No more moves!")
-        print(bd)
-        bd.resetBoard()
-        round += 1
-        print("Starting round %d with %d cards in place" % (round, bd.countCardsInPlace()))
+def main():
+    parser = argparse.ArgumentParser(description="Play Frustration Solitaire "
+                                     "in a terminal.")
+    parser.add_argument("--seed", type=int,
+                        help="seed of the game to play interactively")
+    parser.add_argument("--batch", metavar="FILE",
+                        help="play the move lists in FILE ('-' for stdin)")
+    parser.add_argument("--out", metavar="FILE",
+                        help="write the results to FILE instead of stdout")
+    parser.add_argument("--watch", action="store_true",
+                        help="draw the board in the terminal as the games "
+                        "are played (use with --out)")
+    parser.add_argument("--fps", type=float, default=30,
+                        help="most frames per second to draw with --watch "
+                        "(default: 30; 0 to draw every move)")
+    parser.add_argument("--record", metavar="FILE",
+                        help="save the games in a game log")
+    parser.add_argument("--stats", action="store_true",
+                        help="print the number of games per second to "
+                        "stderr")
+    args = parser.parse_args()
 
-print(bd)
-print("You won in %d rounds!" % round)
+    if args.batch is None:
+        playInteractive(args.seed)
+        return
 
-    
+    inFile = sys.stdin if args.batch == '-' else open(args.batch)
+    outFile = sys.stdout if args.out is None else open(args.out, "w")
+    renderer = TermRenderer(fps=args.fps) if args.watch else None
+    logFile = None if args.record is None else open(args.record, "wb")
+    logWriter = None if logFile is None else GameLogWriter(logFile)
+    start = time.perf_counter()
+    try:
+        numGames = playBatch(inFile, outFile, renderer, logWriter)
+    except ValueError as e:
+        sys.exit("%s: %s" % (args.batch, e))
+    finally:
+        if renderer is not None:
+            renderer.close()
+        if inFile is not sys.stdin:
+            inFile.close()
+        if outFile is not sys.stdout:
+            outFile.close()
+        if logFile is not None:
+            logFile.close()
+    elapsed = time.perf_counter() - start
+    if args.stats:
+        print("%d games in %.2f s (%.1f games/s)" %
+              (numGames, elapsed, numGames / elapsed if elapsed else 0),
+              file=sys.stderr)
 
 
+if __name__ == "__main__":
+    main()
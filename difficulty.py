@@ -0,0 +1,269 @@
+'''Rating deals ahead of time, so a game of a given difficulty (or the
+daily deal) can be picked by seed without simulating anything.
+
+    python difficulty.py build --seeds 0:100000 [--runs 8] [--out deals.bin]
+
+plays every seed in the range several times, with random moves or
+another policy (see policy.py), and records, for each seed, the mean
+number of rounds, the mean score and the mean number of cards in place at
+the end of the first round.  The seeds
+are then split into NUM_BUCKETS buckets of equal size by mean score:
+easy, medium and hard.
+
+The table is a file with fixed-width records, read through mmap, so
+looking up a seed or picking one from a bucket reads a few bytes of it
+and never loads the whole file:
+
+  header   HEADER: magic, first seed, number of seeds, runs per seed,
+           number of buckets
+  buckets  BUCKET for each bucket, easiest first: the lowest mean score
+           in it, and the offset and count of its seed list
+  records  RECORD for each seed, in seed order: mean rounds * 100,
+           mean score * 10, mean first-round cards in place * 10, bucket
+  seeds    for each bucket, its seeds, as SEED
+
+    python difficulty.py pick deals.bin easy|medium|hard|daily
+'''
+
+import argparse
+import datetime
+import hashlib
+import mmap
+import multiprocessing
+import random
+import struct
+import sys
+import time
+
+from game import *
+from policy import BoardView, getPolicy, MAX_ROUNDS
+
+MAGIC = b"FSDIFF2\n"
+HEADER = struct.Struct("<8sQIIB3x")
+BUCKET = struct.Struct("<dQI4x")
+# The mean score is signed: cards are worth less than 0 after round 11.
+RECORD = struct.Struct("<HiHB")
+SEED = struct.Struct("<Q")
+
+BUCKET_NAMES = ["easy", "medium", "hard"]
+NUM_BUCKETS = len(BUCKET_NAMES)
+
+DEFAULT_RUNS = 8
+DEFAULT_POLICY = "random"
+DEFAULT_TABLE = "deals.bin"
+# Seeds rated by each task given to the worker processes.
+CHUNK_SIZE = 100
+
+
+def playRated(game, policy, rng):
+    '''Play the game to the end with the given policy.  Return the number
+    of cards in place at the end of the first round.'''
+    view = BoardView(game.getBoard())
+    firstRoundPlaced = None
+    while not game.isDone() and game.getRoundNum() <= MAX_ROUNDS:
+        if game.isRoundOver():
+            if firstRoundPlaced is None:
+                firstRoundPlaced = game.countCardsInPlace()
+            game.nextRound()
+            continue
+        card, row, col = policy.choose(view, game.playableCards(), rng)
+        game.moveCard(card)
+    if firstRoundPlaced is None:
+        firstRoundPlaced = game.countCardsInPlace()
+    return firstRoundPlaced
+
+
+def rateSeed(seed, runs=DEFAULT_RUNS, policy=None):
+    '''Play the deal with the given seed runs times (with random moves by
+    default).  Return (mean rounds, mean score, mean cards in place after
+    the first round).'''
+    if policy is None:
+        policy = getPolicy(DEFAULT_POLICY)
+    rounds = score = placed = 0
+    for run in range(runs):
+        game = Game(seed)
+        placed += playRated(game, policy, random.Random(seed * runs + run))
+        rounds += game.getRoundNum()
+        score += game.currentScore()
+    return rounds / runs, score / runs, placed / runs
+
+
+def _rateChunk(args):
+    firstSeed, numSeeds, runs, policyName = args
+    policy = getPolicy(policyName)
+    return [rateSeed(seed, runs, policy)
+            for seed in range(firstSeed, firstSeed + numSeeds)]
+
+
+def rateSeeds(firstSeed, numSeeds, runs=DEFAULT_RUNS, workers=None,
+              policyName=DEFAULT_POLICY):
+    '''Rate numSeeds seeds from firstSeed, in worker processes.  Return a
+    list of rateSeed() results, in seed order.'''
+    # The workers are sent the policy's name, not the policy.
+    chunks = [(seed, min(CHUNK_SIZE, firstSeed + numSeeds - seed), runs,
+               policyName)
+              for seed in range(firstSeed, firstSeed + numSeeds, CHUNK_SIZE)]
+    with multiprocessing.Pool(workers) as pool:
+        res = []
+        for ratings in pool.imap(_rateChunk, chunks):
+            res.extend(ratings)
+        return res
+
+
+def writeTable(path, firstSeed, runs, ratings):
+    '''Write the table for the ratings of the seeds from firstSeed.'''
+    numSeeds = len(ratings)
+    # Hardest last: sort by mean score, best first.
+    order = sorted(range(numSeeds), key=lambda i: -ratings[i][1])
+    bucketOf = [0] * numSeeds
+    buckets = []
+    offset = HEADER.size + NUM_BUCKETS * BUCKET.size + numSeeds * RECORD.size
+    for b in range(NUM_BUCKETS):
+        members = order[b * numSeeds // NUM_BUCKETS:
+                        (b + 1) * numSeeds // NUM_BUCKETS]
+        for i in members:
+            bucketOf[i] = b
+        lowest = ratings[members[-1]][1] if members else 0.0
+        buckets.append((lowest, offset, members))
+        offset += len(members) * SEED.size
+
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, firstSeed, numSeeds, runs, NUM_BUCKETS))
+        for lowest, offset, members in buckets:
+            f.write(BUCKET.pack(lowest, offset, len(members)))
+        f.write(b''.join(RECORD.pack(round(rounds * 100), round(score * 10),
+                                     round(placed * 10), bucketOf[i])
+                         for i, (rounds, score, placed) in enumerate(ratings)))
+        for lowest, offset, members in buckets:
+            # In seed order, so a bucket's seeds can be searched.
+            f.write(b''.join(SEED.pack(firstSeed + i) for i in sorted(members)))
+
+
+class DifficultyTable:
+    '''A table written by writeTable(), read through mmap.'''
+
+    def __init__(self, path=DEFAULT_TABLE):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.firstSeed, self.numSeeds, self.runs, numBuckets = \
+            HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError("%s is not a difficulty table" % path)
+        self._buckets = [BUCKET.unpack_from(self._map, HEADER.size + b * BUCKET.size)
+                         for b in range(numBuckets)]
+        self._recordsOffset = HEADER.size + numBuckets * BUCKET.size
+
+    def close(self):
+        self._map.close()
+
+    def lookup(self, seed):
+        '''Return the rating of the given seed as a dict, or None if it is
+        not in the table.'''
+        idx = seed - self.firstSeed
+        if not 0 <= idx < self.numSeeds:
+            return None
+        rounds, score, placed, bucket = RECORD.unpack_from(
+            self._map, self._recordsOffset + idx * RECORD.size)
+        return {
+            'seed': seed,
+            'meanRounds': rounds / 100,
+            'meanScore': score / 10,
+            'firstRoundPlaced': placed / 10,
+            'difficulty': BUCKET_NAMES[bucket],
+        }
+
+    def bucketSize(self, difficulty):
+        return self._buckets[BUCKET_NAMES.index(difficulty)][2]
+
+    def seedAt(self, difficulty, idx):
+        '''Return the idx'th seed (in seed order) of the given bucket.'''
+        lowest, offset, count = self._buckets[BUCKET_NAMES.index(difficulty)]
+        if not 0 <= idx < count:
+            raise IndexError("no seed %d in %s" % (idx, difficulty))
+        return SEED.unpack_from(self._map, offset + idx * SEED.size)[0]
+
+    def pick(self, difficulty, rng=random):
+        '''Return a random seed of the given difficulty.  Raise IndexError
+        if there are none.'''
+        count = self.bucketSize(difficulty)
+        if count == 0:
+            raise IndexError("no %s seeds in the table" % difficulty)
+        return self.seedAt(difficulty, rng.randrange(count))
+
+    def daily(self, date=None, difficulty="medium"):
+        '''Return the seed of the daily deal for the given date (default
+        today, UTC): the same for everyone using this table.  Raise
+        IndexError if there are no seeds of the given difficulty.'''
+        if date is None:
+            date = datetime.datetime.now(datetime.timezone.utc).date()
+        count = self.bucketSize(difficulty)
+        if count == 0:
+            raise IndexError("no %s seeds in the table" % difficulty)
+        digest = hashlib.sha256(date.isoformat().encode()).digest()
+        idx = int.from_bytes(digest[:8], "big") % count
+        return self.seedAt(difficulty, idx)
+
+
+def parseSeedRange(s):
+    '''Convert FIRST:END to (first seed, number of seeds).'''
+    first, _, end = s.partition(':')
+    first, end = int(first), int(end)
+    if end <= first:
+        raise argparse.ArgumentTypeError("empty seed range")
+    return first, end - first
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rate deals by difficulty.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    buildCmd = commands.add_parser("build", help="simulate seeds and write "
+                                   "the table")
+    buildCmd.add_argument("--seeds", type=parseSeedRange, default=(0, 10000),
+                          help="FIRST:END (default: 0:10000)")
+    buildCmd.add_argument("--runs", type=int, default=DEFAULT_RUNS,
+                          help="games per seed (default: %(default)s)")
+    buildCmd.add_argument("--policy", default=DEFAULT_POLICY,
+                          help="player to simulate (see policy.py; "
+                          "default: %(default)s)")
+    buildCmd.add_argument("--workers", type=int,
+                          help="processes (default: one per CPU)")
+    buildCmd.add_argument("--out", default=DEFAULT_TABLE)
+    pickCmd = commands.add_parser("pick", help="pick a seed")
+    pickCmd.add_argument("table")
+    pickCmd.add_argument("difficulty", choices=BUCKET_NAMES + ["daily"])
+    lookupCmd = commands.add_parser("lookup", help="print a seed's rating")
+    lookupCmd.add_argument("table")
+    lookupCmd.add_argument("seed", type=int)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        firstSeed, numSeeds = args.seeds
+        start = time.perf_counter()
+        try:
+            getPolicy(args.policy)
+        except ValueError as e:
+            sys.exit(e)
+        ratings = rateSeeds(firstSeed, numSeeds, args.runs, args.workers,
+                            args.policy)
+        writeTable(args.out, firstSeed, args.runs, ratings)
+        print("rated %d seeds in %.1f s" % (numSeeds, time.perf_counter() - start))
+        return
+
+    try:
+        table = DifficultyTable(args.table)
+    except (OSError, ValueError) as e:
+        sys.exit(e)
+    if args.command == "pick":
+        try:
+            seed = table.daily() if args.difficulty == "daily" \
+                else table.pick(args.difficulty)
+        except IndexError as e:
+            sys.exit(e)
+    else:
+        seed = args.seed
+    print(table.lookup(seed))
+    table.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+'''Checks that another board engine behaves exactly like board.Board.
+
+A candidate engine is a class with Board's methods: layoutCards(),
+removeAces(), getCardAt(), findPlayableCards(), getMoveableCardDest(),
+moveCard(), getCardsInPlace(), countCardsInPlace(), moreMoves(),
+gameCompletelyDone() and resetBoard(rng).  It is given Card objects and
+must return them, but may keep anything it likes inside.
+
+    python equivalence.py fastboard:FastBoard --games 1000000
+
+plays random games with Board and the candidate in lockstep, each with
+its own cards.  After the deal, after every move and after every new
+round it compares the cards on the boards, the moves that can be made
+and where each card would go, the cards in place, moreMoves() and
+gameCompletelyDone().  The first difference found in a game (or an
+exception raised by the candidate) is shrunk to as few moves as still
+show a difference, and printed for cli.py --batch: a comment saying
+what differed, then the seed and the moves.
+
+    # findPlayableCards: ... != ...
+    12345 2H 3H 10S
+
+As in cli.py, a new round is started (with resetBoard()) whenever there
+are no more moves.  The games are played in worker processes.
+'''
+
+import argparse
+import importlib
+import multiprocessing
+import random
+import sys
+import time
+
+from game import *
+
+# Give up on a game after this many rounds.
+MAX_ROUNDS = 100
+# Seeds checked by each task given to the worker processes.
+CHUNK_SIZE = 50
+
+
+class Divergence(Exception):
+    '''The candidate did not do what Board did.'''
+
+    def __init__(self, check, reference, candidate):
+        Exception.__init__(self, "%s: %s != %s" % (check, reference, candidate))
+        self.check = check
+        self.reference = reference
+        self.candidate = candidate
+
+
+class InvalidMove(Exception):
+    '''A move that Board cannot make.'''
+
+
+def loadEngine(spec):
+    '''Return the class named by MODULE:CLASS.'''
+    moduleName, _, className = spec.partition(':')
+    if not className:
+        raise ValueError("engine %r is not MODULE:CLASS" % spec)
+    return getattr(importlib.import_module(moduleName), className)
+
+
+def _ordinal(card):
+    return None if card is None else card.getOrdinal()
+
+
+def _cardTuples(tuples):
+    '''Convert (card, row, col) tuples to (ordinal, row, col), sorted.'''
+    return sorted((_ordinal(card), row, col) for card, row, col in tuples)
+
+
+class Lockstep:
+    '''Board and a candidate engine playing the same game.'''
+
+    def __init__(self, seed, engine):
+        self._seed = seed
+        self._roundNum = 1
+        self._ref = Board()
+        self._cand = self._call("__init__", engine)
+        # ordinal -> each engine's Card.
+        self._refCards = {}
+        self._candCards = {}
+        self._deal("layoutCards",
+                   lambda board: board.layoutCards(self._newDeck(board)))
+        self._compare("removeAces",
+                      sorted(map(_ordinal, self._ref.removeAces())),
+                      sorted(map(_ordinal, self._call("removeAces",
+                                                      self._cand.removeAces))))
+        self.check()
+
+    def _newDeck(self, board):
+        deck = Deck()
+        deck.addAllCards(roundRng(self._seed, 1))
+        cards = self._refCards if board is self._ref else self._candCards
+        for card in deck.getCards():
+            cards[card.getOrdinal()] = card
+        return deck
+
+    def _call(self, name, method, *args):
+        '''Call one of the candidate's methods, turning an exception into
+        a Divergence.'''
+        try:
+            return method(*args)
+        except Exception as e:
+            raise Divergence(name, "no exception", repr(e))
+
+    def _compare(self, check, reference, candidate):
+        if reference != candidate:
+            raise Divergence(check, reference, candidate)
+
+    def _deal(self, name, deal):
+        '''Call deal(board) for each engine.'''
+        deal(self._ref)
+        self._call(name, deal, self._cand)
+        self._compareCells()
+
+    def _compareCells(self):
+        for row in range(Board.NUM_ROWS):
+            for col in range(Board.NUM_COLS):
+                self._compare("getCardAt(%d, %d)" % (row, col),
+                              _ordinal(self._ref.getCardAt(row, col)),
+                              _ordinal(self._call("getCardAt",
+                                                  self._cand.getCardAt,
+                                                  row, col)))
+
+    def check(self):
+        '''Compare everything the engines can tell about the board.'''
+        ref, cand = self._ref, self._cand
+        self._compareCells()
+        moves = _cardTuples(ref.findPlayableCards())
+        self._compare("findPlayableCards", moves,
+                      _cardTuples(self._call("findPlayableCards",
+                                             cand.findPlayableCards)))
+        for ordinal, row, col in moves:
+            name = str(self._refCards[ordinal]).strip()
+            self._compare("getMoveableCardDest(%s)" % name,
+                          ref.getMoveableCardDest(self._refCards[ordinal]),
+                          self._call("getMoveableCardDest",
+                                     cand.getMoveableCardDest,
+                                     self._candCards[ordinal]))
+        self._compare("getCardsInPlace", _cardTuples(ref.getCardsInPlace()),
+                      _cardTuples(self._call("getCardsInPlace",
+                                             cand.getCardsInPlace)))
+        self._compare("countCardsInPlace", ref.countCardsInPlace(),
+                      self._call("countCardsInPlace", cand.countCardsInPlace))
+        self._compare("moreMoves", ref.moreMoves(),
+                      self._call("moreMoves", cand.moreMoves))
+        self._compare("gameCompletelyDone", ref.gameCompletelyDone(),
+                      self._call("gameCompletelyDone", cand.gameCompletelyDone))
+
+    def playableCards(self):
+        '''Return the ordinals of the cards Board can move.'''
+        return [card.getOrdinal()
+                for card, row, col in self._ref.findPlayableCards()]
+
+    def isDone(self):
+        return self._ref.gameCompletelyDone()
+
+    def getRoundNum(self):
+        return self._roundNum
+
+    def move(self, ordinal):
+        '''Move the card with the given ordinal on both boards, starting
+        new rounds first if there are no more moves, and check them.'''
+        while not self.isDone() and not self._ref.moreMoves():
+            self.nextRound()
+        card = self._refCards[ordinal]
+        fromRow, fromCol = self._ref.findCardLocation(card)
+        dest = self._ref.getMoveableCardDest(card)
+        if self.isDone() or dest is None:
+            raise InvalidMove(str(card).strip())
+        self._ref.moveCard(card, fromRow, fromCol, dest[0], dest[1])
+        self._call("moveCard", self._cand.moveCard, self._candCards[ordinal],
+                   fromRow, fromCol, dest[0], dest[1])
+        self.check()
+
+    def nextRound(self):
+        self._roundNum += 1
+        rng = roundRng(self._seed, self._roundNum)
+        state = rng.getstate()
+
+        def reset(board):
+            # Both engines shuffle with the same random numbers.
+            rng.setstate(state)
+            board.resetBoard(rng)
+        self._deal("resetBoard", reset)
+        self.check()
+
+
+def playRandomGame(seed, engine):
+    '''Play a game with random moves.  Return None if the engines agreed
+    all the way, or (the ordinals moved, the Divergence).'''
+    rng = random.Random(seed)
+    moves = []
+    try:
+        game = Lockstep(seed, engine)
+        while not game.isDone() and game.getRoundNum() <= MAX_ROUNDS:
+            if not game.playableCards():
+                game.nextRound()
+                continue
+            moves.append(rng.choice(game.playableCards()))
+            game.move(moves[-1])
+    except Divergence as e:
+        return moves, e
+    return None
+
+
+def replay(seed, moves, engine):
+    '''Play the given moves, skipping those Board cannot make, as cli.py
+    does.  Return (the moves made, the Divergence found or None).'''
+    made = []
+    try:
+        game = Lockstep(seed, engine)
+        for ordinal in moves:
+            try:
+                game.move(ordinal)
+            except InvalidMove:
+                continue
+            made.append(ordinal)
+        # See what the next round brings.
+        while not game.isDone() and not game.playableCards() and \
+                game.getRoundNum() <= MAX_ROUNDS:
+            game.nextRound()
+    except Divergence as e:
+        return made, e
+    return made, None
+
+
+def shrink(seed, moves, divergence, engine):
+    '''Return (the shortest list of moves found that still shows the
+    same kind of divergence, its Divergence), removing moves in halves,
+    quarters, ... down to one at a time (delta debugging).'''
+    chunk = len(moves) // 2
+    while chunk >= 1:
+        removed = False
+        start = 0
+        while start < len(moves):
+            made, found = replay(seed, moves[:start] + moves[start + chunk:],
+                                 engine)
+            if found is not None and found.check == divergence.check:
+                moves, divergence = made, found
+                removed = True
+            else:
+                start += chunk
+        if not removed:
+            chunk //= 2
+    return moves, divergence
+
+
+def formatCase(seed, moves, divergence):
+    '''Return the case as lines for cli.py --batch, which only skips #
+    comments that start a line.'''
+    names = [str(cardFromOrdinal(ordinal)).strip() for ordinal in moves]
+    return "# %s\n%d %s" % (divergence, seed, " ".join(names))
+
+
+def _checkChunk(args):
+    '''Check the seeds from firstSeed, stopping after maxFailures.
+    Return (number of games checked, the shrunk failures as printable
+    lines).'''
+    spec, firstSeed, numSeeds, maxFailures = args
+    engine = loadEngine(spec)
+    failures = []
+    for seed in range(firstSeed, firstSeed + numSeeds):
+        res = playRandomGame(seed, engine)
+        if res is not None:
+            moves, divergence = shrink(seed, res[0], res[1], engine)
+            failures.append(formatCase(seed, moves, divergence))
+            if len(failures) >= maxFailures:
+                return seed - firstSeed + 1, failures
+    return numSeeds, failures
+
+
+def checkEngine(spec, firstSeed, numGames, workers=None, maxFailures=10,
+                log=sys.stderr):
+    '''Check numGames games from firstSeed in worker processes.  Return
+    the failures found, stopping after maxFailures.'''
+    chunks = [(spec, seed, min(CHUNK_SIZE, firstSeed + numGames - seed),
+               maxFailures)
+              for seed in range(firstSeed, firstSeed + numGames, CHUNK_SIZE)]
+    failures = []
+    checked = 0
+    start = time.perf_counter()
+    with multiprocessing.Pool(workers) as pool:
+        for numChecked, chunkFailures in pool.imap(_checkChunk, chunks):
+            checked += numChecked
+            for line in chunkFailures[:maxFailures - len(failures)]:
+                print(line)
+                failures.append(line)
+            if len(failures) >= maxFailures:
+                pool.terminate()
+                break
+            if log is not None and checked % (CHUNK_SIZE * 20) == 0:
+                print("%d games, %.0f games/s" %
+                      (checked, checked / (time.perf_counter() - start)),
+                      file=log)
+    if log is not None:
+        print("checked %d games in %.1f s: %d failures" %
+              (checked, time.perf_counter() - start, len(failures)), file=log)
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check a board engine against board.Board.")
+    parser.add_argument("engine", help="MODULE:CLASS of the engine to check")
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--first-seed", type=int, default=0)
+    parser.add_argument("--workers", type=int,
+                        help="processes (default: one per CPU)")
+    parser.add_argument("--max-failures", type=int, default=10)
+    args = parser.parse_args()
+    try:
+        loadEngine(args.engine)
+    except (ImportError, AttributeError, ValueError) as e:
+        sys.exit(e)
+    failures = checkEngine(args.engine, args.first_seed, args.games,
+                           args.workers, args.max_failures)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+'''A game of Frustration Solitaire without any user interface: the
+rounds, moves and scoring of the browser version (main.App), on top of a
+Board.  Used by the text version and by anything that plays many games,
+e.g., regression and throughput tests.
+'''
+
+import random
+
+from card import *
+from board import *
+
+# Seeds are chosen from this range when a game is not given one.
+MAX_SEED = 2 ** 32
+
+NUM_CARDS = len(Deck.NUMS) * len(Deck.SUITS)
+
+
+def roundRng(seed, roundNum):
+    '''Return the random.Random used to shuffle the deck for the given
+    round of the game with the given seed.  Each round gets its own, so a
+    game can be replayed from its seed and its moves alone.'''
+    return random.Random(seed * 1000003 + roundNum)
+
+
+def parseCard(name):
+    '''Convert a card name as it is typed or printed (3H, 10S, QD, ...) to
+    a Card.  Return None if it is not the name of a card.'''
+    name = name.strip().upper()
+    if len(name) < 2 or name[-1] not in Deck.SUITS or \
+            name[:-1] not in Deck.NUMS:
+        return None
+    return Card(name[:-1], name[-1])
+
+
+class Game:
+    '''One game: the board, the round number, and the points each card
+    in place is worth.  The game starts with the cards laid out and the
+    aces removed.
+
+    If a recorder is given (e.g., a gamelog.GameRecorder), it is told about
+    the game's seed, each move, each move undone and each new round.
+    '''
+
+    def __init__(self, seed=None, recorder=None):
+        if seed is None:
+            seed = random.randrange(MAX_SEED)
+        self._seed = seed
+        self._recorder = recorder
+        if recorder is not None:
+            recorder.startGame(seed)
+        self._roundNum = 1
+        self._numMoves = 0
+        self._numMovesThisRound = 0
+        self._board = Board()
+        # What undo() needs to take back the last move: see moveCard().
+        self._undo = None
+
+        deck = Deck()
+        deck.addAllCards(roundRng(seed, self._roundNum))
+        # ordinal -> card, to restore snapshots.
+        self._cards = {}
+        for card in deck.getCards():
+            self._cards[card.getOrdinal()] = card
+        self._removedAces = []
+        self._deal(deck)
+
+    def getSeed(self):
+        return self._seed
+
+    def getBoard(self):
+        return self._board
+
+    def getRoundNum(self):
+        return self._roundNum
+
+    def getNumMoves(self):
+        '''Return the number of moves made in all rounds.'''
+        return self._numMoves
+
+    def getNumMovesThisRound(self):
+        return self._numMovesThisRound
+
+    def getPtsPerCard(self):
+        '''10 pts for round 1, 9 for round 2, etc...'''
+        return 11 - self._roundNum
+
+    def currentScore(self):
+        '''Return the sum of the points of the cards in place.'''
+        res = 0
+        for card, row, col in self._board.getCardsInPlace():
+            res += card.getPoints()
+        return res
+
+    def countCardsInPlace(self):
+        return self._board.countCardsInPlace()
+
+    def getCard(self, ordinal):
+        '''Return this game's card with the given ordinal.'''
+        return self._cards[ordinal]
+
+    def findCard(self, name):
+        '''Return the card on the board with the given name (e.g., 10S),
+        or None if there is no such card on the board.'''
+        card = parseCard(name)
+        if card is None:
+            return None
+        res = self._board.findCard(card.getNum(), card.getSuit())
+        if res is None:
+            return None
+        return res[0]
+
+    def playableCards(self):
+        '''Return the cards that can be moved, as (card, row, col)
+        tuples.'''
+        return self._board.findPlayableCards()
+
+    def isDone(self):
+        return self._board.gameCompletelyDone()
+
+    def isRoundOver(self):
+        '''Return True iff there are no more moves in this round, and the
+        game is not done: nextRound() must be called.'''
+        return not self.isDone() and not self._board.moreMoves()
+
+    def moveCard(self, card):
+        '''Move the given card into the empty space it can go to.  Return
+        the (row, col) it was moved to, or None if it cannot be moved.'''
+        fromRow, fromCol = self._board.findCardLocation(card)
+        if fromRow is None:
+            return None
+        dest = self._board.getMoveableCardDest(card)
+        if dest is None:
+            return None
+        toRow, toCol = dest
+
+        # The move, and (card, old points) for each card whose points
+        # change.
+        undo = (card, fromRow, fromCol, toRow, toCol, [])
+        numCardsInPlaceBeforeMove = self._board.countCardsInPlace()
+        # Moving a 2 out of column 0 takes its row out of place.
+        if fromCol == 0 and card.getNum() == 2:
+            for col in range(Board.NUM_COLS):
+                c = self._board.getCardAt(fromRow, col)
+                if c is not None and c.getPoints() != 0:
+                    undo[5].append((c, c.getPoints()))
+                    c.setPoints(0)
+
+        self._board.moveCard(card, fromRow, fromCol, toRow, toCol)
+        self._numMoves += 1
+        self._numMovesThisRound += 1
+        if self._recorder is not None:
+            self._recorder.recordMove(card)
+
+        if self._board.countCardsInPlace() != numCardsInPlaceBeforeMove:
+            self._markGoodCards(undo[5])
+        self._undo = undo
+        return dest
+
+    def canUndo(self):
+        return self._undo is not None
+
+    def undo(self):
+        '''Take back the last move, as the browser version's Undo button
+        does: only one move, and not once a new round has started.  Return
+        True iff there was a move to take back.'''
+        if self._undo is None:
+            return False
+        card, fromRow, fromCol, toRow, toCol, changes = self._undo
+        self._undo = None
+        self._board.moveCard(card, toRow, toCol, fromRow, fromCol)
+        for c, points in reversed(changes):
+            c.setPoints(points)
+        self._numMoves -= 1
+        self._numMovesThisRound -= 1
+        if self._recorder is not None:
+            self._recorder.recordUndo()
+        return True
+
+    def nextRound(self):
+        '''Take the cards that are not in place off the board, shuffle
+        them with the aces, and lay them out again.'''
+        unplacedCards = self._board.removeIncorrectCards()
+        deck = Deck(unplacedCards)
+        deck.addCards(self._removedAces)
+        self._roundNum += 1
+        self._numMovesThisRound = 0
+        self._undo = None
+        if self._recorder is not None:
+            self._recorder.recordNextRound()
+        deck.shuffle(roundRng(self._seed, self._roundNum))
+        self._deal(deck)
+
+    def result(self):
+        '''Return a dict summarizing the game so far.'''
+        return {
+            'seed': self._seed,
+            'done': self.isDone(),
+            'rounds': self._roundNum,
+            'moves': self._numMoves,
+            'cardsInPlace': self.countCardsInPlace(),
+            'score': self.currentScore(),
+        }
+
+    def snapshot(self):
+        '''Return the state of the game as a tuple, which restore() can
+        put back.  Cards are stored by ordinal (None for an empty space).'''
+        board = self._board
+        cells = []
+        for row in range(Board.NUM_ROWS):
+            for col in range(Board.NUM_COLS):
+                card = board.getCardAt(row, col)
+                cells.append(None if card is None else card.getOrdinal())
+        points = tuple(self._cards[i].getPoints() for i in range(NUM_CARDS))
+        aces = tuple(card.getOrdinal() for card in self._removedAces)
+        return (self._roundNum, self._numMoves, self._numMovesThisRound,
+                tuple(cells), points, aces)
+
+    def restore(self, snapshot):
+        '''Put the game back in the state returned by snapshot(), which
+        must have been taken of a game with the same seed.'''
+        roundNum, numMoves, numMovesThisRound, cells, points, aces = snapshot
+        self._roundNum = roundNum
+        self._numMoves = numMoves
+        self._numMovesThisRound = numMovesThisRound
+        self._undo = None
+        idx = 0
+        for row in range(Board.NUM_ROWS):
+            for col in range(Board.NUM_COLS):
+                ordinal = cells[idx]
+                self._board.setCardAt(
+                    row, col, None if ordinal is None else self._cards[ordinal])
+                idx += 1
+        for ordinal, pts in enumerate(points):
+            self._cards[ordinal].setPoints(pts)
+        self._removedAces = [self._cards[ordinal] for ordinal in aces]
+
+    def _deal(self, deck):
+        self._board.layoutCards(deck)
+        self._removedAces = self._board.removeAces()
+        # As in the browser game, the cards dealt into place get no points
+        # if they finish the game.
+        if not self.isDone():
+            self._markGoodCards()
+
+    def _markGoodCards(self, changes=None):
+        '''Give the cards that have just been put in place the points a
+        card is worth this round, adding (card, 0) to changes for each.'''
+        ptsPerCard = self.getPtsPerCard()
+        for card, row, col in self._board.getCardsInPlace():
+            if card.getPoints() == 0:
+                card.setPoints(ptsPerCard)
+                if changes is not None:
+                    changes.append((card, 0))
@@ -0,0 +1,204 @@
+'''A compact record of played games, and replaying them.
+
+A game log file starts with MAGIC, followed by any number of games.  Each
+game is its seed, as 8 bytes (big-endian), then one byte per event:
+
+  0-51        a move of the card with that ordinal (see Card.getOrdinal())
+  NEXT_ROUND  the cards not in place were taken up and dealt again
+  END_GAME    the end of this game's record
+
+Since the deal of every round comes from the seed (see game.roundRng()), a
+typical game takes a couple of hundred bytes, and its position after any
+move can be rebuilt by replaying it.  Replay keeps snapshots of the game every so
+many moves, so seeking to a move replays only the moves since the nearest
+one.
+
+Run this module with a game log file to print the result of each game in
+it, e.g., to check the scores in an archive:
+
+    python gamelog.py games.log
+'''
+
+import argparse
+import json
+import struct
+
+from game import *
+
+MAGIC = b"FSGLOG1\n"
+NEXT_ROUND = 0xFE
+END_GAME = 0xFF
+
+SEED_FORMAT = ">Q"
+SEED_SIZE = struct.calcsize(SEED_FORMAT)
+
+# Moves between the snapshots kept by Replay.
+CHECKPOINT_INTERVAL = 32
+
+
+class GameRecord:
+    '''The seed of a game and its events, as a bytes object.'''
+
+    def __init__(self, seed, events):
+        self.seed = seed
+        self.events = events
+
+    def numMoves(self):
+        return len(self.events) - self.events.count(NEXT_ROUND)
+
+    def toBytes(self):
+        return struct.pack(SEED_FORMAT, self.seed) + self.events + \
+            bytes([END_GAME])
+
+
+class GameRecorder:
+    '''Records the moves of a game: pass it to Game().'''
+
+    def __init__(self):
+        self._seed = None
+        self._events = bytearray()
+
+    def startGame(self, seed):
+        # Checked now, not when the record is packed after the whole game.
+        if not 0 <= seed < MAX_SEED:
+            raise ValueError("seed %d is not in [0, %d)" % (seed, MAX_SEED))
+        self._seed = seed
+        self._events = bytearray()
+
+    def recordMove(self, card):
+        self._events.append(card.getOrdinal())
+
+    def recordUndo(self):
+        # Only the last move can be undone, so it is simply dropped.
+        self._events.pop()
+
+    def recordNextRound(self):
+        self._events.append(NEXT_ROUND)
+
+    def getRecord(self):
+        return GameRecord(self._seed, bytes(self._events))
+
+
+class GameLogWriter:
+    '''Writes game records to a file opened in binary mode.'''
+
+    def __init__(self, f):
+        self._f = f
+        self._f.write(MAGIC)
+
+    def write(self, record):
+        self._f.write(record.toBytes())
+
+
+def readRecords(f):
+    '''Yield the GameRecords in a game log file opened in binary mode.'''
+    data = f.read()
+    if not data.startswith(MAGIC):
+        raise ValueError("not a game log")
+    pos = len(MAGIC)
+    while pos < len(data):
+        if pos + SEED_SIZE > len(data):
+            raise ValueError("truncated game log")
+        seed, = struct.unpack_from(SEED_FORMAT, data, pos)
+        pos += SEED_SIZE
+        end = data.find(END_GAME, pos)
+        if end == -1:
+            raise ValueError("truncated game log")
+        yield GameRecord(seed, data[pos:end])
+        pos = end + 1
+
+
+class Replay:
+    '''Rebuilds the positions of a recorded game.  Use seek() to go to the
+    position after any move, and getGame() to look at it.'''
+
+    def __init__(self, record, checkpointInterval=CHECKPOINT_INTERVAL):
+        self._record = record
+        self._interval = checkpointInterval
+        self._game = Game(record.seed)
+        # Index in the events of each move.
+        self._moveEvents = [i for i, event in enumerate(record.events)
+                            if event != NEXT_ROUND]
+        # checkpoints[k] is the snapshot after move k * interval, made the
+        # first time the replay gets there.
+        self._checkpoints = [self._game.snapshot()]
+        # Position of the game: number of moves and the next event.
+        self._moveNum = 0
+        self._eventIdx = 0
+
+    def getGame(self):
+        return self._game
+
+    def numMoves(self):
+        return len(self._moveEvents)
+
+    def getMoveNum(self):
+        return self._moveNum
+
+    def seek(self, moveNum):
+        '''Put the game in the position right after the given move (0 for
+        the first deal).  Raise ValueError if the record has an illegal
+        move or a new round while there are moves left.'''
+        if not 0 <= moveNum <= self.numMoves():
+            raise IndexError("move %d is not in the game" % moveNum)
+        checkpoint = min(moveNum // self._interval, len(self._checkpoints) - 1)
+        if moveNum < self._moveNum or \
+                checkpoint * self._interval > self._moveNum:
+            self._game.restore(self._checkpoints[checkpoint])
+            self._moveNum = checkpoint * self._interval
+            self._eventIdx = 0 if self._moveNum == 0 else \
+                self._moveEvents[self._moveNum - 1] + 1
+        while self._moveNum < moveNum:
+            self._step()
+
+    def toEnd(self):
+        '''Replay the whole game, including any new round at the end, and
+        return the Game.'''
+        self.seek(self.numMoves())
+        while self._eventIdx < len(self._record.events):
+            self._step()
+        return self._game
+
+    def _step(self):
+        '''Apply the next event.'''
+        event = self._record.events[self._eventIdx]
+        self._eventIdx += 1
+        if event == NEXT_ROUND:
+            if not self._game.isRoundOver():
+                raise ValueError("new round with moves left, after move %d"
+                                 % self._moveNum)
+            self._game.nextRound()
+            return
+        if event >= NUM_CARDS or self._game.moveCard(
+                self._game.getCard(event)) is None:
+            raise ValueError("illegal move %d: %d" % (self._moveNum + 1, event))
+        self._moveNum += 1
+        if self._moveNum % self._interval == 0 and \
+                self._moveNum // self._interval == len(self._checkpoints):
+            self._checkpoints.append(self._game.snapshot())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay the games in a game "
+                                     "log and print their results.")
+    parser.add_argument("log", help="game log file")
+    parser.add_argument("--move", type=int,
+                        help="print the board after this move instead")
+    args = parser.parse_args()
+
+    with open(args.log, "rb") as f:
+        for record in readRecords(f):
+            replay = Replay(record)
+            try:
+                if args.move is not None:
+                    replay.seek(min(args.move, replay.numMoves()))
+                    print(replay.getGame().getBoard())
+                    continue
+                res = replay.toEnd().result()
+            except ValueError as e:
+                res = {'seed': record.seed, 'error': str(e)}
+            print(json.dumps(res))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,9 @@
 Date: Nov. 25, 2016
 '''
 
+import os
+import sys
+from fractions import Fraction
 from tkinter import *
 
 from card import *
@@ -13,11 +16,76 @@ CARD_AREA_WIDTH = 90
 CARD_AREA_HEIGHT = 125
 CARD_WIDTH = 75
 CARD_HEIGHT = 109
+# ms between cards when dealing.
+DEAL_DELAY = 20
+# Where the card images are read from.  Any of the Playing_Cards directories
+# with images Tk can read (GIF or PNG) will do: they are scaled to CARD_WIDTH.
+CARD_DIR = "Playing_Cards/gifs"
+
+
+class ImageCache:
+    '''Shared by all the CardImgs in the process, so each card image file is
+    read only once, and each scaled version of it is made only once.
+    '''
+
+    # (filename, width) -> PhotoImage
+    _images = {}
+
+    @classmethod
+    def get(cls, filename, width=None):
+        '''Return the image in filename, scaled to about width pixels wide
+        (as close as Tk's whole number zoom and subsample factors allow), or
+        unscaled if width is None.'''
+        key = (filename, width)
+        if key not in cls._images:
+            img = cls.get(filename) if width is not None else PhotoImage(file=filename)
+            if width is not None and width != img.width():
+                factor = Fraction(width, img.width()).limit_denominator(10)
+                if factor.numerator > 1:
+                    img = img.zoom(factor.numerator)
+                if factor.denominator > 1:
+                    img = img.subsample(factor.denominator)
+            cls._images[key] = img
+        return cls._images[key]
+
+    @classmethod
+    def clear(cls):
+        cls._images.clear()
+
+
+class OutlinePool:
+    '''Outline rectangles drawn around cards.  Rectangles that are taken
+    down are hidden and kept to be used again, instead of being deleted and
+    created anew on every move.
+    '''
+
+    def __init__(self, canv):
+        self._canv = canv
+        self._free = []
+        # tag -> ids of the rectangles shown with that tag.
+        self._shown = {}
+
+    def draw(self, x1, y1, x2, y2, color, tag):
+        if self._free:
+            rect = self._free.pop()
+            self._canv.coords(rect, x1, y1, x2, y2)
+            self._canv.itemconfig(rect, outline=color, tags=(tag,), state=NORMAL)
+        else:
+            rect = self._canv.create_rectangle(x1, y1, x2, y2, width=3,
+                                               tags=(tag,), outline=color)
+        self._shown.setdefault(tag, []).append(rect)
+        return rect
+
+    def erase(self, tag):
+        '''Take down all the rectangles drawn with the given tag.'''
+        for rect in self._shown.pop(tag, []):
+            self._canv.itemconfig(rect, state=HIDDEN, tags=())
+            self._free.append(rect)
 
 
 class CardImg:
-    '''This class encapsulates an image to represent a card, reading the
-    image from a file in images/ and creating a Canvas image for it.
+    '''This class encapsulates an image to represent a card, taking the
+    image from the ImageCache and creating a Canvas image for it.
     '''
 
     TRANSLATE_NUM = {2: '2', 3: '3', 4: '4', 5: '5', 6: '6', 7: '7', 8: '8',
@@ -25,7 +93,7 @@ class CardImg:
     TRANSLATE_SUIT = {'D': 'diamonds',
                       'H': 'hearts', 'C': 'clubs', 'S': 'spades'}
 
-    def __init__(self, card, canv):
+    def __init__(self, card, canv, cardDir=CARD_DIR):
         '''Constructor: creates the image for the given card, and stores the
         tag and id for the cardimg.
         '''
@@ -37,12 +105,19 @@ class CardImg:
         suit = card.getSuit()
         suit = self.TRANSLATE_SUIT[suit]
         self._tag = num + "_of_" + suit
-        self._img = PhotoImage(file='images/' + self._tag + ".gif")
+        self._img = ImageCache.get(self._findImageFile(cardDir), CARD_WIDTH)
 
         # Create the card image at 0, 0
         self._id = self._canv.create_image(0, 0, image=self._img, tags=self._tag,
                                            anchor=NW, state=HIDDEN)
 
+    def _findImageFile(self, cardDir):
+        for ext in (".gif", ".png"):
+            filename = os.path.join(cardDir, self._tag + ext)
+            if os.path.exists(filename):
+                return filename
+        raise FileNotFoundError("no image for %s in %s" % (self._tag, cardDir))
+
     def getImg(self):
         return self._img
 
@@ -62,14 +137,22 @@ class BoardGui:
     def __init__(self, board, canv):
         self._board = board
         self._canv = canv
-
-    def displayLayout(self, card2ImgDict):
+        # (cardimg, x, y) still to be dealt, and what to call when done.
+        self._dealQueue = []
+        self._onDealt = None
+        self._dealAfterId = None
+        # The pending pause() call, if any.
+        self._pauseAfterId = None
+
+    def displayLayout(self, card2ImgDict, onComplete=None):
         '''Go through the cards on the board object and lay them
-        out on the canvas.  Translation of the Card object to its
-        corresponding CardImg object is done through the given
+        out on the canvas, one every DEAL_DELAY ms so it looks like they
+        are being dealt, then call onComplete().  Translation of the Card
+        object to its corresponding CardImg object is done through the given
         card2ImgDict dictionary.
         '''
 
+        self.cancelDeal()
         # Each card image is 75x109 pixels.
         for ridx in range(4):
             for cidx in range(13):
@@ -81,16 +164,68 @@ class BoardGui:
 
                 x = LEFT_CARD_PADDING + cidx * CARD_AREA_WIDTH
                 y = LEFT_CARD_PADDING + ridx * CARD_AREA_HEIGHT
-                currx, curry = self._canv.coords(cardimg.getId())
-                # move() is relative so we have to figure out the diff.
-                self._canv.move(cardimg.getId(), x - currx, y - curry)
-                # Make sure the card can be seen.
-                self._canv.itemconfig(cardimg.getTag(), state=NORMAL)
+                self._dealQueue.append((cardimg, x, y))
+        self._onDealt = onComplete
+        self._dealNext()
+
+    def _dealNext(self):
+        '''Deal the next card in the queue, and schedule the one after.'''
+        self._dealAfterId = None
+        if not self._dealQueue:
+            self._finishDeal()
+            return
+        cardimg, x, y = self._dealQueue.pop(0)
+        self._showCard(cardimg, x, y)
+        self._dealAfterId = self._canv.after(DEAL_DELAY, self._dealNext)
 
-                # Put a little delay in, so it looks like the cards are
-                # being dealt out one-by-one.
-                self._canv.after(20)
-                self._canv.update()
+    def _showCard(self, cardimg, x, y):
+        currx, curry = self._canv.coords(cardimg.getId())
+        # move() is relative so we have to figure out the diff.
+        self._canv.move(cardimg.getId(), x - currx, y - curry)
+        # Make sure the card can be seen.
+        self._canv.itemconfig(cardimg.getTag(), state=NORMAL)
+
+    def _finishDeal(self):
+        onDealt = self._onDealt
+        self._onDealt = None
+        if onDealt is not None:
+            onDealt()
+
+    def isDealing(self):
+        return self._dealAfterId is not None
+
+    def skipDeal(self):
+        '''Put all the cards still to be dealt down right now.'''
+        if self._dealAfterId is None:
+            return
+        self._canv.after_cancel(self._dealAfterId)
+        self._dealAfterId = None
+        while self._dealQueue:
+            self._showCard(*self._dealQueue.pop(0))
+        self._finishDeal()
+
+    def cancelDeal(self):
+        '''Stop dealing, without putting down the rest of the cards, and
+        drop any pause() still to come.'''
+        if self._dealAfterId is not None:
+            self._canv.after_cancel(self._dealAfterId)
+            self._dealAfterId = None
+        if self._pauseAfterId is not None:
+            self._canv.after_cancel(self._pauseAfterId)
+            self._pauseAfterId = None
+        self._dealQueue = []
+        self._onDealt = None
+
+    def pause(self, ms, onComplete):
+        '''Call onComplete() after ms, unless cancelDeal() is called
+        first (e.g., by the next deal).'''
+        if self._pauseAfterId is not None:
+            self._canv.after_cancel(self._pauseAfterId)
+        self._pauseAfterId = self._canv.after(ms, self._endPause, onComplete)
+
+    def _endPause(self, onComplete):
+        self._pauseAfterId = None
+        onComplete()
 
     def moveCard(self, cardimg, toRow, toCol):
         '''Move a cardimg from where it is not to the given
@@ -110,10 +245,11 @@ class App:
     cards on a created BoardGui (the GUI view).
     '''
 
-    def __init__(self, window):
+    def __init__(self, window, cardDir=CARD_DIR):
         '''Store the main window, create the Board and Deck models;
         create the main Canvas and all the buttons and labels to allow
-        the user to manipulate the game.
+        the user to manipulate the game.  The card images are read from
+        cardDir.
         '''
 
         self._window = window
@@ -127,6 +263,7 @@ class App:
         self._canv = Canvas(window, bg="darkgreen", width=13 * CARD_AREA_WIDTH,
                             height=4 * CARD_AREA_HEIGHT)
         self._canv.pack()
+        self._outlines = OutlinePool(self._canv)
 
         self._buttonFr = Frame(window)
         self._buttonFr.pack()
@@ -157,6 +294,8 @@ class App:
 
         self._dispPtsLabel = None
         self._dispPtsLabelId = None
+        # Canvas items of the messages being shown.
+        self._mesgItems = []
 
         try:
             f = open("./highscores.txt", "r")
@@ -186,7 +325,7 @@ class App:
 
         cards = self._deck.getCards()
         for card in cards:
-            cardimg = CardImg(card, self._canv)
+            cardimg = CardImg(card, self._canv, cardDir)
 
             imgid = cardimg.getId()
             self._imgDict[imgid] = cardimg
@@ -226,11 +365,11 @@ class App:
             self.drawOutline(row, col, "yellow", "movable")
 
     def drawOutline(self, row, col, color, tag):
-            # draw highlight around row,col card spot.
+        # draw highlight around row,col card spot.
         x = LEFT_CARD_PADDING + col * CARD_AREA_WIDTH
         y = LEFT_CARD_PADDING + row * CARD_AREA_HEIGHT
-        self._canv.create_rectangle(x-5, y-5, x + CARD_WIDTH + 5, y + CARD_HEIGHT + 5,
-                                    width=3, tag=tag, outline=color)
+        self._outlines.draw(x-5, y-5, x + CARD_WIDTH + 5, y + CARD_HEIGHT + 5,
+                            color, tag)
 
     def nextRound(self):
         '''Callback for when the user clicks the "Next Round" button.
@@ -241,6 +380,8 @@ class App:
         Register nextRoundContined() to be called.
         '''
 
+        # The "No more moves" message may still be up.
+        self.takeDownMesg()
         self._roundNum += 1
         self._roundNumLbl.config(text="Round: " + str(self._roundNum) + "  ")
         discarded = self._board.removeIncorrectCards()
@@ -259,7 +400,7 @@ class App:
         self._scoreText.set("Score: %d (%d pts per card this round)" %
                             (self._score, self._getPtsPerCard()))
 
-        self._canv.after(1000, self.nextRoundContinued)
+        self._boardGui.pause(1000, self.nextRoundContinued)
 
     def nextRoundContinued(self):
         '''Continuation of nextRound():
@@ -270,11 +411,10 @@ class App:
 
         # Deck is shuffled.  Now, add cards to the board.
         self._board.layoutCards(self._deck)
-        self._boardGui.displayLayout(self._card2ImgDict)
-
         self._btNextRound.config(state=DISABLED)
         # After 1.5 seconds of showing all cards, remove the aces.
-        self._canv.after(1500, self.removeAces)
+        self._boardGui.displayLayout(
+            self._card2ImgDict, lambda: self._boardGui.pause(1500, self.removeAces))
 
     def newGame(self):
         '''Called back when New Game button is pressed.
@@ -297,19 +437,24 @@ class App:
         self.initNewGame()
 
     def initNewGame(self):
-        self._canv.delete("good-outlines")
+        self._outlines.erase("good-outlines")
         self._board.layoutCards(self._deck)
-        self._boardGui.displayLayout(self._card2ImgDict)
+        self._boardGui.displayLayout(self._card2ImgDict, self.newGameDealt)
         self._cardsInPlace = self._board.countCardsInPlace()
         self._cardsInPlaceText.set("Cards in place: %d" % self._cardsInPlace)
         self._score = self._cardsInPlace * 10
         self._scoreText.set(
             "Score: %d (10 pts per card this round)" % self._score)
-        self.redrawGoodCardOutlines()
 
         # Disable the "next round" button.
         self._btNextRound.config(state=DISABLED)
-        self._canv.after(1500, self.removeAces)
+
+    def newGameDealt(self):
+        '''Called when the first deal of a game is down: outline the
+        cards in place, and after 1.5 seconds of showing all the cards,
+        remove the aces.'''
+        self.redrawGoodCardOutlines()
+        self._boardGui.pause(1500, self.removeAces)
 
     def onCardClick(self, event):
         '''Called back when a card is clicked to be moved into an open spot:
@@ -322,11 +467,19 @@ class App:
         Check if there are more moves, the game is done, etc.
         '''
 
+        if self._boardGui.isDealing():
+            # Clicking during a deal finishes it.
+            self._boardGui.skipDeal()
+            return
+
         # print("onCardClick", event.widget, "at", event.x, ",", event.y)
         item = event.widget.find_closest(event.x, event.y)
         # print(item)
         # Item is a one-ple (id, ) (only 1 thing in it)
         item = item[0]
+        if item not in self._imgDict:
+            # E.g., the rectangle or text of a message.
+            return
         cardimg = self._imgDict[item]
         # print(cardimg._card)
         cardName = str(cardimg._card)
@@ -351,7 +504,7 @@ class App:
         # print("Can be moved to %d, %d" % (toRow, toCol))
 
         # remove all outlines around possible cards to move.
-        self._canv.delete("movable")
+        self._outlines.erase("movable")
 
         cardsInPlaceBeforeMove = self._cardsInPlace
         self._board.moveCard(card, fromRow, fromCol, toRow, toCol)
@@ -370,8 +523,6 @@ class App:
                                 (self._score, ptsPerCard))
             self.redrawGoodCardOutlines()
 
-        self._canv.update()
-
         if self.isEndOfRoundOrGame():
             return
 
@@ -415,7 +566,8 @@ class App:
 
     def displayMesg(self, mesg, time):
         '''Display the given message on a white rectangle on the board for
-        the given number of milliseconds.
+        the given number of milliseconds.  Returns right away: the message
+        is taken down by a timer, so the game stays responsive.
         '''
         border = 150
         rect = self._canv.create_rectangle(border, border,
@@ -427,11 +579,17 @@ class App:
                                     self._canv.winfo_reqheight() / 2,
                                     text=mesg, font=("Helvetica", 20))
         self._canv.tag_raise(id)
-        self._canv.update()
-        self._canv.after(time)
-        self._canv.delete(id)
-        self._canv.delete(rect)
-        self._canv.update()
+        self._mesgItems.extend([id, rect])
+        self._canv.after(time, self.takeDownMesg, id, rect)
+
+    def takeDownMesg(self, *items):
+        '''Delete the given message items, or all the messages shown.'''
+        if not items:
+            items = list(self._mesgItems)
+        for item in items:
+            self._canv.delete(item)
+            if item in self._mesgItems:
+                self._mesgItems.remove(item)
 
     def _getPtsPerCard(self):
         '''10 pts for round 1, 9 for round 2, etc...'''
@@ -464,7 +622,7 @@ class App:
 
     def redrawGoodCardOutlines(self):
         '''Redraw all the black outlines around good cards.'''
-        self._canv.delete("good-outlines")
+        self._outlines.erase("good-outlines")
         goodCards = self._board.getCardsInPlace()
         for card, r, c in goodCards:
             self.drawOutline(r, c, "black", "good-outlines")
@@ -473,5 +631,6 @@ class App:
 if __name__ == "__main__":
     root = Tk()
     root.title("Cards")
-    app = App(root)
+    # Optionally, the directory to read the card images from.
+    app = App(root, *sys.argv[1:2])
     root.mainloop()
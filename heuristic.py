@@ -0,0 +1,181 @@
+'''A learned evaluation of moves, used by the "learned" policy (see
+policy.py) and by the browser game's Hint button.
+
+A move is scored by making it on the board, describing the board with a
+few numbers (see FEATURES), undoing it, and adding up the numbers times
+their weights.  The weights are fitted by learn.py to predict the cards
+in place at the end of the round from the board after each move in
+simulated games, and saved in WEIGHTS_FILE:
+
+    {"version": 1, "features": [...], "weights": [...], ...}
+
+This module only uses the Board methods, so it runs in the browser too.
+'''
+
+import json
+
+from board import Board
+
+VERSION = 1
+WEIGHTS_FILE = "hintweights.json"
+
+KING = 13
+QUEEN = 12
+
+FEATURES = [
+    # Cards in place.
+    "inPlace",
+    # Gaps that a card can be moved into (not counting column 0).
+    "liveGaps",
+    # Gaps behind a King: dead until the next round.
+    "deadGaps",
+    # Gaps behind a Queen: dead once its King is moved in, unless the
+    # gap the King leaves is a better one.
+    "queenGaps",
+    # Gaps behind another gap: dead until the one before is filled.
+    "doubleGaps",
+    # Gaps in column 0, which any 2 can go into.
+    "firstGaps",
+    # Gaps right after the cards in place in a row: filling them puts
+    # another card in place.
+    "readyGaps",
+    # Rows whose first card is a 2 (in place or not yet).
+    "twoRows",
+    "bias",
+]
+
+
+def features(board):
+    '''Return the list of FEATURES of the board.'''
+    inPlace = liveGaps = deadGaps = queenGaps = doubleGaps = firstGaps = 0
+    readyGaps = twoRows = 0
+    for row in range(Board.NUM_ROWS):
+        first = board.getCardAt(row, 0)
+        # Columns of the cards in place in this row.
+        run = 0
+        if first is not None and first.getNum() == 2:
+            twoRows += 1
+            suit = first.getSuit()
+            run = 1
+            while run < Board.NUM_COLS:
+                card = board.getCardAt(row, run)
+                if card is None or card.getNum() != run + 2 or \
+                        card.getSuit() != suit:
+                    break
+                run += 1
+        inPlace += run
+        if first is None:
+            firstGaps += 1
+        left = first
+        for col in range(1, Board.NUM_COLS):
+            card = board.getCardAt(row, col)
+            if card is None:
+                if left is None:
+                    doubleGaps += 1
+                elif left.getNum() == KING:
+                    deadGaps += 1
+                else:
+                    liveGaps += 1
+                    if left.getNum() == QUEEN:
+                        queenGaps += 1
+                    if col == run:
+                        readyGaps += 1
+            left = card
+    return [inPlace, liveGaps, deadGaps, queenGaps, doubleGaps, firstGaps,
+            readyGaps, twoRows, 1]
+
+
+def moveFeatures(board, move):
+    '''Return the FEATURES of the board after the move, a (card, row, col)
+    tuple from findPlayableCards(), or None if it cannot be made.  The
+    board is left as it was.'''
+    card, row, col = move
+    dest = board.getMoveableCardDest(card)
+    if dest is None:
+        return None
+    board.moveCard(card, row, col, dest[0], dest[1])
+    res = features(board)
+    board.moveCard(card, dest[0], dest[1], row, col)
+    return res
+
+
+class Evaluator:
+    '''Scores boards and moves with a list of weights, one per feature.'''
+
+    def __init__(self, weights):
+        if len(weights) != len(FEATURES):
+            raise ValueError("expected %d weights, got %d" %
+                             (len(FEATURES), len(weights)))
+        self._weights = list(weights)
+
+    def getWeights(self):
+        return list(self._weights)
+
+    def value(self, board):
+        '''Return the predicted cards in place at the end of the round.'''
+        return sum(w * f for w, f in zip(self._weights, features(board)))
+
+    def moveValue(self, board, move):
+        '''Return the value of the board after the move, or None if it
+        cannot be made.'''
+        feats = moveFeatures(board, move)
+        if feats is None:
+            return None
+        return sum(w * f for w, f in zip(self._weights, feats))
+
+    def best(self, board, moves, rng=None):
+        '''Return the move with the highest value, or None if none can be
+        made.  Ties are broken with rng.choice(), or by taking the first
+        one if rng is None.  The board is left as it was.
+
+        A 2 in column 0 is only moved to another row if that puts more
+        cards in place: otherwise it could be moved back and forth
+        forever.  (There is always another move then: a row starting
+        with a gap means a 2 is somewhere else.)'''
+        inPlace = None
+        bestValue = None
+        bestMoves = []
+        for move in moves:
+            feats = moveFeatures(board, move)
+            if feats is None:
+                continue
+            if move[2] == 0 and move[0].getNum() == 2:
+                if inPlace is None:
+                    inPlace = board.countCardsInPlace()
+                if feats[0] <= inPlace:
+                    continue
+            value = sum(w * f for w, f in zip(self._weights, feats))
+            if bestValue is None or value > bestValue:
+                bestValue = value
+                bestMoves = [move]
+            elif value == bestValue:
+                bestMoves.append(move)
+        if not bestMoves:
+            return None
+        if rng is None:
+            return bestMoves[0]
+        return rng.choice(bestMoves)
+
+    def toDict(self, **info):
+        '''Return the weights as a dict for WEIGHTS_FILE, with the given
+        extra information (how they were trained, etc.).'''
+        res = {'version': VERSION, 'features': FEATURES,
+               'weights': self._weights}
+        res.update(info)
+        return res
+
+    @staticmethod
+    def fromDict(d):
+        if d.get('version') != VERSION or d.get('features') != FEATURES:
+            raise ValueError("weights are for other features")
+        return Evaluator(d['weights'])
+
+    @staticmethod
+    def fromString(text):
+        return Evaluator.fromDict(json.loads(text))
+
+
+def loadEvaluator(path=WEIGHTS_FILE):
+    '''Return the Evaluator saved in the given file.'''
+    with open(path) as f:
+        return Evaluator.fromString(f.read())
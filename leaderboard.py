@@ -0,0 +1,109 @@
+'''The high scores of the browser game, kept in one local storage record.
+
+A Leaderboard holds the best MAX_SCORES games, best first, and the best
+score for each of the MAX_SEEDS seeds played most recently (so Repeat Game
+can show the score to beat).  Each game is an Entry: its score, when it
+was played (ms since 1970), its seed and the number of rounds.
+
+It is read from storage once, when the page loads, and written once per
+finished game, with toString() / fromString().
+'''
+
+import bisect
+import json
+
+VERSION = 1
+MAX_SCORES = 100
+MAX_SEEDS = 100
+
+
+class Entry:
+    '''One finished game.  Entries sort best first: highest score, then
+    fewest rounds, then earliest.'''
+
+    def __init__(self, score, when, seed, rounds):
+        self.score = score
+        self.when = when
+        self.seed = seed
+        self.rounds = rounds
+
+    def _key(self):
+        return (-self.score, self.rounds, self.when)
+
+    def __lt__(self, other):
+        return self._key() < other._key()
+
+    def toList(self):
+        return [self.score, self.when, self.seed, self.rounds]
+
+
+class Leaderboard:
+    '''The best scores, and the best score of each recent seed.'''
+
+    def __init__(self, maxScores=MAX_SCORES, maxSeeds=MAX_SEEDS):
+        self._maxScores = maxScores
+        self._maxSeeds = maxSeeds
+        # Sorted, best first.
+        self._entries = []
+        # seed -> best Entry for it, least recently played first.
+        self._bestBySeed = {}
+
+    def add(self, score, when, seed, rounds):
+        '''Add a finished game.  Return its rank in the top scores (0 for
+        the best), or None if it did not make it.  seed may be None if it
+        is not known.'''
+        entry = Entry(score, when, seed, rounds)
+
+        if seed is not None:
+            best = self._bestBySeed.pop(seed, None)
+            if best is None or entry < best:
+                best = entry
+            self._bestBySeed[seed] = best
+            if len(self._bestBySeed) > self._maxSeeds:
+                del self._bestBySeed[next(iter(self._bestBySeed))]
+
+        rank = bisect.bisect_right(self._entries, entry)
+        if rank >= self._maxScores:
+            return None
+        self._entries.insert(rank, entry)
+        del self._entries[self._maxScores:]
+        return rank
+
+    def top(self, n=None):
+        '''Return the best n entries (all by default).'''
+        return self._entries[:n]
+
+    def topScores(self, n):
+        '''Return the best n scores, padded with 0s.'''
+        scores = [entry.score for entry in self._entries[:n]]
+        return scores + [0] * (n - len(scores))
+
+    def bestForSeed(self, seed):
+        '''Return the best Entry for the given seed, or None if it was not
+        played recently.'''
+        return self._bestBySeed.get(seed)
+
+    def toString(self):
+        return json.dumps({
+            'version': VERSION,
+            'top': [entry.toList() for entry in self._entries],
+            'seeds': [entry.toList() for entry in self._bestBySeed.values()],
+        }, separators=(',', ':'))
+
+    @staticmethod
+    def fromString(s, maxScores=MAX_SCORES, maxSeeds=MAX_SEEDS):
+        '''Parse a string made by toString().  Raise ValueError if it is
+        not one.'''
+        try:
+            data = json.loads(s)
+            if data['version'] != VERSION:
+                raise ValueError("unknown leaderboard version")
+            res = Leaderboard(maxScores, maxSeeds)
+            res._entries = sorted(Entry(*fields) for fields in data['top'])
+            del res._entries[maxScores:]
+            for fields in data['seeds'][-maxSeeds:]:
+                entry = Entry(*fields)
+                res._bestBySeed[entry.seed] = entry
+        except (KeyError, TypeError) as e:
+            raise ValueError("bad leaderboard: %s" % e)
+        return res
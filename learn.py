@@ -0,0 +1,253 @@
+'''Fitting the weights of heuristic.py's move evaluation from simulated
+games.
+
+The weights are fitted by approximate policy iteration: games are played
+by a player that makes a random move with chance EPSILON and otherwise
+the move the current weights like best (greedy moves in the first
+iteration, before there are any weights).  The features of the board
+after each move are recorded with the number of cards in place at the
+end of that round, and the weights are fitted to predict it by ridge
+regression (with NumPy if it is installed, else in plain Python: there
+are only a few features).  Each iteration's weights are then tried on
+other seeds, and the ones with the best mean score are saved.
+
+    python learn.py train [--games 1000] [--iterations 4] [--out hintweights.json]
+    python learn.py eval [--weights hintweights.json] [--games 500]
+
+eval plays the same games with the learned and the greedy policies,
+compares their scores, and times the evaluation of a move.
+'''
+
+import argparse
+import json
+import multiprocessing
+import random
+import sys
+import time
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from bench import MIN_CALLS, REPEAT, positions, timeCalls
+from game import *
+from heuristic import FEATURES, WEIGHTS_FILE, Evaluator, loadEvaluator, \
+    moveFeatures
+from policy import MAX_ROUNDS, BoardView, LearnedPolicy, getPolicy
+from stats import GameStats, playGames
+
+DEFAULT_GAMES = 1000
+DEFAULT_ITERATIONS = 4
+DEFAULT_EVAL_GAMES = 500
+# Chance of a random move while generating games.
+EPSILON = 0.1
+# Weight of the penalty on large weights (not on the bias).
+RIDGE = 1.0
+# The games the weights are tried on start at this seed, well away from
+# the ones they are fitted on.
+EVAL_FIRST_SEED = 1000000
+# Games played by each task given to the worker processes.
+CHUNK_SIZE = 50
+
+
+def selfPlay(seed, evaluator, epsilon, rng):
+    '''Play the game with the given seed and return a (features, cards in
+    place at the end of the round) pair for each move made.'''
+    game = Game(seed)
+    board = game.getBoard()
+    view = BoardView(board)
+    greedy = getPolicy("greedy")
+    res = []
+    roundFeatures = []
+    while not game.isDone() and game.getRoundNum() <= MAX_ROUNDS:
+        if game.isRoundOver():
+            inPlace = board.countCardsInPlace()
+            res.extend((feats, inPlace) for feats in roundFeatures)
+            roundFeatures = []
+            game.nextRound()
+            continue
+        moves = game.playableCards()
+        if rng.random() < epsilon:
+            move = rng.choice(moves)
+        elif evaluator is None:
+            move = greedy.choose(view, moves, rng)
+        else:
+            move = evaluator.best(board, moves, rng)
+        roundFeatures.append(moveFeatures(board, move))
+        game.moveCard(move[0])
+    inPlace = board.countCardsInPlace()
+    res.extend((feats, inPlace) for feats in roundFeatures)
+    return res
+
+
+def _selfPlayChunk(args):
+    firstSeed, numGames, weights, epsilon = args
+    evaluator = None if weights is None else Evaluator(weights)
+    res = []
+    for seed in range(firstSeed, firstSeed + numGames):
+        res.extend(selfPlay(seed, evaluator, epsilon, random.Random(seed)))
+    return res
+
+
+def _solve(a, b):
+    '''Solve a x = b by Gaussian elimination with partial pivoting.'''
+    n = len(b)
+    m = [list(row) + [b[i]] for i, row in enumerate(a)]
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda row: abs(m[row][col]))
+        m[col], m[pivot] = m[pivot], m[col]
+        for row in range(col + 1, n):
+            factor = m[row][col] / m[col][col]
+            for k in range(col, n + 1):
+                m[row][k] -= factor * m[col][k]
+    x = [0.0] * n
+    for row in range(n - 1, -1, -1):
+        x[row] = (m[row][n] - sum(m[row][k] * x[k]
+                                  for k in range(row + 1, n))) / m[row][row]
+    return x
+
+
+def fit(samples, ridge=RIDGE):
+    '''Return the weights that best predict the targets from the features
+    of the (features, target) samples: they minimize the squared error
+    plus ridge times the sum of the squared weights, bias excepted.'''
+    n = len(FEATURES)
+    bias = FEATURES.index("bias")
+    if numpy is not None:
+        x = numpy.array([feats for feats, target in samples], dtype=float)
+        y = numpy.array([target for feats, target in samples], dtype=float)
+        penalty = numpy.full(n, float(ridge))
+        penalty[bias] = 0.0
+        return numpy.linalg.solve(x.T @ x + numpy.diag(penalty),
+                                  x.T @ y).tolist()
+    # The normal equations: (X'X + ridge I) w = X'y.
+    a = [[0.0] * n for _ in range(n)]
+    b = [0.0] * n
+    for feats, target in samples:
+        for i in range(n):
+            fi = feats[i]
+            if fi:
+                b[i] += fi * target
+                row = a[i]
+                for j in range(n):
+                    row[j] += fi * feats[j]
+    for i in range(n):
+        if i != bias:
+            a[i][i] += ridge
+    return _solve(a, b)
+
+
+def _evalChunk(args):
+    firstSeed, numGames, policy = args
+    return playGames(firstSeed, numGames, policy).toDict()
+
+
+def evaluate(policy, firstSeed, numGames, pool):
+    '''Play the games with the given policy and return their GameStats.'''
+    stats = GameStats()
+    chunks = [(seed, min(CHUNK_SIZE, firstSeed + numGames - seed), policy)
+              for seed in range(firstSeed, firstSeed + numGames, CHUNK_SIZE)]
+    for partial in pool.imap_unordered(_evalChunk, chunks):
+        stats.merge(GameStats.fromDict(partial))
+    return stats
+
+
+def train(numGames=DEFAULT_GAMES, iterations=DEFAULT_ITERATIONS,
+          evalGames=DEFAULT_EVAL_GAMES, epsilon=EPSILON, ridge=RIDGE,
+          workers=None, log=sys.stderr):
+    '''Return the best Evaluator found and a dict saying how it was
+    trained.  Each iteration plays numGames new games.'''
+    best = None
+    weights = None
+    with multiprocessing.Pool(workers) as pool:
+        for iteration in range(iterations):
+            start = time.perf_counter()
+            firstSeed = iteration * numGames
+            chunks = [(seed, min(CHUNK_SIZE, firstSeed + numGames - seed),
+                       weights, epsilon)
+                      for seed in range(firstSeed, firstSeed + numGames,
+                                        CHUNK_SIZE)]
+            samples = []
+            for part in pool.imap_unordered(_selfPlayChunk, chunks):
+                samples.extend(part)
+            weights = fit(samples, ridge)
+            stats = evaluate(LearnedPolicy(weights), EVAL_FIRST_SEED,
+                             evalGames, pool)
+            score = stats.metrics['score'].moments.mean
+            rounds = stats.metrics['rounds'].moments.mean
+            if log is not None:
+                print("iteration %d: %d moves, mean score %.1f, rounds %.2f "
+                      "(%.1f s)" % (iteration + 1, len(samples), score,
+                                    rounds, time.perf_counter() - start),
+                      file=log)
+            if best is None or score > best[1]:
+                best = (weights, score, rounds, iteration + 1)
+    weights, score, rounds, iteration = best
+    info = {'iteration': iteration, 'gamesPerIteration': numGames,
+            'epsilon': epsilon, 'ridge': ridge, 'evalGames': evalGames,
+            'meanScore': round(score, 2), 'meanRounds': round(rounds, 3)}
+    return Evaluator([round(w, 6) for w in weights]), info
+
+
+def timeEvaluation(evaluator, seeds=range(20)):
+    '''Return the mean time (s) of evaluator.moveValue() over the moves
+    that can be made in the middle of some seeded games.'''
+    middle, end = positions(seeds)
+    moves = [(board, move) for board in middle
+             for move in board.findPlayableCards()]
+    return timeCalls(lambda: moves, evaluator.moveValue, MIN_CALLS, REPEAT)
+
+
+def compare(evaluator, numGames, workers=None):
+    '''Print the scores of the learned and the greedy policies on the
+    same games, and how long a move takes to evaluate.'''
+    print("%-10s %10s %10s %10s %10s" %
+          ("policy", "score", "stddev", "rounds", "finished"))
+    with multiprocessing.Pool(workers) as pool:
+        for name, policy in (("learned", LearnedPolicy(evaluator.getWeights())),
+                             ("greedy", getPolicy("greedy"))):
+            stats = evaluate(policy, EVAL_FIRST_SEED, numGames, pool)
+            score = stats.metrics['score'].moments
+            print("%-10s %10.1f %10.1f %10.2f %10d" %
+                  (name, score.mean, score.stddev(),
+                   stats.metrics['rounds'].moments.mean, stats.finished))
+    print("%.2f us per move evaluated" % (timeEvaluation(evaluator) * 1e6))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Fit the weights of the learned move evaluation.")
+    parser.add_argument("--workers", type=int,
+                        help="processes (default: one per CPU)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    trainCmd = commands.add_parser("train", help="fit the weights")
+    trainCmd.add_argument("--games", type=int, default=DEFAULT_GAMES,
+                          help="games played per iteration")
+    trainCmd.add_argument("--iterations", type=int, default=DEFAULT_ITERATIONS)
+    trainCmd.add_argument("--eval-games", type=int, default=DEFAULT_EVAL_GAMES)
+    trainCmd.add_argument("--epsilon", type=float, default=EPSILON)
+    trainCmd.add_argument("--ridge", type=float, default=RIDGE)
+    trainCmd.add_argument("--out", default=WEIGHTS_FILE)
+    evalCmd = commands.add_parser("eval", help="compare with greedy play")
+    evalCmd.add_argument("--weights", default=WEIGHTS_FILE)
+    evalCmd.add_argument("--games", type=int, default=DEFAULT_EVAL_GAMES)
+    args = parser.parse_args()
+
+    if args.command == "train":
+        evaluator, info = train(args.games, args.iterations, args.eval_games,
+                                args.epsilon, args.ridge, args.workers)
+        with open(args.out, "w") as f:
+            json.dump(evaluator.toDict(**info), f, indent=1)
+            f.write("\n")
+        return
+
+    try:
+        evaluator = loadEvaluator(args.weights)
+    except (OSError, ValueError) as e:
+        sys.exit(e)
+    compare(evaluator, args.games, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,24 @@
+import json
+import random
+
+from perf import perf, now
+
+# Everything until here: downloading and starting Brython, and this module.
+perf.record("page load", 0)
+_imports_start = now()
+
 from browser import document, html, timer, window, template, local_storage
 
 from card import Card, Deck
 from board import Board
+from game import roundRng, MAX_SEED
+from leaderboard import Leaderboard
+from savegame import SavedGame, UndoState
+from sound import SoundBoard
+from heuristic import Evaluator, WEIGHTS_FILE
+from assets import AssetScheduler, CARDS, UI, IDLE
+
+perf.record("main imports", _imports_start)
 
 # So we don't have to type window.fabric.xxx so much.
 fabric = window.fabric
@@ -20,6 +37,7 @@ CARD_WIDTH = 75
 CARD_HEIGHT = 109
 CARDS_IN_PLACE_COLOR = "cyan"
 MOVABLE_CARD_COLOR = "yellow"
+HINT_COLOR = "magenta"
 
 BASE_CANVAS_WIDTH = CARD_AREA_WIDTH * 13 + CARD_PADDING / 2
 BASE_CANVAS_HEIGHT = CARD_AREA_HEIGHT * 4 + CARD_PADDING / 2
@@ -39,6 +57,20 @@ CARD_SOURCES = [
     "Playing_Cards/SVG-simple-cards/",
 ]
 
+# Cards dealt per second; can be changed with the "dealRate" storage key.
+DEAL_RATE = 50
+# How long (ms) to show only the cards in place before dealing a new round.
+NEXT_ROUND_PAUSE = 1000
+
+# The game in progress is saved under this storage key, at most once per
+# SAVE_DELAY ms, and when the page is hidden or closed.
+SAVE_KEY = "savedGame"
+SAVE_DELAY = 500
+
+# All the high scores are kept under this storage key (see leaderboard.py).
+LEADERBOARD_KEY = "leaderboard"
+NUM_HIGH_SCORES_SHOWN = 5
+
 
 class CardImg:
     """This class encapsulates an image to represent a card, reading the
@@ -63,6 +95,10 @@ class CardImg:
     }
     TRANSLATE_SUIT = {"D": "diamonds", "H": "hearts", "C": "clubs", "S": "spades"}
 
+    # Device pixels per canvas unit that images are rasterized at: kept up
+    # to date by the RasterCache.
+    raster_scale = 1
+
     def __init__(self, card: Card, canv):
         """Constructor: creates the image for the given card and the
         rectangle highlight outline.
@@ -77,10 +113,13 @@ class CardImg:
 
         self._loaded = False
         self._displayed = False
-
-        # Use 0th card source by default
-        fabric.Image.fromURL(CARD_SOURCES[0] + self._image_name, self._onload)
         self._draw_when_loaded = False
+        # called once the image first loads: see load().
+        self._load_done = None
+        # True while a move() animation is running, and what to call when
+        # it ends: see whenStill().
+        self._moving = False
+        self._when_still = []
 
         self._outline = fabric.Rect.new(
             {
@@ -93,17 +132,58 @@ class CardImg:
         )
         self._outline_displayed = False
 
-    def _onload(self, img, bogusBoolean):
+    def load(self, done=None):
+        """Start loading the image from the 0th card source, and call done()
+        when it has loaded (or failed to).  Called by the App's
+        AssetScheduler."""
+        self._load_done = done
+        fabric.Image.fromURL(CARD_SOURCES[0] + self._image_name, self._onload)
+
+    def _onload(self, img, isError):
+        if isError:
+            # fabric calls back with an empty image.  Don't hold up the
+            # AssetScheduler: the rest of the page still has to load.
+            print("could not load card image", self._image_name)
+            self._finishLoad()
+            return
         self._loaded = True
         self._img = img
-        self._img.scaleToWidth(CARD_WIDTH)
+        # The SVG image, kept to rasterize again when the zoom changes.
+        self._svg_elem = img.getElement()
         self._img.selectable = False
+        self._img.objectCaching = False
+        self.rasterize(CardImg.raster_scale)
         if self._draw_when_loaded:
             self._img.left = self._curr_x
             self._img.top = self._curr_y
             self._canv.add(self._img)
             self._displayed = True
             self._draw_when_loaded = False
+        self._finishLoad()
+
+    def _finishLoad(self):
+        if self._load_done is not None:
+            self._load_done()
+            self._load_done = None
+
+    def rasterize(self, pixels):
+        """Draw the SVG image once into a bitmap with the given number of
+        device pixels per canvas unit, and display that instead, so fabric
+        draws the card with a plain copy rather than rendering the SVG."""
+        if not self._loaded:
+            return
+        src = self._svg_elem
+        width = max(1, int(CARD_WIDTH * pixels))
+        height = max(1, int(width * src.naturalHeight / src.naturalWidth))
+        bitmap = document.createElement("canvas")
+        bitmap.width = width
+        bitmap.height = height
+        bitmap.getContext("2d").drawImage(src, 0, 0, width, height)
+        self._img.setElement(bitmap)
+        self._img.scaleToWidth(CARD_WIDTH)
+        if self._displayed:
+            # on whichever canvas it is: the main one or the StaticLayer.
+            self._canv.requestRenderAll()
 
     def drawOnCanvas(self, x, y):
         self._curr_x = x
@@ -139,7 +219,11 @@ class CardImg:
 
     def erase(self):
         """remove the drawing of the card on the canvas"""
-        self._canv.remove(self._img)
+        if self._loaded:
+            self._canv.remove(self._img)
+        else:
+            # Not drawn yet: don't draw it when it loads.
+            self._draw_when_loaded = False
         self._displayed = False
         self.eraseOutline()
 
@@ -157,12 +241,39 @@ class CardImg:
     def move(self, destx, desty):
         self._curr_x = destx
         self._curr_y = desty
+        if not self._loaded:
+            # It is drawn at the new place when it loads.
+            self.eraseOutline()
+            return
+        self._moving = True
         self._img.animate(
             {"left": destx, "top": desty},
-            {"duration": 100, "onChange": self._canv.renderAll.bind(self._canv)},
+            {
+                "duration": 100,
+                "onChange": self._canv.renderAll.bind(self._canv),
+                "onComplete": self._onMoved,
+            },
         )
         self.eraseOutline()
 
+    def _onMoved(self, *args):
+        self._moving = False
+        callbacks = self._when_still
+        self._when_still = []
+        for callback in callbacks:
+            callback()
+
+    def isMoving(self):
+        return self._moving
+
+    def whenStill(self, callback):
+        """Call callback() once the move() animation in progress ends, or
+        right away if there is none."""
+        if self._moving:
+            self._when_still.append(callback)
+        else:
+            callback()
+
     def bounceBack(self, *args):
         self._img.animate(
             "top",
@@ -184,6 +295,17 @@ class CardImg:
             },
         )
 
+    def setCanvas(self, canv):
+        """Move the image (and outline, if shown) to the given fabric
+        canvas; all drawing from then on is done on that canvas."""
+        if self._displayed:
+            self._canv.remove(self._img)
+            canv.add(self._img)
+        if self._outline_displayed:
+            self._canv.remove(self._outline)
+            canv.add(self._outline)
+        self._canv = canv
+
     def switchCardImage(self, new_idx):
         """switch to the given card source image"""
         self._canv.remove(self._img)
@@ -191,6 +313,234 @@ class CardImg:
         fabric.Image.fromURL(CARD_SOURCES[new_idx] + self._image_name, self._onload)
 
 
+def prefetchImages(urls, done):
+    """Load the images at the given urls into the browser cache, and call
+    done() once they have all loaded (or failed to)."""
+    remaining = [len(urls)]
+
+    def loaded(ev):
+        remaining[0] -= 1
+        if remaining[0] == 0:
+            done()
+
+    for url in urls:
+        img = html.IMG()
+        img.bind("load", loaded)
+        img.bind("error", loaded)
+        img.src = url
+
+
+class RasterCache:
+    """Keeps every card image rasterized at the canvas's current zoom times
+    the device pixel ratio (see CardImg.rasterize()).  After a resize the
+    images are redone a few at a time while the browser is idle; until then
+    the old bitmaps are drawn, just scaled.
+    """
+
+    # Cards to rasterize per idle callback.
+    BATCH = 8
+
+    def __init__(self, cardimgs, scale):
+        self._cardimgs = list(cardimgs)
+        self._todo = []
+        self._scheduled = False
+        CardImg.raster_scale = scale * (window.devicePixelRatio or 1)
+
+    def setScale(self, scale):
+        pixels = scale * (window.devicePixelRatio or 1)
+        if pixels == CardImg.raster_scale and not self._todo:
+            return
+        CardImg.raster_scale = pixels
+        self._todo = list(self._cardimgs)
+        self._schedule()
+
+    def _schedule(self):
+        if self._scheduled:
+            return
+        self._scheduled = True
+        if hasattr(window, "requestIdleCallback"):
+            window.requestIdleCallback(self._work)
+        else:
+            timer.set_timeout(self._work, 0)
+
+    def _work(self, *args):
+        self._scheduled = False
+        for cardimg in self._todo[: self.BATCH]:
+            cardimg.rasterize(CardImg.raster_scale)
+        self._todo = self._todo[self.BATCH :]
+        if self._todo:
+            self._schedule()
+
+
+class StaticLayer:
+    """The cards locked in place (and their outlines) never move within a
+    round, so they are moved off the main canvas onto an offscreen fabric
+    canvas, which is drawn as the main canvas's background image.  Each
+    render of the main canvas then draws one image for all of them, and
+    only has to go through the cards that can still move.
+
+    The offscreen canvas is drawn at the main canvas's zoom times the
+    device pixel ratio, so it stays sharp.  Anything drawn on it (e.g., a
+    bounce) is passed on by re-rendering the main canvas.
+    """
+
+    def __init__(self, canv, scale):
+        self._canv = canv
+        # CardImgs moved onto the layer.
+        self._cardimgs = []
+        # Bumped by invalidate(), so a card still moving when add() was
+        # called is not added after all once the layer has been cleared.
+        self._generation = 0
+
+        self._elem = document.createElement("canvas")
+        self._layer = fabric.StaticCanvas.new(
+            self._elem, {"enableRetinaScaling": False, "selectable": False}
+        )
+        self._layer.on("after:render", lambda *args: self._canv.requestRenderAll())
+        # Not cached by fabric: the element changes under it.
+        self._image = fabric.Image.new(
+            self._elem,
+            {"left": 0, "top": 0, "selectable": False, "objectCaching": False},
+        )
+        self.setScale(scale)
+        self._canv.setBackgroundImage(self._image)
+
+    def setScale(self, scale):
+        """Redraw the layer for the main canvas's new zoom."""
+        pixels = scale * (window.devicePixelRatio or 1)
+        width = int(BASE_CANVAS_WIDTH * pixels)
+        height = int(BASE_CANVAS_HEIGHT * pixels)
+        self._layer.setDimensions({"width": width, "height": height})
+        self._layer.setZoom(pixels)
+        self._image.set(
+            {"width": width, "height": height, "scaleX": 1 / pixels, "scaleY": 1 / pixels}
+        )
+        self._layer.requestRenderAll()
+
+    def add(self, cardimgs):
+        """Move the given CardImgs onto the layer, if not already there.
+        A card still moving into place is added when its move ends: its
+        animation only re-renders the canvas it started on."""
+        self._layer.renderOnAddRemove = False
+        for cardimg in cardimgs:
+            if cardimg in self._cardimgs:
+                continue
+            if cardimg.isMoving():
+                cardimg.whenStill(
+                    lambda c=cardimg, gen=self._generation: self._addLater(c, gen)
+                )
+                continue
+            cardimg.setCanvas(self._layer)
+            self._cardimgs.append(cardimg)
+        self._layer.renderOnAddRemove = True
+        self._layer.requestRenderAll()
+
+    def _addLater(self, cardimg, generation):
+        if generation == self._generation:
+            self.add([cardimg])
+
+    def invalidate(self):
+        """Move all the CardImgs back onto the main canvas."""
+        self._generation += 1
+        if not self._cardimgs:
+            return
+        self._layer.renderOnAddRemove = False
+        for cardimg in self._cardimgs:
+            cardimg.setCanvas(self._canv)
+        self._cardimgs = []
+        self._layer.renderOnAddRemove = True
+        self._layer.requestRenderAll()
+
+
+class DealAnimator:
+    """Deals card images onto the canvas from a queue, at a fixed number
+    of cards per second, all driven by one requestAnimationFrame loop.
+    A deal can be skipped, which draws all the remaining cards at once;
+    either way onComplete is called as soon as the last card is down.
+    """
+
+    def __init__(self, canv, rate=DEAL_RATE):
+        self._canv = canv
+        self._rate = rate
+        # (cardimg, x, y) still to be dealt.
+        self._queue = []
+        self._onComplete = None
+        self._frameId = None
+        self._start = None
+        self._delay = 0
+        self._dealt = 0
+
+    def setRate(self, rate):
+        self._rate = rate
+
+    def isDealing(self):
+        return self._frameId is not None
+
+    def deal(self, items, onComplete=None, delay=0):
+        """Deal the (cardimg, x, y) items in order, starting after delay ms,
+        then call onComplete().  Any deal in progress is dropped."""
+        self.cancel()
+        self._queue = list(items)
+        self._onComplete = onComplete
+        self._delay = delay
+        self._start = None
+        self._dealt = 0
+        self._frameId = window.requestAnimationFrame(self._onFrame)
+
+    def wait(self, ms, onComplete):
+        """Call onComplete() after ms, or as soon as skip() is called."""
+        self.deal([], onComplete, ms)
+
+    def cancel(self):
+        """Stop dealing, without drawing the rest or calling onComplete."""
+        if self._frameId is not None:
+            window.cancelAnimationFrame(self._frameId)
+            self._frameId = None
+        self._queue = []
+        self._onComplete = None
+
+    def skip(self, *args):
+        """Deal all the remaining cards right now."""
+        if self._frameId is None:
+            return
+        window.cancelAnimationFrame(self._frameId)
+        self._drawUpTo(self._dealt + len(self._queue))
+        self._finish()
+
+    def _onFrame(self, timestamp):
+        if self._start is None:
+            self._start = timestamp
+        elapsed = timestamp - self._start - self._delay
+        if elapsed >= 0:
+            # The first card goes down right away, then 1 every 1/rate s.
+            self._drawUpTo(int(elapsed * self._rate / 1000) + 1)
+        if self._queue:
+            self._frameId = window.requestAnimationFrame(self._onFrame)
+        elif elapsed >= 0:
+            self._finish()
+        else:
+            self._frameId = window.requestAnimationFrame(self._onFrame)
+
+    def _drawUpTo(self, total):
+        if self._dealt >= total or not self._queue:
+            return
+        # Draw this frame's cards with one render, not one per card.
+        self._canv.renderOnAddRemove = False
+        while self._queue and self._dealt < total:
+            cardimg, x, y = self._queue.pop(0)
+            cardimg.drawOnCanvas(x, y)
+            self._dealt += 1
+        self._canv.renderOnAddRemove = True
+        self._canv.requestRenderAll()
+
+    def _finish(self):
+        self._frameId = None
+        onComplete = self._onComplete
+        self._onComplete = None
+        if onComplete is not None:
+            onComplete()
+
+
 class BoardGui:
     """Handle layout of cards on the board."""
 
@@ -198,12 +548,17 @@ class BoardGui:
         self._board = board
         self._canv = canv
         self._card2ImgDict = card2ImgDict
+        self._dealer = DealAnimator(canv)
+        self._staticLayer = StaticLayer(canv, _initial_scale)
+        self._rasterCache = RasterCache(card2ImgDict.values(), _initial_scale)
 
         # default, start with the 0th set of cards.
         self._which_card_source = 0
 
     def clear(self):
         """remove all cards from the canvas"""
+        self._dealer.cancel()
+        self._staticLayer.invalidate()
         for ridx in range(4):
             for cidx in range(13):
                 card = self._board.getCardAt(ridx, cidx)
@@ -212,22 +567,12 @@ class BoardGui:
                 cardimg = self._card2ImgDict[id(card)]
                 cardimg.erase()
 
-    def displayLayout(self):
-        """Go through the cards on the board object and lay them
-        out on the canvas.  Translation of the Card object to its
-        corresponding CardImg object is done through the given
-        card2ImgDict dictionary.
+    def _layoutItems(self):
+        """Return a (cardimg, x, y) tuple for each card on the board.
+        Translation of the Card object to its corresponding CardImg object
+        is done through the given card2ImgDict dictionary.
         """
-
-        # return the closure so it can be called with no parameters
-        # from set_timeout() below.
-        def displayCard(cardimg, x, y):
-            def inner():
-                cardimg.drawOnCanvas(x, y)
-
-            return inner
-
-        delay_time = 100
+        items = []
         for ridx in range(4):
             for cidx in range(13):
                 card = self._board.getCardAt(ridx, cidx)
@@ -237,8 +582,44 @@ class BoardGui:
                 cardimg = self._card2ImgDict[id(card)]
                 x = CARD_PADDING + cidx * CARD_AREA_WIDTH
                 y = CARD_PADDING + ridx * CARD_AREA_HEIGHT
-                timer.set_timeout(displayCard(cardimg, x, y), delay_time)
-                delay_time += 20
+                items.append((cardimg, x, y))
+        return items
+
+    def displayLayout(self, onComplete=None):
+        """Go through the cards on the board object and deal them
+        out on the canvas, one by one, then call onComplete().
+        """
+        perf.begin("deal")
+
+        def dealt():
+            perf.end("deal")
+            if onComplete is not None:
+                onComplete()
+
+        self._dealer.deal(self._layoutItems(), dealt)
+
+    def showLayout(self):
+        """Draw all the cards on the board at once, without dealing."""
+        self._dealer.cancel()
+        self._canv.renderOnAddRemove = False
+        for cardimg, x, y in self._layoutItems():
+            cardimg.drawOnCanvas(x, y)
+        self._canv.renderOnAddRemove = True
+        self._canv.requestRenderAll()
+
+    def isDealing(self):
+        return self._dealer.isDealing()
+
+    def skipDeal(self):
+        """Finish the deal (or pause) in progress right away."""
+        self._dealer.skip()
+
+    def pause(self, ms, onComplete):
+        """Call onComplete() after ms, unless skipDeal() is called first."""
+        self._dealer.wait(ms, onComplete)
+
+    def setDealRate(self, rate):
+        self._dealer.setRate(rate)
 
     def moveCard(self, card, toRow, toCol):
         """Move a cardimg from where it is not to the given
@@ -256,6 +637,19 @@ class BoardGui:
         desty = CARD_PADDING + row * CARD_AREA_HEIGHT
         cardimg.drawOnCanvas(destx, desty)
 
+    def cacheCardsInPlace(self, cards):
+        """Draw the given cards, which are in place, on the static layer."""
+        self._staticLayer.add([self._card2ImgDict[id(card)] for card in cards])
+
+    def invalidateCardsInPlace(self):
+        """Put all the cards back on the main canvas: call before any card
+        that was in place is moved or erased."""
+        self._staticLayer.invalidate()
+
+    def setScale(self, scale):
+        self._rasterCache.setScale(scale)
+        self._staticLayer.setScale(scale)
+
     def switchCardImages(self, *args):
         # Go to the next card source
         self._which_card_source = (self._which_card_source + 1) % len(CARD_SOURCES)
@@ -285,23 +679,36 @@ class App:
         create all the buttons and labels to allow the user to manipulate the game.
         """
 
+        perf.begin("app init")
         self._doc = document
         self._canv = canv  # fabric Canvas object
         self._resize_timer = None
         self._undo_state = None
 
+        if perf.enabled:
+            # Time every move; left out entirely when not debugging.
+            self.onCardClick = self._timedCardClick
         self._canv.on("mouse:up", self.onCardClick)
 
-        self.loadCardMoveSound()
-        self.loadCardInPlaceSound()
-        self.loadEndOfRoundSound()
-        self.loadFanfareSound()
+        # Everything is loaded through here, so the first deal goes first.
+        self._assets = AssetScheduler()
+
+        # All sounds come from one sprite, decoded once with Web Audio.
+        # It is not loaded until the cards are (see loadSecondaryAssets()).
+        self._sounds = SoundBoard()
         self._playSounds = True
 
         self._board = Board()
+        # Each round's deal comes from the seed, so a game can be repeated
+        # (and saved) by its seed.
+        self._seed = random.randrange(MAX_SEED)
         self._deck = Deck()
-        self._deck.addAllCards()
-        self._copyOfDeck = self._deck.makeCopy()
+        self._deck.addAllCards(roundRng(self._seed, 1))
+        # All the cards, by ordinal.
+        self._cards = sorted(self._deck.getCards(), key=Card.getOrdinal)
+        self._save_timer = None
+        # Set once the card images for the first deal have all loaded.
+        self._cardsLoaded = False
 
         # We'll fill this in when we remove the aces from the board.
         self._removedAces = []
@@ -310,12 +717,17 @@ class App:
         # (card, row, col)
         self._moveableCards = []
 
+        # Picks the move to suggest when Hint is clicked, once its weights
+        # are loaded.
+        self._hinter = None
+        self._hintWanted = False
+
         # A mapping from card object to CardImg object.  We do it this way
         # so that the card object (in the model) remains agnostic of the view
         # being used on it.
         self._card2ImgDict = {}
 
-        self._score = 0
+        self._leaderboard = Leaderboard()
         # a list of templates of high scores we can update when high scores
         # change, so the screen changes immediately
         self._score_val = []
@@ -377,6 +789,10 @@ class App:
         self._undo_btn.bind("click", self.undoMove)
         self._game_info2_elem <= self._undo_btn
 
+        self._hint_btn = html.BUTTON("Hint", Class="button")
+        self._hint_btn.bind("click", self.showHint)
+        self._game_info2_elem <= self._hint_btn
+
         self._status_elem = html.SPAN("{status}")
         self._game_info2_elem <= self._status_elem
         self._status_val = template.Template(self._status_elem)
@@ -398,16 +814,32 @@ class App:
         for card in cards:
             cardimg = CardImg(card, self._canv)
             self._card2ImgDict[id(card)] = cardimg
+            self._assets.add("card " + cardimg._image_name, CARDS, cardimg.load)
 
         self._boardGui = BoardGui(self._board, self._canv, self._card2ImgDict)
+        self._boardGui.setDealRate(self._dealRate)
 
         self._switch_button = html.BUTTON("Switch Deck", Class="button")
         self._switch_button.bind("click", self._boardGui.switchCardImages)
         self._game_info2_elem <= self._switch_button
 
-        self.loadHighScores()
+        if perf.enabled:
+            self._perf_button = html.BUTTON("Perf JSON", Class="button")
+            self._perf_button.bind("click", perf.download)
+            self._game_info2_elem <= self._perf_button
 
-        self.initNewGame()
+        self._assets.add("high scores", UI, self.loadHighScores)
+        self.loadSecondaryAssets()
+
+        if not self.restoreGame():
+            self.initNewGame()
+        document.bind("visibilitychange", self.onVisibilityChange)
+        window.bind("pagehide", self.flushSave)
+        perf.begin("card images")
+        self._assets.onCardsLoaded(lambda: perf.end("card images"))
+        self._assets.onCardsLoaded(self.cardsLoaded)
+        self._assets.start()
+        perf.end("app init")
 
     def initNewGame(self):
 
@@ -417,7 +849,9 @@ class App:
 
         self._board.layoutCards(self._deck)
 
-        self._boardGui.displayLayout()
+        self._moveableCards = []
+        # Remove the aces as soon as all the cards are down.
+        self._boardGui.displayLayout(self.removeAces)
         self._numCardsInPlace = self._board.countCardsInPlace()
 
         self.updateCardsInPlaceText()
@@ -425,7 +859,6 @@ class App:
 
         # Disable the "next round" button.
         self.disableNextRoundBtn()
-        timer.set_timeout(self.removeAces, 1500)
 
     def removeAces(self):
         """Go through the board and remove the aces from the board.
@@ -450,6 +883,7 @@ class App:
 
         # Count number of cards added in place by sheer luck!
         self.setStatus("Cards placed this round: " + str(self._numCardsPlacedThisRound))
+        self.scheduleSave()
 
     def isEndOfRoundOrGame(self):
         """Check if the game is over or the round is over.  Return True
@@ -457,26 +891,39 @@ class App:
         """
         if self._board.gameCompletelyDone():
             score = self.currentScore()
+            best = self._leaderboard.bestForSeed(self._seed)
+            bestMsg = "" if best is None else f"Your best for this game was {best.score}.\n"
             self.displayMessageOverCanvas(
                 f"Congratulations!\n\nYou finished the game in {self._roundNum} rounds\n"
                 + f"with a score of {score}.\n"
+                + bestMsg
                 + "Click 'New Game' to try again.",
                 5000,
             )
             self.addScoreToHighScoresTable(score)
+            self.clearSavedGame()
             self.setStatus(
                 "Cards placed this round: " + str(self._numCardsPlacedThisRound)
             )
             self.playFanfareSound()
             return True
 
-        if not self._board.moreMoves():
-            self.setStatus("No more moves")
-            # enable the next round button by deleting the disabled attribute
+        if self.refreshEndOfRoundState():
             self.playEndOfRoundSound()
-            self.enableNextRoundBtn()
         return False
 
+    def refreshEndOfRoundState(self):
+        """If there are no more moves, say so and enable the Next Round
+        button, without the sound (a restored game calls this too).
+        Return True iff the round is over.
+        """
+        if self._board.moreMoves():
+            return False
+        self.setStatus("No more moves")
+        # enable the next round button by deleting the disabled attribute
+        self.enableNextRoundBtn()
+        return True
+
     def onCardClick(self, event):
         """Called back when a card is clicked to be moved into an open spot:
         Figure out when card was clicked using the _imgDict to map id to cardImg.
@@ -490,6 +937,13 @@ class App:
 
         # print("number of objects = ", len(self._canv.getObjects()))
 
+        if self._boardGui.isDealing():
+            # Clicking during a deal finishes it, once there are card
+            # images to finish it with.
+            if self._cardsLoaded:
+                self._boardGui.skipDeal()
+            return
+
         ptr = self._canv.getPointer(event)
         x = ptr.x
         y = ptr.y
@@ -520,7 +974,7 @@ class App:
                 "toCol": toCol,
                 "numCardsInPlace": numCardsInPlaceBeforeMove,
                 "numCardsPlacedThisRound": self._numCardsPlacedThisRound,
-                "card_points": {id(c): c.getPoints() for c in self._deck.getCards()},
+                "card_points": {id(c): c.getPoints() for c in self._cards},
             }
             self.enableUndoBtn()
 
@@ -559,6 +1013,7 @@ class App:
                 # just a normal move
                 self.playCardMoveSound()
 
+            self.scheduleSave()
             DEBUG and debug("checking if end of round or game")
             if self.isEndOfRoundOrGame():
                 return
@@ -577,30 +1032,33 @@ class App:
             if card is not None:
                 self.bounceLowerCard(card, row, col)
 
+    def _timedCardClick(self, event):
+        """onCardClick(), recording how long it takes until the next frame
+        has been drawn.  Used instead of onCardClick when debugging."""
+        start = now()
+        App.onCardClick(self, event)
+        window.requestAnimationFrame(lambda ts: perf.recordMove(now() - start))
+
     def repeatGameClickHandler(self, ev):
-        self.newGameClickHandler(ev, self._copyOfDeck)
+        self.newGameClickHandler(ev, self._seed)
 
-    def newGameClickHandler(self, ev, deck=None):
-        """Call back when New Game button is pressed."""
+    def newGameClickHandler(self, ev, seed=None):
+        """Call back when New Game button is pressed.  Deal the game with
+        the given seed, or a new one."""
 
         self.disableNewGameButton()
         self._boardGui.clear()
+        self.clearSavedGame()
 
         self._roundNum = 1
         self.updateRoundNum()
 
-        # Add all the cards on the board to the deck.
-        if deck:
-            self._deck = deck
-            self._copyOfDeck = self._deck.makeCopy()
-        else:
-            self._deck.addCards(self._board.getAllCards())
-            if self._deck.numCards() == 48:
-                # The board had aces removed, so add the aces back to the deck.
-                for card in self._removedAces:
-                    self._deck.addCard(card)
-            self._deck.shuffle()
-            self._copyOfDeck = self._deck.makeCopy()
+        if seed is None:
+            seed = random.randrange(MAX_SEED)
+        self._seed = seed
+        # Always start from the same order, so the seed decides the deal.
+        self._deck = Deck(self._cards)
+        self._deck.shuffle(roundRng(self._seed, self._roundNum))
 
         self._board.reinit()
 
@@ -615,8 +1073,13 @@ class App:
         Register nextRoundContined() to be called.
         """
 
+        # Save the end of the round before the board is taken apart.
+        self.flushSave()
         self.disableNewGameButton()
         self._clearUndoState()
+        self._moveableCards = []
+
+        self._boardGui.invalidateCardsInPlace()
 
         # No cards placed yet in this round
         self._numCardsPlacedThisRound = 0
@@ -627,7 +1090,7 @@ class App:
         # Add the aces back to the deck.
         for card in self._removedAces:
             self._deck.addCard(card)
-        self._deck.shuffle()
+        self._deck.shuffle(roundRng(self._seed, self._roundNum))
 
         # display the board with only "good cards" for 1 second.
         for card in unplacedCards:
@@ -635,22 +1098,20 @@ class App:
             cardimg.erase()
         self.updateScoreText()
 
-        timer.set_timeout(self.nextRoundContinued, 1000)
+        self._boardGui.pause(NEXT_ROUND_PAUSE, self.nextRoundContinued)
 
     def nextRoundContinued(self):
         """Continuation of nextRound():
         Lay out all the cards from the deck on the board;
         Update the button states;
-        Wait a bit, then call removeAces().
+        Call removeAces() once all the cards are dealt.
         """
 
         # Deck is shuffled.  Now, add cards to the board.
         self._board.layoutCards(self._deck)
-        self._boardGui.displayLayout()
+        self._boardGui.displayLayout(self.removeAces)
 
         self.disableNextRoundBtn()
-        # After 1.5 seconds of showing all cards, remove the aces.
-        timer.set_timeout(self.removeAces, 1500)
 
     def getClickedCard(self, x, y):
         cards = self._board.getAllCards()
@@ -687,6 +1148,8 @@ class App:
             self.drawOutline(card, CARDS_IN_PLACE_COLOR)
             if card.getPoints() == 0:
                 card.setPoints(self.getPtsPerCard())
+        # They stay put until the next round or a 2 is moved.
+        self._boardGui.cacheCardsInPlace([card for card, r, c in goodCards])
 
     def handleMovingCardInPlace(self, card, fromRow, fromCol):
         """If the card being moved was in place, then we have to
@@ -696,6 +1159,7 @@ class App:
         if fromCol != 0:
             return
         if card.getNum() == 2:
+            self._boardGui.invalidateCardsInPlace()
             card.setPoints(0)
             for col in range(1, Board.NUM_COLS):
                 c = self._board.getCardAt(fromRow, col)
@@ -734,6 +1198,36 @@ class App:
         self._undo_state = None
         self.disableUndoBtn()
 
+    def showHint(self, _ev):
+        """Outline the card that the learned evaluation (see heuristic.py)
+        would move next.  The outline goes when the next move is made."""
+        if self._hinter is None:
+            self._hintWanted = True
+            self._assets.request("hint weights")
+            return
+        move = self._hinter.best(self._board, self._moveableCards)
+        if move is not None:
+            self.drawOutline(move[0], HINT_COLOR)
+
+    def loadHintWeights(self, done):
+        def loaded(text):
+            try:
+                self._hinter = Evaluator.fromString(text)
+            except ValueError as e:
+                print("bad hint weights:", e)
+            done()
+            if self._hinter is not None and self._hintWanted:
+                self._hintWanted = False
+                self.showHint(None)
+
+        def failed(err):
+            print("could not load hint weights:", err)
+            done()
+
+        window.fetch(WEIGHTS_FILE).then(lambda resp: resp.text()).then(loaded).catch(
+            failed
+        )
+
     def undoMove(self, _ev):
         if self._undo_state is None:
             return
@@ -746,10 +1240,11 @@ class App:
         toRow, toCol = state["toRow"], state["toCol"]
 
         # Restore card points before redrawing anything
-        for c in self._deck.getCards():
+        for c in self._cards:
             c.setPoints(state["card_points"][id(c)])
 
         # Erase all outlines so we can redraw from scratch
+        self._boardGui.invalidateCardsInPlace()
         for cardimg in self._card2ImgDict.values():
             cardimg.eraseOutline()
 
@@ -768,6 +1263,7 @@ class App:
         self.highlightMovableCards()
         self.markGoodCards()
         self.disableNextRoundBtn()
+        self.scheduleSave()
 
     def getPtsPerCard(self):
         """10 pts for round 1, 9 for round 2, etc..."""
@@ -827,79 +1323,100 @@ class App:
         self._messageDiv.style.display = "none"
         self._messageDiv.clear()
 
-    def loadCardMoveSound(self):
-        self._moveCardSound = self.loadSound("snap3.wav")
-
-    def loadCardInPlaceSound(self):
-        self._cardInPlaceSound = self.loadSound("inplace.wav")
-
-    def loadEndOfRoundSound(self):
-        self._endOfRoundSound = self.loadSound("lose.wav")
-
-    def loadFanfareSound(self):
-        self._fanfareSound = self.loadSound("fanfare.wav")
-
-    def loadSound(self, file):
-        sound = document.createElement("audio")
-        sound.src = file
-        sound.setAttribute("preload", "auto")
-        sound.setAttribute("controls", "none")
-        sound.style.display = "none"
-        self._doc <= sound
-        return sound
-
     def playCardMoveSound(self):
         if self._playSounds:
-            self._moveCardSound.play()
+            self._sounds.play("move")
 
     def playCardInPlaceSound(self):
         if self._playSounds:
-            self._cardInPlaceSound.play()
+            self._sounds.play("inplace")
 
     def playEndOfRoundSound(self):
         if self._playSounds:
-            self._endOfRoundSound.play()
+            self._sounds.play("endofround")
 
     def playFanfareSound(self):
         if self._playSounds:
-            self._fanfareSound.play()
+            self._sounds.play("fanfare")
 
     def togglePlaySounds(self, ev):
         self._playSounds = ev.target.checked
         self.storePlaySoundsSetting()
+        if self._playSounds:
+            self._assets.request("sounds")
+
+    def cardsLoaded(self):
+        self._cardsLoaded = True
+
+    def loadSecondaryAssets(self):
+        """Register the assets not needed for the first deal.  The sounds
+        are skipped entirely if the player has turned them off."""
+        self._assets.add("sounds", IDLE, self._sounds.load, enabled=self._playSounds)
+        self._assets.add("hint weights", IDLE, self.loadHintWeights)
+        for source in CARD_SOURCES[1:]:
+            urls = [
+                source + cardimg._image_name for cardimg in self._card2ImgDict.values()
+            ]
+            self._assets.add(
+                "cards " + source, IDLE, lambda done, urls=urls: prefetchImages(urls, done)
+            )
+
+    def getAssetTimings(self):
+        """Return the AssetScheduler's per-asset timings as a JSON string."""
+        return json.dumps(self._assets.timings())
+
+    def loadHighScores(self, done=None):
+        """Read the leaderboard from storage (the only time it is read)
+        and show the top scores."""
+        if LEADERBOARD_KEY in self._storage:
+            try:
+                self._leaderboard = Leaderboard.fromString(self._storage[LEADERBOARD_KEY])
+            except ValueError:
+                print("bad leaderboard in storage")
+        else:
+            self.importOldHighScores()
 
-    def loadHighScores(self):
-        # storing up to 5 high scores.
-        self._score = [0] * 5
-        try:  # there may be less than 5 values stored so far.
-            for i in range(5):
-                self._score[i] = int(self._storage[f"highScore{i}"])
-        except:
-            pass
         self._scores_span = html.SPAN()
         self._game_info2_elem <= self._scores_span
 
         header = html.SPAN("High Scores: ")
         self._scores_span <= header
 
-        for i in range(5):
+        scores = self._leaderboard.topScores(NUM_HIGH_SCORES_SHOWN)
+        for i in range(NUM_HIGH_SCORES_SHOWN):
             span = html.SPAN("{score}")
             self._score_val.append(template.Template(span))
             self._scores_span <= span
-            self._score_val[i].render(score=self._score[i])
+            self._score_val[i].render(score=scores[i])
+        if done is not None:
+            done()
+
+    def importOldHighScores(self):
+        """Move the scores stored by older versions, one key per score,
+        into the leaderboard."""
+        for i in range(NUM_HIGH_SCORES_SHOWN):
+            key = f"highScore{i}"
+            if key not in self._storage:
+                continue
+            try:
+                score = int(self._storage[key])
+            except ValueError:
+                score = 0
+            if score > 0:
+                # Their seeds and rounds are not known.
+                self._leaderboard.add(score, 0, None, 0)
+            del self._storage[key]
+        self._storage[LEADERBOARD_KEY] = self._leaderboard.toString()
 
     def addScoreToHighScoresTable(self, score):
-        changed = False
-        for i in range(5):
-            if score >= self._score[i]:
-                self._score.insert(i, score)
-                changed = True
-                break
-        if changed:
-            for i in range(5):
-                self._storage[f"highScore{i}"] = str(self._score[i])
-                # update the screen
-                self._score_val[i].render(score=self._score[i])
+        """Add the finished game to the leaderboard and store it."""
+        rank = self._leaderboard.add(score, window.Date.now(), self._seed, self._roundNum)
+        self._storage[LEADERBOARD_KEY] = self._leaderboard.toString()
+        if rank is not None and rank < NUM_HIGH_SCORES_SHOWN:
+            # update the screen
+            scores = self._leaderboard.topScores(NUM_HIGH_SCORES_SHOWN)
+            for i in range(NUM_HIGH_SCORES_SHOWN):
+                self._score_val[i].render(score=scores[i])
 
     def loadSettingsFromStorage(self):
         try:
@@ -908,10 +1425,139 @@ class App:
             print("no playsounds in storage")
             # If we haven't stored a choice, the default is True
             self._playSounds = True
+        try:
+            self._dealRate = int(self._storage["dealRate"])
+        except:
+            self._dealRate = DEAL_RATE
+        if self._dealRate <= 0:
+            # The deal would never finish.
+            self._dealRate = DEAL_RATE
 
     def storePlaySoundsSetting(self):
         self._storage["playSounds"] = str(self._playSounds)
 
+    def scheduleSave(self):
+        """Save the game soon: moves made in quick succession are saved
+        with one write."""
+        if self._save_timer is None:
+            self._save_timer = timer.set_timeout(self.saveGame, SAVE_DELAY)
+
+    def saveGame(self):
+        self._save_timer = None
+        if self._boardGui.isDealing():
+            # The board is half dealt, or still has the aces: removeAces()
+            # saves the game once the deal is done.
+            return
+        self._storage[SAVE_KEY] = self.getSavedGame().toString()
+
+    def flushSave(self, *args):
+        """Save the game now, if there are unsaved moves."""
+        if self._save_timer is not None:
+            timer.clear_timeout(self._save_timer)
+            self.saveGame()
+
+    def onVisibilityChange(self, _ev):
+        # The page may be closed without any other event after this.
+        if document.visibilityState == "hidden":
+            self.flushSave()
+
+    def clearSavedGame(self):
+        if self._save_timer is not None:
+            timer.clear_timeout(self._save_timer)
+            self._save_timer = None
+        if SAVE_KEY in self._storage:
+            del self._storage[SAVE_KEY]
+
+    def getSavedGame(self):
+        """Return the state of the game as a SavedGame."""
+        cells = []
+        for ridx in range(Board.NUM_ROWS):
+            for cidx in range(Board.NUM_COLS):
+                card = self._board.getCardAt(ridx, cidx)
+                cells.append(None if card is None else card.getOrdinal())
+        undo = None
+        state = self._undo_state
+        if state is not None:
+            undo = UndoState(
+                state["card"].getOrdinal(),
+                state["fromRow"],
+                state["fromCol"],
+                state["toRow"],
+                state["toCol"],
+                state["numCardsInPlace"],
+                state["numCardsPlacedThisRound"],
+                [state["card_points"][id(c)] for c in self._cards],
+            )
+        return SavedGame(
+            self._seed,
+            self._roundNum,
+            self._numCardsPlacedThisRound,
+            cells,
+            [card.getOrdinal() for card in self._removedAces],
+            [card.getPoints() for card in self._cards],
+            undo,
+        )
+
+    def restoreGame(self):
+        """Put back the game saved in storage, if there is one, and draw it
+        without dealing.  Return True iff there was a game to restore."""
+        try:
+            saved = SavedGame.fromString(self._storage[SAVE_KEY])
+        except KeyError:
+            return False
+        except ValueError:
+            # Saved by another version of the game.
+            del self._storage[SAVE_KEY]
+            return False
+
+        self._seed = saved.seed
+        self._roundNum = saved.roundNum
+        self._numCardsPlacedThisRound = saved.numCardsPlacedThisRound
+        self._deck = Deck()
+        self._board.reinit()
+        for idx, ordinal in enumerate(saved.cells):
+            if ordinal is not None:
+                ridx, cidx = divmod(idx, Board.NUM_COLS)
+                self._board.setCardAt(ridx, cidx, self._cards[ordinal])
+        self._removedAces = [self._cards[ordinal] for ordinal in saved.aces]
+        for card, points in zip(self._cards, saved.points):
+            card.setPoints(points)
+        self._numCardsInPlace = self._board.countCardsInPlace()
+
+        undo = saved.undo
+        if undo is not None:
+            self._undo_state = {
+                "card": self._cards[undo.card],
+                "fromRow": undo.fromRow,
+                "fromCol": undo.fromCol,
+                "toRow": undo.toRow,
+                "toCol": undo.toCol,
+                "numCardsInPlace": undo.numCardsInPlace,
+                "numCardsPlacedThisRound": undo.numCardsPlacedThisRound,
+                "card_points": {
+                    id(c): points for c, points in zip(self._cards, undo.points)
+                },
+            }
+            self.enableUndoBtn()
+
+        self._boardGui.showLayout()
+        self.updateRoundNum()
+        self.updateCardsInPlaceText()
+        self.updateScoreText()
+        self.setStatus("Cards placed this round: " + str(self._numCardsPlacedThisRound))
+        self.enableNewGameButton()
+
+        # The points were saved, so only draw the outlines.
+        goodCards = [card for card, r, c in self._board.getCardsInPlace()]
+        for card in goodCards:
+            self.drawOutline(card, CARDS_IN_PLACE_COLOR)
+        self._boardGui.cacheCardsInPlace(goodCards)
+        # A finished game is never saved, so only the round can be over.
+        if not self.refreshEndOfRoundState():
+            self._moveableCards = self._board.findPlayableCards()
+            self.highlightMovableCards()
+        return True
+
     def onWindowResize(self, _ev):
         if self._resize_timer:
             timer.clear_timeout(self._resize_timer)
@@ -927,6 +1573,7 @@ class App:
         self._canv.setWidth(new_w)
         self._canv.setHeight(new_h)
         self._canv.setZoom(scale)
+        self._boardGui.setScale(scale)
         self._messageDiv.style.top = f"{new_h / 3}px"
         self._messageDiv.style.left = f"{new_w / 3}px"
         self._messageDiv.style.width = f"{new_w / 3}px"
@@ -953,6 +1600,9 @@ canvas = fabric.Canvas.new(
 canvas.setZoom(_initial_scale)
 app = App(document, canvas)
 window.bind("resize", app.onWindowResize)
+# So the load timings can be looked at from the browser console.
+window.assetTimings = app.getAssetTimings
+window.perfReport = perf.toJson
 
 document <= html.H2(
     html.A("Instructions", href="instructions.html", Class="right-edge")
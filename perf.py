@@ -0,0 +1,129 @@
+"""Performance instrumentation for the browser version of the game.
+
+Records named spans (module import, app start-up, card images loading,
+dealing, ...) and a histogram of how long each move takes, from the click
+until the next frame is drawn.  Turn it on by loading the page with
+"?debug" in the URL, or by setting the "debug" key in local storage to
+"True"; a "Perf JSON" button then downloads the report.
+
+When it is off, begin(), end(), record() and recordMove() are replaced by
+a function that does nothing, so the instrumented code pays no more than a
+call.
+"""
+
+import json
+
+from browser import html, local_storage, window
+
+# Upper bounds (ms) of the buckets of the move latency histogram.  The
+# last bucket holds everything slower.
+MOVE_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024]
+
+
+def now():
+    """ms since the page started loading."""
+    return window.performance.now()
+
+
+def _noop(*args):
+    pass
+
+
+def debugRequested():
+    # A "debug" parameter, with any value or none: ?debug, ?debug=1, ...
+    if window.URLSearchParams.new(window.location.search).has("debug"):
+        return True
+    try:
+        return local_storage.storage["debug"] == "True"
+    except KeyError:
+        return False
+
+
+class Perf:
+    """Collects the spans and move latencies.  Use the module's perf
+    object rather than creating another one."""
+
+    def __init__(self):
+        self._spans = []
+        # name -> start time of spans that have begun but not ended.
+        self._open = {}
+        self._moveCounts = [0] * (len(MOVE_BUCKETS) + 1)
+        self._numMoves = 0
+        self._totalMoveMs = 0.0
+        self._maxMoveMs = 0.0
+        self.disable()
+
+    def enable(self):
+        self.enabled = True
+        self.begin = self._begin
+        self.end = self._end
+        self.record = self._record
+        self.recordMove = self._recordMove
+
+    def disable(self):
+        self.enabled = False
+        self.begin = _noop
+        self.end = _noop
+        self.record = _noop
+        self.recordMove = _noop
+
+    def _begin(self, name):
+        """Start the span with the given name."""
+        self._open[name] = now()
+
+    def _end(self, name):
+        """End the span with the given name, if it was begun."""
+        start = self._open.pop(name, None)
+        if start is not None:
+            self._record(name, start)
+
+    def _record(self, name, start, end=None):
+        """Record a span whose start (and end, default now) are known."""
+        if end is None:
+            end = now()
+        self._spans.append(
+            {"name": name, "start": round(start, 2), "duration": round(end - start, 2)}
+        )
+
+    def _recordMove(self, ms):
+        """Add one move's latency, in ms, to the histogram."""
+        idx = 0
+        while idx < len(MOVE_BUCKETS) and ms > MOVE_BUCKETS[idx]:
+            idx += 1
+        self._moveCounts[idx] += 1
+        self._numMoves += 1
+        self._totalMoveMs += ms
+        self._maxMoveMs = max(self._maxMoveMs, ms)
+
+    def report(self):
+        """Return everything recorded so far as a dict."""
+        return {
+            "userAgent": window.navigator.userAgent,
+            "devicePixelRatio": window.devicePixelRatio,
+            "spans": self._spans,
+            "moveLatency": {
+                "bucketsMs": MOVE_BUCKETS,
+                "counts": self._moveCounts,
+                "moves": self._numMoves,
+                "meanMs": round(self._totalMoveMs / self._numMoves, 2)
+                if self._numMoves
+                else None,
+                "maxMs": round(self._maxMoveMs, 2),
+            },
+        }
+
+    def toJson(self):
+        return json.dumps(self.report(), indent=1)
+
+    def download(self, *args):
+        """Save the report as perf.json through the browser."""
+        blob = window.Blob.new([self.toJson()], {"type": "application/json"})
+        url = window.URL.createObjectURL(blob)
+        link = html.A(href=url, download="perf.json")
+        link.click()
+        window.URL.revokeObjectURL(url)
+
+
+perf = Perf()
+if debugRequested():
+    perf.enable()
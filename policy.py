@@ -0,0 +1,266 @@
+'''Players for simulated games.
+
+A policy picks a move: choose() gets a read-only BoardView, the moves
+that can be made (findPlayableCards()'s (card, row, col) tuples) and a
+random.Random, and returns one of the moves.  Policies keep no state
+between calls, and hold nothing but their settings (LearnedPolicy also
+caches the Evaluator it makes from its weights, which never changes), so
+one object can be shared by any number of games and sent to worker
+processes for almost nothing.
+
+    RandomPolicy     any move
+    GreedyPolicy     the move that puts the most cards in place
+    TwosFirstPolicy  a 2 into column 0 if there is one, else greedy
+    LookaheadPolicy  the move that leads to the most cards in place after
+                     up to depth moves
+    LearnedPolicy    the move heuristic.py's learned evaluation likes best
+
+    python policy.py bench [--games 20]
+
+plays games with each policy and prints how many decisions per second it
+makes, and its mean score and rounds.
+'''
+
+import argparse
+import os
+import random
+import time
+
+from game import *
+from heuristic import WEIGHTS_FILE, Evaluator, loadEvaluator
+
+# Give up on a game after this many rounds.
+MAX_ROUNDS = 100
+
+
+class BoardView:
+    '''A read-only view of a Board.'''
+
+    def __init__(self, board):
+        self._board = board
+
+    def getCardAt(self, row, col):
+        return self._board.getCardAt(row, col)
+
+    def findCardLocation(self, card):
+        return self._board.findCardLocation(card)
+
+    def getMoveableCardDest(self, card):
+        return self._board.getMoveableCardDest(card)
+
+    def getCardsInPlace(self):
+        return self._board.getCardsInPlace()
+
+    def countCardsInPlace(self):
+        return self._board.countCardsInPlace()
+
+    def moreMoves(self):
+        return self._board.moreMoves()
+
+    def copy(self):
+        '''Return a copy of the Board, to try moves on.'''
+        return self._board.copy()
+
+
+def _tryMove(board, move):
+    '''Make the move on the board.  Return its destination, to undo it
+    with _undoMove(), or None if it cannot be made.'''
+    card, row, col = move
+    dest = board.getMoveableCardDest(card)
+    if dest is not None:
+        board.moveCard(card, row, col, dest[0], dest[1])
+    return dest
+
+
+def _undoMove(board, move, dest):
+    card, row, col = move
+    board.moveCard(card, dest[0], dest[1], row, col)
+
+
+def _bestMoves(moves, values):
+    '''Return the moves with the highest value.'''
+    best = max(values)
+    return [move for move, value in zip(moves, values) if value == best]
+
+
+class Policy:
+    '''Base class of the policies.'''
+
+    name = "policy"
+
+    def choose(self, view, moves, rng):
+        '''Return the move to make, one of moves.'''
+        raise NotImplementedError
+
+    def __repr__(self):
+        return self.name
+
+
+class RandomPolicy(Policy):
+    name = "random"
+
+    def choose(self, view, moves, rng):
+        return rng.choice(moves)
+
+
+class GreedyPolicy(Policy):
+    '''Makes the move that leaves the most cards in place, picking one at
+    random if there is a tie.'''
+
+    name = "greedy"
+
+    def choose(self, view, moves, rng):
+        board = view.copy()
+        values = []
+        for move in moves:
+            dest = _tryMove(board, move)
+            values.append(-1 if dest is None else board.countCardsInPlace())
+            if dest is not None:
+                _undoMove(board, move, dest)
+        return rng.choice(_bestMoves(moves, values))
+
+
+class TwosFirstPolicy(GreedyPolicy):
+    '''Moves a 2 that is not in column 0 yet into column 0, if it can;
+    otherwise plays like GreedyPolicy.'''
+
+    name = "twos"
+
+    def choose(self, view, moves, rng):
+        twos = [move for move in moves
+                if move[0].getNum() == 2 and move[2] != 0]
+        if twos:
+            return rng.choice(twos)
+        return GreedyPolicy.choose(self, view, moves, rng)
+
+
+class LookaheadPolicy(Policy):
+    '''Makes the move after which the most cards can be in place, within
+    depth moves in all.'''
+
+    def __init__(self, depth=2):
+        self.depth = depth
+        self.name = "lookahead%d" % depth
+
+    def choose(self, view, moves, rng):
+        board = view.copy()
+        values = []
+        for move in moves:
+            dest = _tryMove(board, move)
+            if dest is None:
+                values.append(-1)
+                continue
+            values.append(self._search(board, self.depth - 1))
+            _undoMove(board, move, dest)
+        return rng.choice(_bestMoves(moves, values))
+
+    def _search(self, board, depth):
+        '''Return the most cards in place the board can have after up to
+        depth more moves.'''
+        best = board.countCardsInPlace()
+        if depth == 0:
+            return best
+        for move in board.findPlayableCards():
+            dest = _tryMove(board, move)
+            if dest is not None:
+                best = max(best, self._search(board, depth - 1))
+                _undoMove(board, move, dest)
+        return best
+
+
+class LearnedPolicy(Policy):
+    '''Makes the move with the highest value according to a
+    heuristic.Evaluator with the given weights, or by default the weights
+    in WEIGHTS_FILE (next to this file).  The Evaluator is made on the
+    first move, so importing this module never reads the file, and then
+    kept: it is the same for every game, so it is not state between
+    calls.'''
+
+    name = "learned"
+
+    def __init__(self, weights=None):
+        self.weights = weights
+        self._evaluator = None
+
+    def choose(self, view, moves, rng):
+        if self._evaluator is None:
+            if self.weights is None:
+                self._evaluator = loadEvaluator(os.path.join(
+                    os.path.dirname(os.path.abspath(__file__)), WEIGHTS_FILE))
+            else:
+                self._evaluator = Evaluator(self.weights)
+        return self._evaluator.best(view.copy(), moves, rng)
+
+
+POLICIES = {
+    "random": RandomPolicy(),
+    "greedy": GreedyPolicy(),
+    "twos": TwosFirstPolicy(),
+    "lookahead2": LookaheadPolicy(2),
+    "lookahead3": LookaheadPolicy(3),
+    "learned": LearnedPolicy(),
+}
+
+
+def getPolicy(name):
+    '''Return the policy with the given name (see POLICIES).'''
+    try:
+        return POLICIES[name]
+    except KeyError:
+        raise ValueError("unknown policy %r: use one of %s" %
+                         (name, ", ".join(POLICIES)))
+
+
+def playGame(game, policy, rng, maxRounds=MAX_ROUNDS, onRoundEnd=None):
+    '''Play the game to the end (or maxRounds) with the given policy.
+    If onRoundEnd is given, it is called once with the game at the end of
+    each round played, including the one that finishes the game.  Return
+    the number of decisions made.'''
+    view = BoardView(game.getBoard())
+    decisions = 0
+    while not game.isDone() and game.getRoundNum() <= maxRounds:
+        if game.isRoundOver():
+            if onRoundEnd is not None:
+                onRoundEnd(game)
+            game.nextRound()
+            continue
+        card, row, col = policy.choose(view, game.playableCards(), rng)
+        game.moveCard(card)
+        decisions += 1
+    # A game given up after maxRounds has had its rounds counted already:
+    # the round just dealt is not played.
+    if onRoundEnd is not None and game.isDone():
+        onRoundEnd(game)
+    return decisions
+
+
+def bench(policies, numGames):
+    print("%-12s %12s %10s %10s" % ("policy", "decisions/s", "score", "rounds"))
+    for policy in policies:
+        decisions = score = rounds = 0
+        start = time.perf_counter()
+        for seed in range(numGames):
+            game = Game(seed)
+            decisions += playGame(game, policy, random.Random(seed))
+            score += game.currentScore()
+            rounds += game.getRoundNum()
+        elapsed = time.perf_counter() - start
+        print("%-12s %12.0f %10.1f %10.2f" %
+              (policy, decisions / elapsed, score / numGames, rounds / numGames))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the policies.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    benchCmd = commands.add_parser("bench", help="play games with each "
+                                   "policy and time its decisions")
+    benchCmd.add_argument("--games", type=int, default=20)
+    benchCmd.add_argument("--policy", action="append",
+                          help="policy to run (default: all)")
+    args = parser.parse_args()
+    policies = [getPolicy(name) for name in args.policy or POLICIES]
+    bench(policies, args.games)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+'''Counting calls of the Board and Deck methods, and the time spent in
+them, while simulated games are played.
+
+The profiler is off unless enable() is called: it then replaces each
+public method of the classes with one that counts and times the calls,
+and disable() puts the original methods back, so the game engine runs
+at full speed when nobody is looking.  Times are inclusive: the time of
+findPlayableCards() includes the findCard() calls it makes.
+
+    profiler.enable()
+    for seed in seeds:
+        profiler.startGame(seed)
+        ... play the game ...
+        profiler.endGame()
+    profiler.disable()
+    print(profiler.formatFlat())
+
+formatFlat() sums up all the calls; formatGames() shows each method's
+calls and time per game, and the game in which it took longest.
+
+    python profiling.py [--games 100] [--policy random] [--json out.json]
+
+plays games with a policy (see policy.py) and prints both summaries.
+'''
+
+import argparse
+import functools
+import json
+import random
+import sys
+import time
+import types
+
+from game import *
+from policy import POLICIES, getPolicy, playGame
+
+DEFAULT_CLASSES = (Board, Deck)
+
+
+def _publicMethods(cls):
+    '''Yield (name, function) for the public methods defined in cls.'''
+    for name, value in list(vars(cls).items()):
+        if not name.startswith('_') and isinstance(value, types.FunctionType):
+            yield name, value
+
+
+def _timed(method, counts):
+    '''Return a function that calls method, adding 1 to counts[0] and the
+    time it took to counts[1].'''
+    perfCounter = time.perf_counter
+
+    @functools.wraps(method)
+    def timed(*args, **kwargs):
+        start = perfCounter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            counts[0] += 1
+            counts[1] += perfCounter() - start
+    return timed
+
+
+class Profiler:
+    '''Counts and times the calls of the public methods of some classes.
+    Use the module's profiler object rather than creating another one.'''
+
+    def __init__(self):
+        # "Class.method" -> [calls, seconds]
+        self._counts = {}
+        # (cls, name, original function) for each method replaced.
+        self._replaced = []
+        self._enabledAt = None
+        self._elapsed = 0.0
+        # (label, seconds, {name: (calls, seconds)}) for each game.
+        self._games = []
+        self._gameLabel = None
+        self._gameStart = None
+
+    def isEnabled(self):
+        return bool(self._replaced)
+
+    def enable(self, classes=DEFAULT_CLASSES):
+        if self._replaced:
+            return
+        for cls in classes:
+            for name, method in _publicMethods(cls):
+                counts = self._counts.setdefault(
+                    "%s.%s" % (cls.__name__, name), [0, 0.0])
+                setattr(cls, name, _timed(method, counts))
+                self._replaced.append((cls, name, method))
+        self._enabledAt = time.perf_counter()
+
+    def disable(self):
+        for cls, name, method in self._replaced:
+            setattr(cls, name, method)
+        self._replaced = []
+        if self._enabledAt is not None:
+            self._elapsed += time.perf_counter() - self._enabledAt
+            self._enabledAt = None
+
+    def reset(self):
+        '''Forget everything counted so far.'''
+        for counts in self._counts.values():
+            counts[0] = 0
+            counts[1] = 0.0
+        self._games = []
+        self._elapsed = 0.0
+        if self._enabledAt is not None:
+            self._enabledAt = time.perf_counter()
+
+    def _snapshot(self):
+        return {name: tuple(counts) for name, counts in self._counts.items()}
+
+    def startGame(self, label):
+        '''Start counting the calls made for one game (e.g., its seed).'''
+        self._gameLabel = label
+        self._gameStart = (time.perf_counter(), self._snapshot())
+
+    def endGame(self):
+        startTime, before = self._gameStart
+        calls = {}
+        for name, (numCalls, seconds) in self._counts.items():
+            prevCalls, prevSeconds = before.get(name, (0, 0.0))
+            if numCalls != prevCalls:
+                calls[name] = (numCalls - prevCalls, seconds - prevSeconds)
+        self._games.append((self._gameLabel,
+                            time.perf_counter() - startTime, calls))
+        self._gameStart = None
+
+    def elapsed(self):
+        '''Return the number of seconds the profiler has been on.'''
+        if self._enabledAt is None:
+            return self._elapsed
+        return self._elapsed + time.perf_counter() - self._enabledAt
+
+    def flat(self):
+        '''Return [(name, calls, seconds)] for the methods called, most
+        time first.'''
+        res = [(name, calls, seconds)
+               for name, (calls, seconds) in self._counts.items() if calls]
+        res.sort(key=lambda stat: -stat[2])
+        return res
+
+    def perGame(self):
+        '''Return {name: (mean calls per game, mean seconds per game, the
+        most seconds in one game, that game's label)} for the methods
+        called in the games.'''
+        totals = {}
+        for label, gameSeconds, calls in self._games:
+            for name, (numCalls, seconds) in calls.items():
+                total = totals.setdefault(name, [0, 0.0, -1.0, None])
+                total[0] += numCalls
+                total[1] += seconds
+                if seconds > total[2]:
+                    total[2] = seconds
+                    total[3] = label
+        numGames = len(self._games)
+        return {name: (numCalls / numGames, seconds / numGames, most, label)
+                for name, (numCalls, seconds, most, label) in totals.items()}
+
+    def formatFlat(self):
+        elapsed = self.elapsed()
+        lines = ["%-28s %10s %10s %9s %7s" %
+                 ("method", "calls", "total ms", "us/call", "% time")]
+        for name, calls, seconds in self.flat():
+            lines.append("%-28s %10d %10.1f %9.2f %6.1f%%" %
+                         (name, calls, seconds * 1000, seconds / calls * 1e6,
+                          seconds / elapsed * 100 if elapsed else 0))
+        lines.append("%d games, %.1f ms profiled" % (len(self._games),
+                                                      elapsed * 1000))
+        return "\n".join(lines)
+
+    def formatGames(self):
+        stats = self.perGame()
+        lines = ["%-28s %12s %10s %10s  %s" %
+                 ("method", "calls/game", "ms/game", "worst ms", "worst game")]
+        for name in sorted(stats, key=lambda name: -stats[name][1]):
+            calls, seconds, most, label = stats[name]
+            lines.append("%-28s %12.1f %10.2f %10.2f  %s" %
+                         (name, calls, seconds * 1000, most * 1000, label))
+        if self._games:
+            slowest = max(self._games, key=lambda game: game[1])
+            lines.append("slowest game: %s, %.1f ms" %
+                         (slowest[0], slowest[1] * 1000))
+        return "\n".join(lines)
+
+    def report(self):
+        '''Return everything counted so far as a dict.'''
+        return {
+            'elapsedMs': round(self.elapsed() * 1000, 3),
+            'methods': {name: {'calls': calls, 'ms': round(seconds * 1000, 3)}
+                        for name, calls, seconds in self.flat()},
+            'games': [{'game': label, 'ms': round(seconds * 1000, 3),
+                       'methods': {name: {'calls': numCalls,
+                                          'ms': round(ms * 1000, 3)}
+                                   for name, (numCalls, ms) in calls.items()}}
+                      for label, seconds, calls in self._games],
+        }
+
+
+profiler = Profiler()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Profile the Board and Deck methods in simulated games.")
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--first-seed", type=int, default=0)
+    parser.add_argument("--policy", default="random",
+                        help="one of %s (default: %%(default)s)" %
+                        ", ".join(POLICIES))
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+    try:
+        policy = getPolicy(args.policy)
+    except ValueError as e:
+        sys.exit(e)
+
+    profiler.enable()
+    for seed in range(args.first_seed, args.first_seed + args.games):
+        profiler.startGame(seed)
+        playGame(Game(seed), policy, random.Random(seed))
+        profiler.endGame()
+    profiler.disable()
+
+    print(profiler.formatFlat())
+    print()
+    print(profiler.formatGames())
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(profiler.report(), f, indent=1)
+            f.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,401 @@
+'''A model of how a game goes from round to round, to look up the
+expected number of rounds left and the expected final score of a game
+instead of simulating it.
+
+The state of a game between rounds is the number of cards in place in
+each row, sorted (rows are alike: any row can get any suit).  A round
+goes from one state to the next in two steps:
+
+  the deal  The cards not in place and the aces are shuffled and laid
+            out; some land in place.  Every order of the cards is as
+            likely, so the chance of each new state is computed exactly
+            (dealDistribution()).
+  the play  The player moves cards until there are no more moves.  This
+            depends on the player, so it is sampled: games are played
+            with a policy (see policy.py), and the state at the start
+            and end of each round counted.  A start state that never
+            came up borrows the changes seen from the nearest one that
+            did.
+
+Together they give the chance of going from each state to each other in
+a round, from which the expected rounds left, and the points still to
+be won, are found for every state by dynamic programming.  The tables
+are cached in a JSON file per policy, so building them is done once.
+
+    python roundmodel.py build [--policy random] [--games 2000]
+    python roundmodel.py project --seed 123 [--policy random]
+
+The score is worked out as if cards never left their place once put
+there; moving a 2 out of column 0 does take cards out, so a player that
+does so often will score a little less than the model says.
+'''
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+from game import *
+from policy import MAX_ROUNDS, POLICIES, BoardView, getPolicy
+
+VERSION = 1
+# Cards in place in a finished row: 2 to K.
+ROW_CARDS = Board.NUM_COLS - 1
+FINISHED = (ROW_CARDS,) * Board.NUM_ROWS
+START = (0,) * Board.NUM_ROWS
+# Chances below this are dropped from the tables.
+MIN_PROB = 1e-7
+DEFAULT_GAMES = 2000
+DEFAULT_CACHE_DIR = "."
+DEAL_CACHE = "dealtable.json"
+# Stop improving the expected values once they change less than this.
+TOLERANCE = 1e-9
+
+
+def lockedState(board):
+    '''Return the state of the board: the number of cards in place in
+    each row, largest first.'''
+    counts = [0] * Board.NUM_ROWS
+    for card, row, col in board.getCardsInPlace():
+        counts[row] += 1
+    return tuple(sorted(counts, reverse=True))
+
+
+def allStates():
+    '''Return every state, fewest cards in place first.'''
+    res = []
+
+    def addStates(prefix, most):
+        if len(prefix) == Board.NUM_ROWS:
+            res.append(tuple(prefix))
+            return
+        for n in range(most, -1, -1):
+            addStates(prefix + [n], n)
+    addStates([], ROW_CARDS)
+    res.sort(key=sum)
+    return res
+
+
+def _fallingFactorial(n, k):
+    res = 1
+    for i in range(k):
+        res *= n - i
+    return res
+
+
+def _extensions(room, limit):
+    '''Yield every tuple of extensions, each at most the room in its row,
+    adding up to at most limit.'''
+    if not room:
+        yield ()
+        return
+    for j in range(min(room[0], limit) + 1):
+        for rest in _extensions(room[1:], limit - j):
+            yield (j,) + rest
+
+
+def dealDistribution(state):
+    '''Return {state after the deal: chance} for a deal of the cards not
+    in place in the given state (at the end of a round).
+
+    The n cards dealt (the aces included) fill the n empty spaces in a
+    random order.  A row with k cards in place gets at least a more if
+    its next a spaces get its next a cards; a row with none needs one of
+    the 2s not in place, and then that suit.  The chance of all rows
+    getting at least a_r more is (m)_f / (n)_t, for t spaces filled with
+    given cards and f of the m empty rows each given a different suit.
+    Exactly j_r more is found from these by inclusion-exclusion.'''
+    if state == FINISHED:
+        return {FINISHED: 1.0}
+    n = Board.NUM_ROWS * Board.NUM_COLS - sum(state)
+    empty = state.count(0)
+    room = [ROW_CARDS - k for k in state]
+
+    def atLeast(extra):
+        total = sum(extra)
+        if total > n:
+            return 0.0
+        suited = sum(1 for k, a in zip(state, extra) if k == 0 and a > 0)
+        return _fallingFactorial(empty, suited) / _fallingFactorial(n, total)
+
+    # Dealing t given cards has chance under 1 / (n)_t: stop where that is
+    # too small to matter.
+    limit = 0
+    while limit < n and 1 / _fallingFactorial(n, limit + 1) * \
+            _fallingFactorial(empty, min(empty, limit + 1)) >= MIN_PROB:
+        limit += 1
+
+    res = {}
+    for extra in _extensions(room, limit):
+        growable = [r for r in range(len(state)) if extra[r] < room[r]]
+        prob = 0.0
+        for mask in range(1 << len(growable)):
+            bumped = list(extra)
+            sign = 1
+            for i, r in enumerate(growable):
+                if mask >> i & 1:
+                    bumped[r] += 1
+                    sign = -sign
+            prob += sign * atLeast(bumped)
+        if prob >= MIN_PROB:
+            after = tuple(sorted((k + j for k, j in zip(state, extra)),
+                                 reverse=True))
+            res[after] = res.get(after, 0.0) + prob
+    return _normalize(res)
+
+
+def _normalize(dist):
+    total = sum(dist.values())
+    return {state: prob / total for state, prob in dist.items()}
+
+
+def samplePlay(policy, numGames, firstSeed=0):
+    '''Play games with the policy.  Return {state at the start of a
+    round: {state at its end: count}}.'''
+    table = {}
+    for seed in range(firstSeed, firstSeed + numGames):
+        game = Game(seed)
+        rng = random.Random(seed)
+        view = BoardView(game.getBoard())
+        while game.getRoundNum() <= MAX_ROUNDS:
+            start = lockedState(game.getBoard())
+            while not game.isDone() and not game.isRoundOver():
+                card, row, col = policy.choose(view, game.playableCards(), rng)
+                game.moveCard(card)
+            ends = table.setdefault(start, {})
+            end = lockedState(game.getBoard())
+            ends[end] = ends.get(end, 0) + 1
+            if game.isDone():
+                break
+            game.nextRound()
+    return table
+
+
+class RoundModel:
+    '''The round to round model for one policy, and the expected values
+    of each state.'''
+
+    def __init__(self, play, policyName="random", numGames=0, deals=None):
+        self.policyName = policyName
+        self.numGames = numGames
+        # start state -> {end state: count}, as from samplePlay().
+        self._play = play
+        self._playDists = {}
+        # state -> dealDistribution(state), filled in as needed.
+        self._deals = {} if deals is None else deals
+        # state -> (rounds left, cards still to be placed, sum over the
+        # rounds left of the round number (1 for the next) times the cards
+        # placed in it).
+        self._values = {}
+
+    def dealDistribution(self, state):
+        if state not in self._deals:
+            self._deals[state] = dealDistribution(state)
+        return self._deals[state]
+
+    def playDistribution(self, start):
+        '''Return {end state: chance} for a round starting in start.'''
+        if start in self._playDists:
+            return self._playDists[start]
+        if start == FINISHED:
+            dist = {FINISHED: 1.0}
+        elif start in self._play:
+            dist = _normalize(self._play[start])
+        elif self._play:
+            nearest = min(self._play, key=lambda s: sum(
+                abs(a - b) for a, b in zip(s, start)))
+            dist = {}
+            for end, count in self._play[nearest].items():
+                # Rows are matched up by size.
+                moved = tuple(sorted((min(ROW_CARDS, max(0, k + e - s))
+                                      for k, s, e in zip(start, nearest, end)),
+                                     reverse=True))
+                dist[moved] = dist.get(moved, 0) + count
+            dist = _normalize(dist)
+        else:
+            dist = {start: 1.0}
+        self._playDists[start] = dist
+        return dist
+
+    def transitions(self, state):
+        '''Return {state at the end of the next round: chance}, from the
+        state at the end of a round.'''
+        res = {}
+        for dealt, dealProb in self.dealDistribution(state).items():
+            for end, playProb in self.playDistribution(dealt).items():
+                res[end] = res.get(end, 0.0) + dealProb * playProb
+        return _normalize({end: prob for end, prob in res.items()
+                           if prob >= MIN_PROB})
+
+    def solve(self, log=None):
+        '''Find the expected values of every state.  Since most rounds
+        put cards in place, states are updated from the fullest down, so
+        a few passes are enough.'''
+        states = allStates()
+        trans = {state: list(self.transitions(state).items())
+                 for state in states}
+        values = {state: (0.0, 0.0, 0.0) for state in states}
+        order = list(reversed(states))
+        for passNum in range(1, MAX_ROUNDS + 1):
+            change = 0.0
+            for state in order:
+                if state == FINISHED:
+                    continue
+                placed = sum(state)
+                rounds = cards = weighted = 0.0
+                for end, prob in trans[state]:
+                    endRounds, endCards, endWeighted = values[end]
+                    gain = sum(end) - placed
+                    rounds += prob * (1 + endRounds)
+                    cards += prob * (gain + endCards)
+                    # The rounds after the next one are a round later.
+                    weighted += prob * (gain + endWeighted + endCards)
+                change = max(change, abs(rounds - values[state][0]))
+                values[state] = (rounds, cards, weighted)
+            if log is not None:
+                print("pass %d: largest change %.2g" % (passNum, change),
+                      file=log)
+            if change < TOLERANCE:
+                break
+        self._values = values
+
+    def expected(self, state, roundNum, score=0):
+        '''Return (expected rounds left, expected final score) at the end
+        of round roundNum, in the given state, with the given score.'''
+        rounds, cards, weighted = self._values[state]
+        # The cards placed t rounds from now are worth 11 - (roundNum + t)
+        # each.
+        return rounds, score + (11 - roundNum) * cards - weighted
+
+    def project(self, board, roundNum, score=0, roundOver=True):
+        '''Return (expected rounds left, expected final score) of a game
+        with the given board.  If the round is not over, the board is
+        taken to be at the start of the round, so this round is counted
+        and its play is the sampled one.'''
+        state = lockedState(board)
+        if roundOver:
+            return self.expected(state, roundNum, score)
+        rounds = finalScore = 0.0
+        ptsPerCard = 11 - roundNum
+        for end, prob in self.playDistribution(state).items():
+            endRounds, endScore = self.expected(
+                end, roundNum, score + (sum(end) - sum(state)) * ptsPerCard)
+            rounds += prob * (1 + endRounds)
+            finalScore += prob * endScore
+        return rounds, finalScore
+
+    def toDict(self):
+        return {
+            'version': VERSION,
+            'policy': self.policyName,
+            'games': self.numGames,
+            'play': [[list(start), [[list(end), count]
+                                    for end, count in ends.items()]]
+                     for start, ends in self._play.items()],
+            'values': [[list(state), list(value)]
+                       for state, value in self._values.items()],
+        }
+
+    @staticmethod
+    def fromDict(d):
+        if d.get('version') != VERSION:
+            raise ValueError("unknown round model version")
+        play = {tuple(start): {tuple(end): count for end, count in ends}
+                for start, ends in d['play']}
+        res = RoundModel(play, d['policy'], d['games'])
+        res._values = {tuple(state): tuple(value)
+                       for state, value in d['values']}
+        return res
+
+
+def cachePath(policyName, cacheDir=DEFAULT_CACHE_DIR):
+    return os.path.join(cacheDir, "roundmodel-%s.json" % policyName)
+
+
+def dealTables(cacheDir=DEFAULT_CACHE_DIR):
+    '''Return {state: dealDistribution(state)} for every state, from the
+    cache (the same for every policy), computing it if it is not there.'''
+    path = os.path.join(cacheDir, DEAL_CACHE)
+    try:
+        with open(path) as f:
+            data = json.load(f)
+        if data.get('version') == VERSION:
+            return {tuple(state): {tuple(after): prob for after, prob in dist}
+                    for state, dist in data['deals']}
+    except FileNotFoundError:
+        pass
+    deals = {state: dealDistribution(state) for state in allStates()}
+    with open(path, "w") as f:
+        json.dump({'version': VERSION,
+                   'deals': [[list(state), [[list(after), prob]
+                                            for after, prob in dist.items()]]
+                             for state, dist in deals.items()]},
+                  f, separators=(',', ':'))
+    return deals
+
+
+def build(policyName="random", numGames=DEFAULT_GAMES,
+          cacheDir=DEFAULT_CACHE_DIR, log=None):
+    '''Sample the play of the policy, solve the model and cache it.'''
+    play = samplePlay(getPolicy(policyName), numGames)
+    model = RoundModel(play, policyName, numGames, dealTables(cacheDir))
+    model.solve(log)
+    with open(cachePath(policyName, cacheDir), "w") as f:
+        json.dump(model.toDict(), f, separators=(',', ':'))
+    return model
+
+
+def load(policyName="random", cacheDir=DEFAULT_CACHE_DIR,
+         numGames=DEFAULT_GAMES):
+    '''Return the cached model of the policy, building it if there is
+    none.'''
+    try:
+        with open(cachePath(policyName, cacheDir)) as f:
+            return RoundModel.fromDict(json.load(f))
+    except FileNotFoundError:
+        return build(policyName, numGames, cacheDir)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Expected rounds and score from a model of the rounds.")
+    parser.add_argument("--policy", default="random",
+                        help="one of %s (default: %%(default)s)" %
+                        ", ".join(POLICIES))
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    commands = parser.add_subparsers(dest="command", required=True)
+    buildCmd = commands.add_parser("build", help="sample games and solve "
+                                   "the model")
+    buildCmd.add_argument("--games", type=int, default=DEFAULT_GAMES)
+    projectCmd = commands.add_parser("project", help="print the expected "
+                                     "rounds and score of a deal")
+    projectCmd.add_argument("--seed", type=int, required=True)
+    args = parser.parse_args()
+    try:
+        getPolicy(args.policy)
+    except ValueError as e:
+        sys.exit(e)
+
+    if args.command == "build":
+        start = time.perf_counter()
+        build(args.policy, args.games, args.cache_dir, sys.stderr)
+        print("built %s in %.1f s" % (cachePath(args.policy, args.cache_dir),
+                                      time.perf_counter() - start))
+        return
+
+    try:
+        model = load(args.policy, args.cache_dir)
+    except (OSError, ValueError) as e:
+        sys.exit(e)
+    game = Game(args.seed)
+    rounds, score = model.project(game.getBoard(), 1, game.currentScore(),
+                                  roundOver=False)
+    print("seed %d: %s in place after the deal; expect %.1f rounds and a "
+          "score of %.0f" % (args.seed, lockedState(game.getBoard()),
+                             rounds, score))
+
+
+if __name__ == "__main__":
+    main()
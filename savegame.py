@@ -0,0 +1,127 @@
+'''The state of a game in progress as a short string, so the browser
+version can save it in local storage after every move and put it back
+when the page is loaded again.
+
+The string is made of fields separated by "|":
+
+  version, seed, round number, cards placed this round,
+  board: 52 characters, row by row, one per space: CARD_CHARS[ordinal]
+         of the card in it (see Card.getOrdinal()), or "." if it is empty,
+  aces: the removed aces, in the order they were removed,
+  points: the points of each card, by ordinal, separated by commas,
+
+and, if the last move can be undone, the undo state:
+
+  card moved, from row, from col, to row, to col, cards in place and
+  cards placed this round before the move, points before the move.
+'''
+
+from board import Board
+
+VERSION = "1"
+SEPARATOR = "|"
+
+# One character per card ordinal.
+CARD_CHARS = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+EMPTY = "."
+
+NUM_CARDS = len(CARD_CHARS)
+NUM_SPACES = Board.NUM_ROWS * Board.NUM_COLS
+
+
+def _encodeCards(ordinals):
+    return ''.join(EMPTY if o is None else CARD_CHARS[o] for o in ordinals)
+
+
+def _decodeCards(s):
+    res = []
+    for ch in s:
+        if ch == EMPTY:
+            res.append(None)
+        else:
+            idx = CARD_CHARS.find(ch)
+            if idx == -1:
+                raise ValueError("bad card %r" % ch)
+            res.append(idx)
+    return res
+
+
+def _encodePoints(points):
+    return ','.join(str(pts) for pts in points)
+
+
+def _decodePoints(s):
+    points = [int(pts) for pts in s.split(',')]
+    if len(points) != NUM_CARDS:
+        raise ValueError("wrong number of card points")
+    return points
+
+
+class UndoState:
+    '''What is needed to undo the last move.'''
+
+    def __init__(self, card, fromRow, fromCol, toRow, toCol,
+                 numCardsInPlace, numCardsPlacedThisRound, points):
+        self.card = card
+        self.fromRow = fromRow
+        self.fromCol = fromCol
+        self.toRow = toRow
+        self.toCol = toCol
+        self.numCardsInPlace = numCardsInPlace
+        self.numCardsPlacedThisRound = numCardsPlacedThisRound
+        self.points = points
+
+
+class SavedGame:
+    '''A game in progress.  Cards are given by ordinal.
+
+    cells is the board, row by row: the ordinal of the card in each space,
+    or None.  points is the points of each card, by ordinal.  undo is an
+    UndoState or None.
+    '''
+
+    def __init__(self, seed, roundNum, numCardsPlacedThisRound, cells, aces,
+                 points, undo=None):
+        self.seed = seed
+        self.roundNum = roundNum
+        self.numCardsPlacedThisRound = numCardsPlacedThisRound
+        self.cells = cells
+        self.aces = aces
+        self.points = points
+        self.undo = undo
+
+    def toString(self):
+        fields = [VERSION, str(self.seed), str(self.roundNum),
+                  str(self.numCardsPlacedThisRound), _encodeCards(self.cells),
+                  _encodeCards(self.aces), _encodePoints(self.points)]
+        undo = self.undo
+        if undo is not None:
+            fields.extend([CARD_CHARS[undo.card], str(undo.fromRow),
+                           str(undo.fromCol), str(undo.toRow), str(undo.toCol),
+                           str(undo.numCardsInPlace),
+                           str(undo.numCardsPlacedThisRound),
+                           _encodePoints(undo.points)])
+        return SEPARATOR.join(fields)
+
+    @staticmethod
+    def fromString(s):
+        '''Parse a string made by toString().  Raise ValueError if it is
+        not one, e.g., if it was saved by another version of the game.'''
+        fields = s.split(SEPARATOR)
+        if fields[0] != VERSION or len(fields) not in (7, 15):
+            raise ValueError("not a saved game")
+        cells = _decodeCards(fields[4])
+        aces = _decodeCards(fields[5])
+        if len(cells) != NUM_SPACES or \
+                sorted(o for o in cells + aces if o is not None) != \
+                list(range(NUM_CARDS)):
+            raise ValueError("bad board")
+        undo = None
+        if len(fields) == 15:
+            card = CARD_CHARS.find(fields[7])
+            if len(fields[7]) != 1 or card == -1:
+                raise ValueError("bad undo card")
+            undo = UndoState(card, *[int(f) for f in fields[8:14]],
+                             points=_decodePoints(fields[14]))
+        return SavedGame(int(fields[1]), int(fields[2]), int(fields[3]),
+                         cells, aces, _decodePoints(fields[6]), undo)
@@ -0,0 +1,326 @@
+'''A leaderboard of finished games kept in an SQLite database.
+
+Each game is stored with its score, number of rounds, seed, the day it
+was played and a hash of its game log (see gamelog.py), so the same game
+cannot be submitted twice.  Scores are verified by replaying the game
+log: a game is only accepted if it is finished and its replayed score and
+rounds are the ones claimed.
+
+Games are inserted in batches, one transaction per batch, and the top
+scores overall, for a seed or for a day are read through indexes that
+match the queries, so they take about a millisecond however many games
+there are.
+
+    python scoredb.py import games.log submissions.jsonl [--db scores.db]
+    python scoredb.py top [--seed N | --day YYYY-MM-DD] [-k 10]
+    python scoredb.py bench --rows 1000000
+
+import takes game logs (all their games are added, with the scores found
+by replaying them) and JSON Lines files of submissions, one game per line:
+
+    {"seed": 123, "score": 310, "rounds": 7, "moves": "<hex>", "played": 1700000000}
+
+where moves is the game's events in hex (see GameRecord.events) and played
+(optional) is when it was played, in seconds since 1970.
+'''
+
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import sys
+import time
+
+from gamelog import *
+
+DEFAULT_DB = "scores.db"
+BATCH_SIZE = 10000
+DEFAULT_TOP = 10
+
+# SQLite integers are signed 64-bit.
+MAX_DB_SEED = 2 ** 63
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS scores (
+    id INTEGER PRIMARY KEY,
+    score INTEGER NOT NULL,
+    rounds INTEGER NOT NULL,
+    seed INTEGER NOT NULL,
+    day INTEGER NOT NULL,
+    played REAL NOT NULL,
+    log_hash BLOB NOT NULL UNIQUE
+);
+CREATE INDEX IF NOT EXISTS scores_by_score
+    ON scores (score DESC, rounds, played);
+CREATE INDEX IF NOT EXISTS scores_by_seed
+    ON scores (seed, score DESC, rounds, played);
+CREATE INDEX IF NOT EXISTS scores_by_day
+    ON scores (day, score DESC, rounds, played);
+'''
+
+COLUMNS = "score, rounds, seed, day, played"
+ORDER = "ORDER BY score DESC, rounds, played"
+
+
+class ScoreError(ValueError):
+    '''A game that cannot be added to the leaderboard.'''
+
+
+def _checkNumber(name, value, types=(int,)):
+    '''Raise ScoreError unless value is one of the given number types
+    (True and False do not count).'''
+    if not isinstance(value, types) or isinstance(value, bool):
+        raise ScoreError("%s must be %s, not %r" %
+                         (name, "an integer" if types == (int,) else "a number",
+                          value))
+
+
+def dayOf(played):
+    '''Return the day (days since 1970, UTC) of a time in seconds.'''
+    return int(played // 86400)
+
+
+def parseDay(s):
+    '''Convert YYYY-MM-DD to a day number.'''
+    date = datetime.date.fromisoformat(s)
+    return (date - datetime.date(1970, 1, 1)).days
+
+
+def logHash(record):
+    return hashlib.sha256(record.toBytes()).digest()[:16]
+
+
+def verify(record, score=None, rounds=None):
+    '''Replay the game and return its (score, rounds).  Raise ScoreError
+    if it is not finished, has an illegal move, or does not have the
+    given score and rounds.'''
+    try:
+        game = Replay(record).toEnd()
+    except ValueError as e:
+        raise ScoreError("seed %d: %s" % (record.seed, e))
+    if not game.isDone():
+        raise ScoreError("seed %d: the game is not finished" % record.seed)
+    res = (game.currentScore(), game.getRoundNum())
+    if score is not None and res != (score, rounds):
+        raise ScoreError("seed %d: claimed score %d in %d rounds, but it is "
+                         "%d in %d rounds" % ((record.seed, score, rounds) + res))
+    return res
+
+
+class ScoreDB:
+    '''The leaderboard database.'''
+
+    def __init__(self, path=DEFAULT_DB):
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def count(self):
+        return self._conn.execute("SELECT COUNT(*) FROM scores").fetchone()[0]
+
+    def addMany(self, games, verifyScores=True, batchSize=BATCH_SIZE):
+        '''Add (record, score, rounds, played) tuples, where score and
+        rounds may be None to take them from the replay, and played is a
+        time in seconds or None for now.  A ScoreError in place of a
+        tuple (see readSubmissions()) is a game that could not be read.
+        Games already in the database are skipped.  Return (number added,
+        list of ScoreErrors for the games rejected).'''
+        added = 0
+        errors = []
+        batch = []
+        for game in games:
+            if isinstance(game, ScoreError):
+                errors.append(game)
+                continue
+            try:
+                batch.append(self._row(*game, verifyScores))
+            except ScoreError as e:
+                errors.append(e)
+                continue
+            if len(batch) >= batchSize:
+                added += self._insert(batch)
+                batch = []
+        if batch:
+            added += self._insert(batch)
+        return added, errors
+
+    def add(self, record, score=None, rounds=None, played=None):
+        '''Add one game.  Return True iff it was not already there; raise
+        ScoreError if it is rejected.'''
+        added, errors = self.addMany([(record, score, rounds, played)])
+        if errors:
+            raise errors[0]
+        return added == 1
+
+    def top(self, k=DEFAULT_TOP):
+        return self._query("", (), k)
+
+    def topForSeed(self, seed, k=DEFAULT_TOP):
+        return self._query("WHERE seed = ?", (seed,), k)
+
+    def topForDay(self, day, k=DEFAULT_TOP):
+        '''day is a number of days since 1970 (see dayOf()).'''
+        return self._query("WHERE day = ?", (day,), k)
+
+    def _query(self, where, args, k):
+        '''Return the best k games matching where, as dicts.'''
+        rows = self._conn.execute(
+            "SELECT %s FROM scores %s %s LIMIT ?" % (COLUMNS, where, ORDER),
+            args + (k,))
+        names = [name.strip() for name in COLUMNS.split(',')]
+        return [dict(zip(names, row)) for row in rows]
+
+    def _row(self, record, score, rounds, played, verifyScores):
+        _checkNumber("seed", record.seed)
+        if score is not None:
+            _checkNumber("score", score)
+            _checkNumber("rounds", rounds)
+        if played is not None:
+            _checkNumber("played", played, (int, float))
+        if not 0 <= record.seed < MAX_DB_SEED:
+            raise ScoreError("seed %d is too large" % record.seed)
+        if verifyScores or score is None:
+            score, rounds = verify(record, score, rounds)
+        if played is None:
+            played = time.time()
+        return (score, rounds, record.seed, dayOf(played), played,
+                logHash(record))
+
+    def _insert(self, rows):
+        with self._conn:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO scores (%s, log_hash) "
+                "VALUES (?, ?, ?, ?, ?, ?)" % COLUMNS, rows)
+            return self._conn.total_changes - before
+
+
+def readSubmissions(f):
+    '''Yield (record, score, rounds, played) for each line of a JSON Lines
+    file of submissions, or a ScoreError for a line that is not a valid
+    submission, so it is rejected without stopping the import.'''
+    for lineNum, line in enumerate(f, 1):
+        if not line.strip():
+            continue
+        try:
+            sub = json.loads(line)
+            for name in ('seed', 'score', 'rounds'):
+                _checkNumber(name, sub[name])
+            played = sub.get('played')
+            if played is not None:
+                _checkNumber("played", played, (int, float))
+            record = GameRecord(sub['seed'], bytes.fromhex(sub['moves']))
+        except (ValueError, KeyError, TypeError) as e:
+            yield ScoreError("line %d: bad submission: %s" % (lineNum, e))
+            continue
+        yield record, sub['score'], sub['rounds'], played
+
+
+def readGames(path):
+    '''Yield (record, score, rounds, played) for the games in a game log
+    or a submissions file.'''
+    if path.endswith('.jsonl'):
+        with open(path) as f:
+            yield from readSubmissions(f)
+        return
+    played = os.path.getmtime(path)
+    with open(path, "rb") as f:
+        for record in readRecords(f):
+            yield record, None, None, played
+
+
+def printGames(games):
+    for rank, game in enumerate(games, 1):
+        date = datetime.datetime.fromtimestamp(game['played'],
+                                               datetime.timezone.utc)
+        print("%3d. %4d  %2d rounds  seed %-10d %s" %
+              (rank, game['score'], game['rounds'], game['seed'],
+               date.strftime("%Y-%m-%d %H:%M")))
+
+
+def bench(db, numRows, k):
+    '''Add numRows made up games (not verified) and time the queries.'''
+    rng = random.Random(0)
+    now = time.time()
+    start = time.perf_counter()
+    rows = []
+    for i in range(numRows):
+        played = now - rng.random() * 365 * 86400
+        rows.append((rng.randint(150, 480), rng.randint(3, 15),
+                     rng.randrange(100000), dayOf(played), played,
+                     os.urandom(16)))
+        if len(rows) >= BATCH_SIZE:
+            db._insert(rows)
+            rows = []
+    if rows:
+        db._insert(rows)
+    print("inserted %d rows in %.1f s; %d rows in all" %
+          (numRows, time.perf_counter() - start, db.count()))
+
+    queries = [("top", lambda: db.top(k)),
+               ("top for a seed", lambda: db.topForSeed(rng.randrange(100000), k)),
+               ("top for a day", lambda: db.topForDay(dayOf(now) - rng.randrange(365), k))]
+    for name, query in queries:
+        reps = 200
+        start = time.perf_counter()
+        for _ in range(reps):
+            query()
+        print("%-15s %.3f ms" % (name, (time.perf_counter() - start) * 1000 / reps))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="The leaderboard database.")
+    parser.add_argument("--db", default=DEFAULT_DB,
+                        help="database file (default: %(default)s)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    importCmd = commands.add_parser("import", help="add games from game logs "
+                                    "and .jsonl submission files")
+    importCmd.add_argument("files", nargs="+")
+    importCmd.add_argument("--no-verify", action="store_true",
+                           help="trust the claimed scores of submissions")
+    importCmd.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    topCmd = commands.add_parser("top", help="print the top scores")
+    topCmd.add_argument("-k", type=int, default=DEFAULT_TOP)
+    topCmd.add_argument("--seed", type=int)
+    topCmd.add_argument("--day", help="YYYY-MM-DD (UTC)")
+    benchCmd = commands.add_parser("bench", help="add made up games and "
+                                   "time the top-k queries")
+    benchCmd.add_argument("--rows", type=int, default=1000000)
+    benchCmd.add_argument("-k", type=int, default=DEFAULT_TOP)
+    args = parser.parse_args()
+
+    db = ScoreDB(args.db)
+    try:
+        if args.command == "import":
+            for path in args.files:
+                start = time.perf_counter()
+                added, errors = db.addMany(readGames(path),
+                                           not args.no_verify, args.batch_size)
+                for e in errors:
+                    print("%s: rejected: %s" % (path, e), file=sys.stderr)
+                print("%s: added %d games, rejected %d, in %.1f s" %
+                      (path, added, len(errors), time.perf_counter() - start))
+        elif args.command == "top":
+            if args.seed is not None:
+                printGames(db.topForSeed(args.seed, args.k))
+            elif args.day is not None:
+                printGames(db.topForDay(parseDay(args.day), args.k))
+            else:
+                printGames(db.top(args.k))
+        else:
+            bench(db, args.rows, args.k)
+    except (OSError, ValueError) as e:
+        sys.exit(e)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
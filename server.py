@@ -0,0 +1,473 @@
+'''A local game server: plays any number of games at once through an
+HTTP/JSON API, using asyncio and nothing outside the standard library.
+
+    python server.py serve [--port 8080] [--max-sessions 10000]
+
+Endpoints (all bodies are JSON):
+
+  POST /games                 start a game: {"seed": N} (optional), or
+                              {"difficulty": "easy"|"medium"|"hard"|"daily"}
+                              with --deals (see difficulty.py)
+  GET  /games/ID              the state of a game
+  POST /games/ID/move         move a card: {"card": "10S"}
+  POST /games/ID/undo         take back the last move
+  POST /games/ID/next-round   deal the next round, when there are no moves
+  GET  /metrics               request counts and latencies per endpoint
+
+Each game is a session kept in memory.  When there are more than
+--max-sessions of them, the least recently used one is dropped.
+
+    python server.py loadtest [--clients 200] [--games 1000]
+
+starts a server (or uses the one at --port) and plays games against it
+from many concurrent clients, then prints the request rate and the
+server's metrics.
+'''
+
+import argparse
+import asyncio
+import collections
+import json
+import random
+import secrets
+import sys
+import time
+import traceback
+
+from difficulty import DifficultyTable, BUCKET_NAMES
+from game import *
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8080
+MAX_SESSIONS = 10000
+
+# Upper bounds (ms) of the buckets of the latency histograms.  The last
+# bucket holds everything slower.
+LATENCY_BUCKETS = [0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000]
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found",
+           405: "Method Not Allowed", 409: "Conflict",
+           413: "Payload Too Large", 500: "Internal Server Error"}
+MAX_BODY = 4096
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        Exception.__init__(self, message)
+        self.status = status
+
+
+class LatencyStats:
+    '''Counts and a histogram of the latencies of one endpoint.'''
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.totalMs = 0.0
+        self.maxMs = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def add(self, ms, error=False):
+        self.count += 1
+        if error:
+            self.errors += 1
+        self.totalMs += ms
+        self.maxMs = max(self.maxMs, ms)
+        idx = 0
+        while idx < len(LATENCY_BUCKETS) and ms > LATENCY_BUCKETS[idx]:
+            idx += 1
+        self.buckets[idx] += 1
+
+    def percentile(self, p):
+        '''Return the upper bound of the bucket holding the pth
+        percentile (maxMs for the last bucket).'''
+        target = self.count * p / 100
+        total = 0
+        for idx, n in enumerate(self.buckets):
+            total += n
+            if total >= target and n:
+                return LATENCY_BUCKETS[idx] if idx < len(LATENCY_BUCKETS) \
+                    else self.maxMs
+        return 0
+
+    def report(self):
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'meanMs': round(self.totalMs / self.count, 3) if self.count else None,
+            'p50Ms': self.percentile(50),
+            'p99Ms': self.percentile(99),
+            'maxMs': round(self.maxMs, 3),
+            'bucketsMs': LATENCY_BUCKETS,
+            'counts': self.buckets,
+        }
+
+
+class SessionStore:
+    '''The games being played, by id, dropping the least recently used
+    one when there are too many.'''
+
+    def __init__(self, maxSessions=MAX_SESSIONS):
+        self._maxSessions = maxSessions
+        self._games = collections.OrderedDict()
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self._games)
+
+    def add(self, game):
+        '''Store the game and return its new session id.'''
+        sessionId = secrets.token_hex(8)
+        self._games[sessionId] = game
+        if len(self._games) > self._maxSessions:
+            self._games.popitem(last=False)
+            self.evicted += 1
+        return sessionId
+
+    def get(self, sessionId):
+        '''Return the game with the given id, or None.'''
+        game = self._games.get(sessionId)
+        if game is not None:
+            self._games.move_to_end(sessionId)
+        return game
+
+
+def cardName(card):
+    return str(card).strip()
+
+
+def gameState(sessionId, game):
+    '''Return the state of the game as a dict, to send as JSON.'''
+    board = game.getBoard()
+    rows = []
+    for row in range(Board.NUM_ROWS):
+        rows.append([None if card is None else cardName(card)
+                     for card in (board.getCardAt(row, col)
+                                  for col in range(Board.NUM_COLS))])
+    res = game.result()
+    res.update({
+        'id': sessionId,
+        'ptsPerCard': game.getPtsPerCard(),
+        'board': rows,
+        'movable': [cardName(card) for card, row, col in game.playableCards()],
+        'roundOver': game.isRoundOver(),
+        'canUndo': game.canUndo(),
+    })
+    return res
+
+
+class GameServer:
+    '''Routes the API's requests to the games in a SessionStore.'''
+
+    def __init__(self, maxSessions=MAX_SESSIONS, deals=None):
+        self._sessions = SessionStore(maxSessions)
+        # The DifficultyTable to pick seeds from, if any.
+        self._deals = deals
+        self._stats = collections.defaultdict(LatencyStats)
+        self._started = time.time()
+        # What POST /games/ID/<action> does.
+        self._actions = {
+            'move': self._move,
+            'undo': self._undo,
+            'next-round': self._nextRound,
+        }
+
+    def handle(self, method, path, body):
+        '''Handle one request.  Return (endpoint name, status, response
+        dict).'''
+        parts = path.strip('/').split('/')
+        if parts == ['games']:
+            endpoint = "POST /games"
+            self._checkMethod(method, "POST")
+            return endpoint, 200, self._newGame(body)
+        if parts == ['metrics']:
+            self._checkMethod(method, "GET")
+            return "GET /metrics", 200, self.metrics()
+        if len(parts) == 2 and parts[0] == 'games':
+            self._checkMethod(method, "GET")
+            return "GET /games/ID", 200, gameState(parts[1],
+                                                   self._getGame(parts[1]))
+        if len(parts) == 3 and parts[0] == 'games' and \
+                parts[2] in self._actions:
+            action = self._actions[parts[2]]
+            self._checkMethod(method, "POST")
+            game = self._getGame(parts[1])
+            action(game, body)
+            return "POST /games/ID/" + parts[2], 200, gameState(parts[1], game)
+        raise HttpError(404, "no such endpoint")
+
+    def record(self, endpoint, ms, error):
+        self._stats[endpoint].add(ms, error)
+
+    def metrics(self):
+        return {
+            'uptimeS': round(time.time() - self._started, 1),
+            'sessions': len(self._sessions),
+            'evicted': self._sessions.evicted,
+            'endpoints': {name: stats.report()
+                          for name, stats in sorted(self._stats.items())},
+        }
+
+    def _checkMethod(self, method, expected):
+        if method != expected:
+            raise HttpError(405, "use " + expected)
+
+    def _getGame(self, sessionId):
+        game = self._sessions.get(sessionId)
+        if game is None:
+            raise HttpError(404, "no such game")
+        return game
+
+    def _newGame(self, body):
+        seed = body.get('seed')
+        difficulty = body.get('difficulty')
+        if difficulty is not None:
+            if self._deals is None:
+                raise HttpError(400, "no difficulty table: see --deals")
+            if difficulty != "daily" and difficulty not in BUCKET_NAMES:
+                raise HttpError(400, "unknown difficulty")
+            try:
+                seed = self._deals.daily() if difficulty == "daily" \
+                    else self._deals.pick(difficulty)
+            except IndexError as e:
+                raise HttpError(404, str(e))
+        elif seed is not None and (not isinstance(seed, int) or
+                                 not 0 <= seed < 2 ** 64):
+            raise HttpError(400, "seed must be an integer from 0 to 2**64-1")
+        game = Game(seed)
+        return gameState(self._sessions.add(game), game)
+
+    def _move(self, game, body):
+        name = body.get('card')
+        card = game.findCard(name) if isinstance(name, str) else None
+        if card is None:
+            raise HttpError(400, "no such card on the board")
+        if game.moveCard(card) is None:
+            raise HttpError(409, "cannot move that card")
+
+    def _undo(self, game, body):
+        if not game.undo():
+            raise HttpError(409, "no move to undo")
+
+    def _nextRound(self, game, body):
+        if not game.isRoundOver():
+            raise HttpError(409, "the round is not over")
+        game.nextRound()
+
+    async def serveClient(self, reader, writer):
+        '''Handle the requests on one connection (kept alive until the
+        client closes it).'''
+        try:
+            while True:
+                request = await readRequest(reader)
+                if request is None:
+                    break
+                method, path, headers, rawBody = request
+                start = time.perf_counter()
+                endpoint = "other"
+                try:
+                    try:
+                        body = json.loads(rawBody) if rawBody else {}
+                    except ValueError:
+                        raise HttpError(400, "bad JSON")
+                    if not isinstance(body, dict):
+                        raise HttpError(400, "the body must be a JSON object")
+                    endpoint, status, res = self.handle(method, path, body)
+                except HttpError as e:
+                    status, res = e.status, {'error': str(e)}
+                except Exception:
+                    # A bug in a handler: answer, and keep serving.
+                    traceback.print_exc()
+                    status, res = 500, {'error': REASONS[500]}
+                writeResponse(writer, status, res)
+                self.record(endpoint, (time.perf_counter() - start) * 1000,
+                            status != 200)
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except HttpError as e:
+            writeResponse(writer, e.status, {'error': str(e)})
+        finally:
+            writer.close()
+
+
+async def readRequest(reader):
+    '''Read one HTTP request.  Return (method, path, headers, body), or
+    None if the connection was closed.'''
+    line = await reader.readline()
+    if not line:
+        return None
+    try:
+        method, path, version = line.decode('latin-1').split()
+    except ValueError:
+        raise HttpError(400, "bad request line")
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get('content-length', 0))
+    except ValueError:
+        raise HttpError(400, "bad Content-Length")
+    if length > MAX_BODY:
+        raise HttpError(413, "body too large")
+    body = await reader.readexactly(length) if length else b''
+    return method, path, headers, body
+
+
+def writeResponse(writer, status, res):
+    body = json.dumps(res, separators=(',', ':')).encode()
+    writer.write(("HTTP/1.1 %d %s\r\nContent-Type: application/json\r\n"
+                  "Content-Length: %d\r\n\r\n"
+                  % (status, REASONS[status], len(body))).encode() + body)
+
+
+async def serve(host, port, maxSessions, deals):
+    server = GameServer(maxSessions, deals)
+    tcpServer = await asyncio.start_server(server.serveClient, host, port,
+                                           backlog=1024)
+    print("Serving on http://%s:%d/" % (host, port))
+    async with tcpServer:
+        await tcpServer.serve_forever()
+
+
+# ----------------------------- load test -----------------------------
+
+
+class Client:
+    '''One keep-alive connection to the server.'''
+
+    def __init__(self, host, port):
+        self._host = host
+        self._port = port
+        self._reader = None
+        self._writer = None
+
+    async def request(self, method, path, body=None):
+        '''Send a request, and return (status, response dict).'''
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.open_connection(
+                self._host, self._port)
+        data = b'' if body is None else json.dumps(body).encode()
+        self._writer.write(("%s %s HTTP/1.1\r\nHost: %s\r\n"
+                            "Content-Length: %d\r\n\r\n"
+                            % (method, path, self._host, len(data))).encode()
+                           + data)
+        status = int((await self._reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await self._reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            if name.lower() == 'content-length':
+                length = int(value)
+        return status, json.loads(await self._reader.readexactly(length))
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+async def playGames(client, numGames, rng, counts):
+    '''Play games to the end with random moves, through the API.'''
+    for _ in range(numGames):
+        status, state = await client.request("POST", "/games",
+                                             {'seed': rng.randrange(MAX_SEED)})
+        path = "/games/" + state['id']
+        counts['requests'] += 1
+        while not state['done']:
+            if state['roundOver']:
+                status, state = await client.request("POST",
+                                                     path + "/next-round")
+            else:
+                status, state = await client.request(
+                    "POST", path + "/move",
+                    {'card': rng.choice(state['movable'])})
+            counts['requests'] += 1
+            if status != 200:
+                counts['errors'] += 1
+                break
+        counts['games'] += 1
+
+
+async def loadTest(host, port, numClients, numGames, startServer):
+    tcpServer = None
+    if startServer:
+        server = GameServer()
+        tcpServer = await asyncio.start_server(server.serveClient, host, port,
+                                               backlog=1024)
+    counts = collections.Counter()
+    clients = [Client(host, port) for _ in range(numClients)]
+    gamesPerClient = [numGames // numClients +
+                      (1 if i < numGames % numClients else 0)
+                      for i in range(numClients)]
+    start = time.perf_counter()
+    await asyncio.gather(*[playGames(client, n, random.Random(i), counts)
+                           for i, (client, n) in
+                           enumerate(zip(clients, gamesPerClient))])
+    elapsed = time.perf_counter() - start
+    status, metrics = await clients[0].request("GET", "/metrics")
+    for client in clients:
+        client.close()
+    if tcpServer is not None:
+        # Let the server see the connections close before it stops.
+        await asyncio.sleep(0.1)
+        tcpServer.close()
+        await tcpServer.wait_closed()
+
+    print("%d games, %d requests (%d errors) in %.2f s: %.0f requests/s" %
+          (counts['games'], counts['requests'], counts['errors'], elapsed,
+           counts['requests'] / elapsed))
+    print("%-28s %8s %8s %8s %8s %8s" %
+          ("server latency", "count", "mean ms", "p50 ms", "p99 ms", "max ms"))
+    for name, stats in metrics['endpoints'].items():
+        print("%-28s %8d %8.3f %8g %8g %8.3f" %
+              (name, stats['count'], stats['meanMs'], stats['p50Ms'],
+               stats['p99Ms'], stats['maxMs']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve games over HTTP, or "
+                                     "load test the server.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    commands = parser.add_subparsers(dest="command", required=True)
+    serveCmd = commands.add_parser("serve", help="run the server")
+    serveCmd.add_argument("--max-sessions", type=int, default=MAX_SESSIONS,
+                          help="games kept before the least recently used "
+                          "is dropped (default: %(default)s)")
+    serveCmd.add_argument("--deals", metavar="FILE",
+                          help="difficulty table to pick the seeds of new "
+                          "games from (see difficulty.py)")
+    loadCmd = commands.add_parser("loadtest", help="play games against "
+                                  "a server")
+    loadCmd.add_argument("--clients", type=int, default=200,
+                         help="concurrent connections (default: %(default)s)")
+    loadCmd.add_argument("--games", type=int, default=1000,
+                         help="games to play in all (default: %(default)s)")
+    loadCmd.add_argument("--external", action="store_true",
+                         help="use the server already running at --port "
+                         "instead of starting one")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "serve":
+            deals = None if args.deals is None else DifficultyTable(args.deals)
+            asyncio.run(serve(args.host, args.port, args.max_sessions, deals))
+        else:
+            asyncio.run(loadTest(args.host, args.port, args.clients,
+                                 args.games, not args.external))
+    except KeyboardInterrupt:
+        pass
+    except (OSError, ValueError) as e:
+        sys.exit(e)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Sound effects for the browser version of the game.
+
+All the effects are packed into one audio sprite by "python build.py sprite".
+The sprite is downloaded and decoded once into a Web Audio buffer (the first
+of its files in the map that the browser can decode), and each
+call to play() starts a new one-shot source on that buffer, so sounds can
+overlap instead of cutting each other off.
+"""
+
+import json
+
+from browser import window
+
+SPRITE_DIR = "sounds/"
+SPRITE_MAP = SPRITE_DIR + "sprite.json"
+
+
+class SoundBoard:
+    """Plays the named sounds in the audio sprite.  Nothing is played until
+    the sprite has been decoded, and play() silently does nothing in browsers
+    without Web Audio."""
+
+    def __init__(self, mapUrl=SPRITE_MAP):
+        self._mapUrl = mapUrl
+        self._buffer = None
+        # sound name -> (offset, duration) in seconds within the sprite.
+        self._sprites = {}
+        self._loading = False
+        self._onLoaded = None
+        # Sprite files still to try, best first.
+        self._srcs = []
+
+        audioContext = getattr(window, "AudioContext", None) or getattr(
+            window, "webkitAudioContext", None
+        )
+        self._ctx = audioContext.new() if audioContext else None
+
+    def isLoaded(self):
+        return self._buffer is not None
+
+    def load(self, done=None):
+        """Fetch the sprite map, then the sprite, and decode it; call done()
+        when finished, whether or not it worked.  Safe to call more than
+        once: only the first call does anything."""
+        if self._ctx is None or self._loading:
+            if done is not None:
+                done()
+            return
+        self._loading = True
+        self._onLoaded = done
+        window.fetch(self._mapUrl).then(lambda resp: resp.text()).then(
+            self._onMapLoaded
+        ).catch(self._onError)
+
+    def _onMapLoaded(self, text):
+        spriteMap = json.loads(text)
+        for name, (offset, duration) in spriteMap["sprites"].items():
+            self._sprites[name] = (offset, duration)
+        self._srcs = list(spriteMap["src"])
+        self._fetchNext()
+
+    def _fetchNext(self, err=None):
+        """Fetch and decode the next sprite file, or give up if none is
+        left."""
+        if not self._srcs:
+            self._onError(err)
+            return
+        src = self._srcs.pop(0)
+        window.fetch(SPRITE_DIR + src).then(
+            lambda resp: resp.arrayBuffer()
+        ).then(self._decode).catch(self._fetchNext)
+
+    def _decode(self, data):
+        # Use the callback form: older Safari does not return a promise.
+        self._ctx.decodeAudioData(data, self._onDecoded, self._fetchNext)
+
+    def _onDecoded(self, buffer):
+        self._buffer = buffer
+        self._finished()
+
+    def _onError(self, err):
+        print("could not load sounds:", err)
+        self._loading = False
+        self._finished()
+
+    def _finished(self):
+        if self._onLoaded is not None:
+            self._onLoaded()
+            self._onLoaded = None
+
+    def play(self, name):
+        """Start playing the named sound right away."""
+        if self._buffer is None or name not in self._sprites:
+            return
+        # Browsers start the context suspended until there is a user gesture,
+        # and we are always called because of one.
+        if self._ctx.state == "suspended":
+            self._ctx.resume()
+        offset, duration = self._sprites[name]
+        source = self._ctx.createBufferSource()
+        source.buffer = self._buffer
+        source.connect(self._ctx.destination)
+        source.start(0, offset, duration)
@@ -0,0 +1,417 @@
+'''Statistics of simulated games that take the same memory however many
+games are added, and that can be merged, so worker processes can each
+keep their own and send them to be combined.
+
+    Moments         count, mean, variance, min and max (Welford's method;
+                    merged with Chan et al.'s formula)
+    Histogram       counts in fixed-width buckets, plus under and over
+    QuantileSketch  quantiles to within a relative error (a DDSketch:
+                    logarithmic buckets, the lowest merged together when
+                    there are too many)
+
+A Metric keeps all three for one number, and GameStats a Metric for each
+of rounds to complete, final score, cards placed per round and moves per
+round.  Everything has toDict() / fromDict(), so a snapshot can be taken
+(and saved as JSON) at any time.
+
+    python stats.py sweep --games 1000000 [--policy random] [--out stats.json]
+
+plays games in worker processes and merges their stats, rewriting the
+snapshot file every few seconds while it runs.
+'''
+
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+from game import *
+from policy import MAX_ROUNDS, POLICIES, getPolicy, playGame
+
+# Relative error of the quantiles.
+DEFAULT_ACCURACY = 0.01
+# Most buckets a QuantileSketch keeps.
+DEFAULT_MAX_BUCKETS = 512
+# Games played by each task given to the worker processes.
+CHUNK_SIZE = 200
+# Seconds between rewrites of the snapshot file.
+SNAPSHOT_INTERVAL = 5.0
+QUANTILES = [0.5, 0.9, 0.99]
+
+
+class Moments:
+    '''Count, mean, variance, min and max of the numbers added.'''
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        # Sum of squared differences from the mean.
+        self._m2 = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, x):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (x - self.mean)
+        if self.min is None or x < self.min:
+            self.min = x
+        if self.max is None or x > self.max:
+            self.max = x
+
+    def merge(self, other):
+        '''Add in the numbers added to other.'''
+        if other.count == 0:
+            return
+        if self.count == 0:
+            self.count, self.mean, self._m2 = other.count, other.mean, other._m2
+            self.min, self.max = other.min, other.max
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self._m2 += other._m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def variance(self):
+        '''Return the sample variance (0 for fewer than 2 numbers).'''
+        return self._m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    def stddev(self):
+        return math.sqrt(self.variance())
+
+    def toDict(self):
+        return {'count': self.count, 'mean': self.mean, 'm2': self._m2,
+                'min': self.min, 'max': self.max}
+
+    @staticmethod
+    def fromDict(d):
+        res = Moments()
+        res.count, res.mean, res._m2 = d['count'], d['mean'], d['m2']
+        res.min, res.max = d['min'], d['max']
+        return res
+
+
+class Histogram:
+    '''Counts of the numbers added in numBuckets buckets of the given
+    width from lo, and of those below lo and at or above the last one.'''
+
+    def __init__(self, lo, width, numBuckets):
+        self.lo = lo
+        self.width = width
+        self.counts = [0] * numBuckets
+        self.under = 0
+        self.over = 0
+
+    def add(self, x, count=1):
+        idx = int((x - self.lo) // self.width)
+        if idx < 0:
+            self.under += count
+        elif idx >= len(self.counts):
+            self.over += count
+        else:
+            self.counts[idx] += count
+
+    def merge(self, other):
+        if (other.lo, other.width, len(other.counts)) != \
+                (self.lo, self.width, len(self.counts)):
+            raise ValueError("cannot merge histograms with different buckets")
+        for idx, count in enumerate(other.counts):
+            self.counts[idx] += count
+        self.under += other.under
+        self.over += other.over
+
+    def buckets(self):
+        '''Return (low end, count) for each bucket that is not empty.'''
+        return [(self.lo + idx * self.width, count)
+                for idx, count in enumerate(self.counts) if count]
+
+    def toDict(self):
+        return {'lo': self.lo, 'width': self.width, 'counts': self.counts,
+                'under': self.under, 'over': self.over}
+
+    @staticmethod
+    def fromDict(d):
+        res = Histogram(d['lo'], d['width'], len(d['counts']))
+        res.counts = list(d['counts'])
+        res.under, res.over = d['under'], d['over']
+        return res
+
+
+class QuantileSketch:
+    '''Quantiles of the numbers added, each within the relative accuracy
+    of the true value, in at most maxBuckets buckets for the positive
+    numbers and as many for the negative ones.  If there are more, the
+    buckets nearest 0 are merged, so only the quantiles near 0 lose
+    accuracy.'''
+
+    def __init__(self, accuracy=DEFAULT_ACCURACY, maxBuckets=DEFAULT_MAX_BUCKETS):
+        self.accuracy = accuracy
+        self.maxBuckets = maxBuckets
+        self._gamma = (1 + accuracy) / (1 - accuracy)
+        self._logGamma = math.log(self._gamma)
+        # Bucket key -> count, for x > 0 and for -x with x < 0.  Bucket k
+        # holds (gamma**(k-1), gamma**k].
+        self._positive = {}
+        self._negative = {}
+        self.zeros = 0
+        self.count = 0
+
+    def add(self, x, count=1):
+        self.count += count
+        if x == 0:
+            self.zeros += count
+            return
+        buckets = self._positive if x > 0 else self._negative
+        key = math.ceil(math.log(abs(x)) / self._logGamma)
+        buckets[key] = buckets.get(key, 0) + count
+        if len(buckets) > self.maxBuckets:
+            self._collapse(buckets)
+
+    def _collapse(self, buckets):
+        keys = sorted(buckets)
+        extra = keys[:len(keys) - self.maxBuckets + 1]
+        total = sum(buckets.pop(key) for key in extra)
+        buckets[extra[-1]] = total
+
+    def merge(self, other):
+        if other.accuracy != self.accuracy:
+            raise ValueError("cannot merge sketches of different accuracy")
+        for buckets, otherBuckets in ((self._positive, other._positive),
+                                      (self._negative, other._negative)):
+            for key, count in otherBuckets.items():
+                buckets[key] = buckets.get(key, 0) + count
+            while len(buckets) > self.maxBuckets:
+                self._collapse(buckets)
+        self.zeros += other.zeros
+        self.count += other.count
+
+    def _value(self, key):
+        '''Return the middle of bucket key, within the accuracy of any
+        number in it.'''
+        return 2 * self._gamma ** key / (self._gamma + 1)
+
+    def quantile(self, q):
+        '''Return the q quantile (0 <= q <= 1), or None if nothing has been
+        added.'''
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for key in sorted(self._negative, reverse=True):
+            seen += self._negative[key]
+            if rank < seen:
+                return -self._value(key)
+        seen += self.zeros
+        if rank < seen:
+            return 0.0
+        for key in sorted(self._positive):
+            seen += self._positive[key]
+            if rank < seen:
+                return self._value(key)
+        return self._value(max(self._positive))
+
+    def toDict(self):
+        return {'accuracy': self.accuracy, 'maxBuckets': self.maxBuckets,
+                'zeros': self.zeros,
+                'positive': sorted(self._positive.items()),
+                'negative': sorted(self._negative.items())}
+
+    @staticmethod
+    def fromDict(d):
+        res = QuantileSketch(d['accuracy'], d['maxBuckets'])
+        res.zeros = d['zeros']
+        res._positive = {key: count for key, count in d['positive']}
+        res._negative = {key: count for key, count in d['negative']}
+        res.count = res.zeros + sum(res._positive.values()) + \
+            sum(res._negative.values())
+        return res
+
+
+class Metric:
+    '''Moments, a Histogram and a QuantileSketch of one number.'''
+
+    def __init__(self, lo, width, numBuckets):
+        self.moments = Moments()
+        self.histogram = Histogram(lo, width, numBuckets)
+        self.sketch = QuantileSketch()
+
+    def add(self, x):
+        self.moments.add(x)
+        self.histogram.add(x)
+        self.sketch.add(x)
+
+    def merge(self, other):
+        self.moments.merge(other.moments)
+        self.histogram.merge(other.histogram)
+        self.sketch.merge(other.sketch)
+
+    def summary(self):
+        '''Return the main numbers as a dict.'''
+        res = {'count': self.moments.count,
+               'mean': round(self.moments.mean, 3),
+               'stddev': round(self.moments.stddev(), 3),
+               'min': self.moments.min,
+               'max': self.moments.max}
+        for q in QUANTILES:
+            value = self.sketch.quantile(q)
+            res['p%d' % round(q * 100)] = None if value is None else round(value, 2)
+        return res
+
+    def toDict(self):
+        return {'moments': self.moments.toDict(),
+                'histogram': self.histogram.toDict(),
+                'sketch': self.sketch.toDict()}
+
+    @staticmethod
+    def fromDict(d):
+        res = Metric.__new__(Metric)
+        res.moments = Moments.fromDict(d['moments'])
+        res.histogram = Histogram.fromDict(d['histogram'])
+        res.sketch = QuantileSketch.fromDict(d['sketch'])
+        return res
+
+
+class GameStats:
+    '''The Metrics of the games played, by name.'''
+
+    def __init__(self):
+        self.games = 0
+        self.finished = 0
+        # lo, width and number of the histogram buckets of each metric.
+        self.metrics = {
+            'rounds': Metric(1, 1, MAX_ROUNDS),
+            # Cards are worth less than 0 after round 11: see getPtsPerCard().
+            'score': Metric(-100, 10, 70),
+            # Moving a 2 out of column 0 can take cards out of place.
+            'placedPerRound': Metric(-NUM_CARDS, 1, 2 * NUM_CARDS),
+            'movesPerRound': Metric(0, 5, 60),
+        }
+        self._placed = 0
+
+    def onRoundEnd(self, game):
+        '''Add the cards placed and the moves made in the round just
+        played: pass this to policy.playGame().'''
+        placed = game.countCardsInPlace()
+        self.metrics['placedPerRound'].add(placed - self._placed)
+        self.metrics['movesPerRound'].add(game.getNumMovesThisRound())
+        self._placed = placed
+
+    def addGame(self, game):
+        '''Add a game once it is over.'''
+        self.games += 1
+        self._placed = 0
+        if game.isDone():
+            self.finished += 1
+            self.metrics['rounds'].add(game.getRoundNum())
+        self.metrics['score'].add(game.currentScore())
+
+    def merge(self, other):
+        self.games += other.games
+        self.finished += other.finished
+        for name, metric in other.metrics.items():
+            self.metrics[name].merge(metric)
+
+    def summary(self):
+        res = {'games': self.games, 'finished': self.finished}
+        for name, metric in self.metrics.items():
+            res[name] = metric.summary()
+        return res
+
+    def toDict(self):
+        return {'games': self.games, 'finished': self.finished,
+                'metrics': {name: metric.toDict()
+                            for name, metric in self.metrics.items()}}
+
+    @staticmethod
+    def fromDict(d):
+        res = GameStats()
+        res.games, res.finished = d['games'], d['finished']
+        for name, metric in d['metrics'].items():
+            res.metrics[name] = Metric.fromDict(metric)
+        return res
+
+
+def playGames(firstSeed, numGames, policy, stats=None):
+    '''Play games with the given policy, adding them to stats (a new
+    GameStats by default).  Return the stats.'''
+    if stats is None:
+        stats = GameStats()
+    for seed in range(firstSeed, firstSeed + numGames):
+        game = Game(seed)
+        playGame(game, policy, random.Random(seed), onRoundEnd=stats.onRoundEnd)
+        stats.addGame(game)
+    return stats
+
+
+def _playChunk(args):
+    firstSeed, numGames, policyName = args
+    return playGames(firstSeed, numGames, getPolicy(policyName)).toDict()
+
+
+def writeSnapshot(path, stats):
+    '''Write the summary and the full stats to path, replacing it in one
+    step so a reader never sees half a file.'''
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({'summary': stats.summary(), 'stats': stats.toDict()}, f)
+        f.write("\n")
+    os.replace(tmp, path)
+
+
+def sweep(firstSeed, numGames, policyName, out=None, workers=None,
+          log=sys.stderr):
+    '''Play the games in worker processes and return their merged
+    GameStats, writing a snapshot to out every SNAPSHOT_INTERVAL s.'''
+    chunks = [(seed, min(CHUNK_SIZE, firstSeed + numGames - seed), policyName)
+              for seed in range(firstSeed, firstSeed + numGames, CHUNK_SIZE)]
+    stats = GameStats()
+    start = lastSnapshot = time.perf_counter()
+    with multiprocessing.Pool(workers) as pool:
+        for partial in pool.imap_unordered(_playChunk, chunks):
+            stats.merge(GameStats.fromDict(partial))
+            now = time.perf_counter()
+            if now - lastSnapshot >= SNAPSHOT_INTERVAL:
+                lastSnapshot = now
+                if out is not None:
+                    writeSnapshot(out, stats)
+                if log is not None:
+                    print("%d games, %.0f games/s" %
+                          (stats.games, stats.games / (now - start)), file=log)
+    if out is not None:
+        writeSnapshot(out, stats)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Statistics of simulated games.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    sweepCmd = commands.add_parser("sweep", help="play games and sum them up")
+    sweepCmd.add_argument("--games", type=int, default=10000)
+    sweepCmd.add_argument("--first-seed", type=int, default=0)
+    sweepCmd.add_argument("--policy", default="random",
+                          help="one of %s (default: %%(default)s)" %
+                          ", ".join(POLICIES))
+    sweepCmd.add_argument("--workers", type=int,
+                          help="processes (default: one per CPU)")
+    sweepCmd.add_argument("--out", help="JSON snapshot file, rewritten as "
+                          "the games are played")
+    args = parser.parse_args()
+    try:
+        getPolicy(args.policy)
+    except ValueError as e:
+        sys.exit(e)
+    stats = sweep(args.first_seed, args.games, args.policy, args.out,
+                  args.workers)
+    print(json.dumps(stats.summary(), indent=1))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+// Service worker for the deployed game: precaches everything the game
+// loads, so repeat visits come from the cache and the game works offline.
+//
+// This is a template: "python build.py bundle" replaces the placeholder
+// below with the precache manifest and writes the result to dist/sw.js.
+// All the assets except the pages have content hashes in their names, so
+// they are served from the cache without asking the network.
+
+const MANIFEST = __PRECACHE_MANIFEST__;
+const CACHE_PREFIX = "frustration-solitaire-";
+const CACHE = CACHE_PREFIX + MANIFEST.version;
+
+self.addEventListener("install", (event) => {
+  event.waitUntil(
+    caches.open(CACHE)
+      .then((cache) => cache.addAll(MANIFEST.urls))
+      .then(() => self.skipWaiting())
+  );
+});
+
+self.addEventListener("activate", (event) => {
+  // Drop the caches of older builds.
+  event.waitUntil(
+    caches.keys()
+      .then((names) => Promise.all(
+        names.filter((name) => name.startsWith(CACHE_PREFIX) && name !== CACHE)
+          .map((name) => caches.delete(name))
+      ))
+      .then(() => self.clients.claim())
+  );
+});
+
+self.addEventListener("fetch", (event) => {
+  const request = event.request;
+  if (request.method !== "GET") {
+    return;
+  }
+  if (request.mode === "navigate") {
+    // Pages: the network first, so a new build is picked up right away,
+    // and the cached copy when offline.  "?debug" is still the same page.
+    event.respondWith(
+      fetch(request).catch(() =>
+        caches.match(request, { ignoreSearch: true })
+          .then((res) => res || caches.match("index.html")))
+    );
+    return;
+  }
+  event.respondWith(
+    caches.match(request).then((res) => res || fetch(request))
+  );
+});
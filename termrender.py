@@ -0,0 +1,146 @@
+'''Draw a Board in a terminal, for watching games being played by the
+text version of the game.
+
+The renderer keeps the last frame it drew and only rewrites the cards
+that changed since then, moving the cursor to each one with ANSI escape
+sequences, so a move costs a few dozen bytes of output instead of the
+whole board.  Like the browser version, movable cards are highlighted in
+yellow and the cards in place in cyan.  With an fps cap, frames that come
+faster than that are skipped (the board is only looked at when a frame is
+actually drawn), so thousands of moves per second can be watched over a
+slow connection.
+'''
+
+import sys
+import time
+
+from board import *
+
+CSI = "\x1b["
+RESET = CSI + "0m"
+RED = CSI + "31m"
+MOVABLE = CSI + "30;43m"      # black on yellow
+IN_PLACE = CSI + "30;46m"     # black on cyan
+
+CLEAR_SCREEN = CSI + "2J"
+HIDE_CURSOR = CSI + "?25l"
+SHOW_CURSOR = CSI + "?25h"
+CLEAR_LINE = CSI + "K"
+
+# Width of a card on the screen, including the space after it.
+CELL_WIDTH = 4
+EMPTY_CELL = " " * CELL_WIDTH
+
+# The status line goes below the board, after a blank line.
+STATUS_LINE = Board.NUM_ROWS + 2
+
+
+def moveTo(line, column):
+    '''Return the escape sequence that moves the cursor to the given
+    line and column (both starting at 1).'''
+    return "%s%d;%dH" % (CSI, line, column)
+
+
+class TermRenderer:
+    '''Draws boards on a terminal.  Call draw() with the board after each
+    move, and close() when done, to draw the last frame and give the
+    terminal back.
+    '''
+
+    def __init__(self, out=sys.stdout, fps=None):
+        self._out = out
+        self._minInterval = 1.0 / fps if fps else 0
+        self._lastDrawTime = None
+        # The cells and status line on the screen: None until the first
+        # frame is drawn.
+        self._cells = None
+        self._status = None
+        # What to draw when the fps cap skipped the last call to draw().
+        self._pending = None
+
+    def draw(self, board, movable=None, inPlace=None, status=''):
+        '''Draw the board, unless the last frame was drawn too recently.
+        movable and inPlace are lists of (card, row, col) tuples to
+        highlight; by default they are found from the board.  Return True
+        iff the frame was drawn.'''
+        self._pending = (board, movable, inPlace, status)
+        now = time.monotonic()
+        if self._lastDrawTime is not None and \
+                now - self._lastDrawTime < self._minInterval:
+            return False
+        self._lastDrawTime = now
+        self.flush()
+        return True
+
+    def flush(self):
+        '''Draw the frame skipped by the fps cap, if any.'''
+        if self._pending is None:
+            return
+        board, movable, inPlace, status = self._pending
+        self._pending = None
+        self._out.write(self._update(self._frame(board, movable, inPlace),
+                                     status))
+        self._out.flush()
+
+    def close(self):
+        '''Draw the last frame and leave the cursor below the board.'''
+        self.flush()
+        if self._cells is not None:
+            self._out.write(moveTo(STATUS_LINE + 1, 1) + SHOW_CURSOR)
+            self._out.flush()
+
+    def _frame(self, board, movable, inPlace):
+        '''Return the text of each cell of the board, row by row.'''
+        if movable is None:
+            movable = board.findPlayableCards()
+        if inPlace is None:
+            inPlace = board.getCardsInPlace()
+        styles = {}
+        for card, row, col in movable:
+            styles[row, col] = MOVABLE
+        for card, row, col in inPlace:
+            styles[row, col] = IN_PLACE
+
+        cells = []
+        for row in range(Board.NUM_ROWS):
+            for col in range(Board.NUM_COLS):
+                card = board.getCardAt(row, col)
+                if card is None:
+                    cells.append(EMPTY_CELL)
+                    continue
+                style = styles.get((row, col))
+                if style is None and card.getSuit() in 'HD':
+                    style = RED
+                if style is None:
+                    cells.append(str(card) + " ")
+                else:
+                    cells.append(style + str(card) + RESET + " ")
+        return cells
+
+    def _update(self, cells, status):
+        '''Return the output that changes the screen to show the given
+        cells and status line.'''
+        if self._cells is None:
+            # First frame: start from a blank screen.
+            self._cells = [None] * len(cells)
+            out = [HIDE_CURSOR, CLEAR_SCREEN]
+        else:
+            out = []
+
+        # Where the cursor is after the last cell written, so that runs of
+        # changed cells in a row need only one cursor move.
+        cursor = None
+        for idx, cell in enumerate(cells):
+            if cell == self._cells[idx]:
+                continue
+            self._cells[idx] = cell
+            row, col = divmod(idx, Board.NUM_COLS)
+            if cursor != idx:
+                out.append(moveTo(row + 1, col * CELL_WIDTH + 1))
+            out.append(cell)
+            cursor = idx + 1 if col < Board.NUM_COLS - 1 else None
+
+        if status != self._status:
+            self._status = status
+            out.append(moveTo(STATUS_LINE, 1) + status + CLEAR_LINE)
+        return ''.join(out)